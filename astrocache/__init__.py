@@ -1,20 +1,296 @@
 import ast
+import asyncio
 import builtins
 import functools
 import hashlib
+import importlib
 import inspect
+import itertools
+import linecache
 import os
-import pickle
-import shutil
+import pkgutil
 import tempfile
 import textwrap
+import threading
+import time
+import tokenize
+import types
+import warnings
+import weakref
 
-from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Callable, NamedTuple, Optional
 
+from . import arguments, compression, expiry, hashing, manifest
+from .eviction import Evictor, Limit, parse_size
+from .hashing import register_hasher, value_hash
+from .instrumentation import CallStats, FunctionStats, Histogram, Stats, stats
+from .instrumentation import record as record_stats, set_hook as set_stats_hook
+from .locking import KeyLocks
+from .manifest import Manifest
+from .memory import MemoryCache
+from .remote import HTTPStorage, TieredStorage
+from .serializers import OutOfBandPickleSerializer, PickleSerializer, Serializer, get_serializer
+from .storage import Entry, FilesystemStorage, Key, SQLiteStorage, Storage, Usage
+from .watching import FileWatcher
+
 CACHE_DIR = os.environ.get('ASTROCACHE_DIR', Path(tempfile.gettempdir()) / 'astrocache')
 REFRESH = os.environ.get('ASTROCACHE_REFRESH')
+STORAGE = os.environ.get('ASTROCACHE_STORAGE', 'filesystem')
+MAX_BYTES = parse_size(os.environ.get('ASTROCACHE_MAX_BYTES'))
+MAX_ENTRIES = parse_size(os.environ.get('ASTROCACHE_MAX_ENTRIES'))
+EVICTION = os.environ.get('ASTROCACHE_EVICTION', 'lru')
+MANIFEST = os.environ.get('ASTROCACHE_MANIFEST')
+REMOTE = os.environ.get('ASTROCACHE_REMOTE')
+
+# Default Storage instances, keyed by (STORAGE, CACHE_DIR)
+_storages = {}
+_evictor = Evictor(on_delete=lambda storage, key: _forget_memory(storage, key=key))
+_limited_storages = set()
+# Cached functions by name, as decorated most recently
+_registry = {}
+# _Options each cached function was decorated with, by name
+_registry_options = {}
+# Locks held by single-flight calls while they compute an entry
+_key_locks = KeyLocks()
+# In-memory tiers of functions decorated with memory=True
+_memory_caches = weakref.WeakSet()
+# Precomputed fingerprints, if a manifest is loaded
+_manifest = None
+if MANIFEST:
+    try:
+        _manifest = Manifest.load(MANIFEST,
+                                  check_files=bool(os.environ.get('ASTROCACHE_MANIFEST_CHECK')))
+    except (OSError, ValueError) as e:
+        warnings.warn(f"Ignoring ASTROCACHE_MANIFEST {MANIFEST!r}: {e}")
+# Watches the source files of memoized fingerprints, once watch() is called
+_watcher = None
+
+
+def _file_state(filename):
+    """Returns a cheap token describing the current state of a source file, or
+    None if it cannot be stat'ed."""
+    try:
+        st = os.stat(filename)
+    except (OSError, TypeError, ValueError):
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _binding_token(obj):
+    """Returns the part of a resolved callable that identifies its
+    implementation: the code object of the function it decorates, if it has
+    one, else the object itself."""
+    return getattr(_unwrap(obj), '__code__', obj)
+
+
+class _Binding(NamedTuple):
+    """A call site that was resolved while fingerprinting. The caller is
+    referenced weakly (see _weak()), so that memoized fingerprints do not keep
+    functions alive."""
+    caller: Callable
+    node: ast.Call
+    token: object
+
+
+def _weak(func: Callable):
+    """Returns a weak reference to `func`, or to the bound method `func`."""
+    if isinstance(func, types.MethodType):
+        return weakref.WeakMethod(func)
+    return weakref.ref(func)
+
+
+class _Dependencies:
+    """Collects the source files and call bindings a fingerprint depends on, so
+    that it can be reused until one of them changes. The dependencies of
+    callees that were fingerprinted on their own are referenced in
+    `children` rather than copied."""
+
+    def __init__(self):
+        self.files = {}
+        self.bindings = []
+        self.children = []
+
+    def add_file(self, filename):
+        if isinstance(filename, Path) and filename not in self.files:
+            self.files[filename] = _file_state(filename)
+
+    def add_binding(self, caller: Callable, node: ast.Call, obj):
+        self.bindings.append(_Binding(_weak(caller), node, _binding_token(obj)))
+
+    def update(self, other: '_Dependencies'):
+        self.files.update(other.files)
+        self.bindings.extend(other.bindings)
+        self.children.extend(other.children)
+
+    def is_current(self, checked: Optional[set] = None):
+        """Returns True if no source file has changed and every call site still
+        resolves to the same implementation, here or in any child. Provide
+        `checked` to share the set of dependencies already found current
+        between calls."""
+        seen = set()
+        pending = [self]
+        while pending:
+            deps = pending.pop()
+            if id(deps) in seen or (checked is not None and id(deps) in checked):
+                continue
+            watched = _watcher.files if _watcher is not None else {}
+            for filename, state in deps.files.items():
+                # Watched files are known to be unchanged until reported
+                if watched.get(filename, False) != state and _file_state(filename) != state:
+                    return False
+            for caller, node, token in deps.bindings:
+                caller = caller()
+                if caller is None:
+                    return False
+                try:
+                    if _binding_token(Function._resolve_call(caller, node)) != token:
+                        return False
+                except Exception:
+                    return False
+            seen.add(id(deps))
+            pending.extend(deps.children)
+        if checked is not None:
+            checked.update(seen)
+        return True
+
+
+class _Node(NamedTuple):
+    """A function in the call graph of a fingerprint."""
+    name: str
+    filename: Optional[Path]
+    digest: Optional[str]
+    # Memo keys (see _memo_key()) of the functions it calls, within the root
+    callees: frozenset
+
+
+class _Fingerprint(NamedTuple):
+    value: str
+    deps: _Dependencies
+    # Memo keys of the functions in the same strongly connected component
+    component: frozenset
+    node: Optional[_Node] = None
+
+
+# Memoized implementation fingerprints, by function (see _memo_key()) and then
+# by (root, strict). Functions are referenced weakly, so that the fingerprints
+# of functions that are gone, e.g. after their module was reloaded, go too.
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+def _unwrap(func: Callable):
+    """Returns the function decorated by `func`, following `__wrapped__` as
+    inspect.unwrap() does, so that the source of the decorated function is
+    fingerprinted rather than the decorator's. Bound methods stay bound."""
+    try:
+        if isinstance(func, types.MethodType) and hasattr(func.__func__, '__wrapped__'):
+            return types.MethodType(inspect.unwrap(func.__func__), func.__self__)
+        return inspect.unwrap(func)
+    except ValueError:
+        # A cycle of __wrapped__
+        return func
+
+
+def _memo_key(func: Callable) -> weakref.ref:
+    """Returns the key fingerprints of `func` are memoized by: a weak reference
+    to the function itself, or to the function of a bound method. Not its code
+    object, which is shared by every function a decorator wraps, e.g. with
+    functools.wraps."""
+    return weakref.ref(getattr(func, '__func__', func))
+
+
+def _memo(key: weakref.ref, root: str, strict: bool) -> Optional['_Fingerprint']:
+    """Returns the memoized _Fingerprint for the memo key `key`, or None."""
+    func = key()
+    memos = _fingerprints.get(func) if func is not None else None
+    return memos.get((root, strict)) if memos else None
+
+
+def _default_root(func: Callable, root: Optional[str]) -> str:
+    """Returns `root`, or the directory of the source of `func` if None."""
+    if root is not None:
+        return root
+    return os.path.dirname(_unwrap(func).__code__.co_filename)
+
+
+def _ast_digest(node: ast.AST):
+    return hashlib.md5(ast.dump(node).encode()).hexdigest()
+
+
+class _IndexedFunction(NamedTuple):
+    """A function definition found in a parsed source file."""
+    source: str
+    ast: ast.Module
+    digest: str
+
+
+class _IndexedFile(NamedTuple):
+    state: tuple
+    functions: dict
+
+
+class _SourceIndex:
+    """Process-wide index of parsed source files. Each file is parsed once and
+    its function definitions are mapped by (filename, first line number) to
+    their AST and its digest. A file is re-parsed when its mtime or size
+    changes."""
+
+    def __init__(self):
+        self._files = {}
+
+    def lookup(self, filename: Path, code):
+        """Returns the _IndexedFunction for the given code object, or None if
+        it cannot be found in the index (e.g. lambdas, or files not on disk)."""
+        indexed = self._get_file(filename)
+        if indexed is None:
+            return None
+        func = indexed.functions.get(code.co_firstlineno)
+        if func is None or func.ast.body[0].name != code.co_name:
+            return None
+        return func
+
+    def invalidate(self, filename: Optional[Path] = None):
+        """Drops `filename`, or every file if not provided, from the index."""
+        if filename is None:
+            self._files.clear()
+        else:
+            self._files.pop(Path(filename), None)
+
+    def _get_file(self, filename: Path):
+        state = _file_state(filename)
+        if state is None:
+            self._files.pop(filename, None)
+            return None
+        indexed = self._files.get(filename)
+        if indexed is None or indexed.state != state:
+            indexed = self._parse(filename, state)
+            self._files[filename] = indexed
+        return indexed
+
+    @staticmethod
+    def _parse(filename: Path, state):
+        functions = {}
+        try:
+            with tokenize.open(filename) as f:
+                lines = f.readlines()
+            tree = ast.parse(''.join(lines), filename=str(filename))
+        except (OSError, SyntaxError, ValueError):
+            return _IndexedFile(state, functions)
+        for node in ast.walk(tree):
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            # co_firstlineno points at the first decorator, if there are any
+            first = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            module = ast.Module(body=[node], type_ignores=[])
+            functions[first] = _IndexedFunction(
+                source=textwrap.dedent(''.join(lines[first - 1:node.end_lineno])),
+                ast=module,
+                digest=_ast_digest(module))
+        return _IndexedFile(state, functions)
+
+
+_source_index = _SourceIndex()
 
 
 class Function(NamedTuple):
@@ -25,34 +301,43 @@ class Function(NamedTuple):
     ast: Optional[ast.AST]
     module_name: Optional[str]
     filename: Optional[Path]
+    digest: Optional[str] = None
 
     @classmethod
     def from_func(cls, func: Callable, strict: bool = False):
+        func = _unwrap(func)
+        indexed = None
         if hasattr(builtins, func.__name__):
             filename = '<builtin>'
             src = None
         else:
             try:
                 filename = Path(func.__code__.co_filename)
-                src = textwrap.dedent(inspect.getsource(func))
+                indexed = _source_index.lookup(filename, func.__code__)
+                src = indexed.source if indexed else textwrap.dedent(inspect.getsource(func))
             except:
                 if not strict:
                     filename = '<unknown>'
                     src = None
                 else:
                     raise ValueError(f"Unable to find source for function {func.__module__}.{func.__name__}")
-        node = ast.parse(src, filename=filename) if src else None
+        if indexed:
+            node, digest = indexed.ast, indexed.digest
+        else:
+            node = ast.parse(src, filename=filename) if src else None
+            digest = _ast_digest(node) if node else None
         return cls(function=func,
                    name=func.__name__,
                    source=src,
                    ast=node,
                    module_name=func.__module__,
-                   filename=filename)
+                   filename=filename,
+                   digest=digest)
 
-    @classmethod
-    def from_call(cls, caller, node: ast.Call, strict: bool = False):
-        """Given the provided ast.Call `node` within Function `caller`, return
-        the called function as a Function or None"""
+    @staticmethod
+    def _resolve_call(caller: Callable, node: ast.Call):
+        """Given the provided ast.Call `node` within callable `caller`, return
+        the called object or None"""
         func = None
         func_obj = node.func
         # Normal function call?
@@ -61,18 +346,29 @@ class Function(NamedTuple):
             if hasattr(builtins, func_name):
                 func = getattr(builtins, func_name)
             else:
-                func = caller.function.__globals__.get(func_name)
+                func = caller.__globals__.get(func_name)
         # Method call?
         elif type(func_obj) == ast.Attribute:
             if type(func_obj.value) == ast.Name:
                 parent_name = func_obj.value.id
                 func_name = func_obj.attr
                 if parent_name == 'self':
-                    parent = caller.function.__self__
+                    parent = caller.__self__
                 else:
-                    parent = caller.function.__globals__.get(parent_name)
+                    parent = caller.__globals__.get(parent_name)
                 if parent:
                     func = getattr(parent, func_name)
+        return func
+
+    @classmethod
+    def from_call(cls, caller, node: ast.Call, strict: bool = False,
+                  deps: Optional[_Dependencies] = None):
+        """Given the provided ast.Call `node` within Function `caller`, return
+        the called function as a Function or None. If `deps` is provided, the
+        resolved call site is recorded in it."""
+        func = cls._resolve_call(caller.function, node)
+        if deps is not None:
+            deps.add_binding(caller.function, node, func)
         if func:
             return Function.from_func(func, strict=strict)
         elif strict:
@@ -81,58 +377,140 @@ class Function(NamedTuple):
             return None
 
     def fingerprint(self, root: Optional[str] = None, strict: bool = False):
-        """Return the implementation fingerprint for this Function. Provide
-        `root` to limit the depth of introspection to a particular directory."""
+        """Return the implementation fingerprint for this Function: a digest
+        covering its own AST and, recursively, those of the functions it calls.
+        Provide `root` to limit the depth of introspection to a particular
+        directory."""
         if root is None:
             root = os.path.dirname(self.filename)
+        return _CallGraph(root, strict).digest(self)
 
-        def _get_func_defs(func: Function, node: ast.AST):
-            defs = {}
-            if node is None or not func.filename.is_relative_to(root):
-                return defs
-            def_hash = hashlib.md5(ast.dump(func.ast).encode()).hexdigest()
-            defs[f'{func.module_name}.{func.name}'] = def_hash
-            # Recurse into child nodes.
-            for child_node in ast.iter_child_nodes(node):
-                # To recurse into a call; we must find the called function
-                if type(child_node) == ast.Call:
-                    called_func = Function.from_call(func, child_node, strict=strict)
-                    if called_func:
-                        defs.update(_get_func_defs(called_func, called_func.ast))
-                    elif strict:
-                        raise ValueError(f"Unable to find function from {ast.dump(node)}")
-                else:
-                    defs.update(_get_func_defs(func, child_node))
-            return defs
+    def __hash__(self):
+        return hash(self.fingerprint(strict=True))
 
-        defs = _get_func_defs(self, self.ast)
-        parts = sorted((k,v) for k,v in defs.items())
-        return parts
 
-    def __hash__(self):
-        return self.fingerprint(strict=True)
+class _CallGraph:
+    """Walks the call graph reachable from a function within `root`, visiting
+    each function once, and computes a Merkle-style digest for each: a
+    function's digest covers its own AST and the digests of its callees.
+    Mutually recursive functions (strongly connected components, found with
+    Tarjan's algorithm) share a component digest covering all of their ASTs.
+
+    Digests are memoized in `_fingerprints` per function, and memoized digests
+    of callees are reused instead of walking them again while they are still
+    current."""
+
+    def __init__(self, root: str, strict: bool = False):
+        self.root = root
+        self.strict = strict
+        self.index = {}
+        self.lowlink = {}
+        self.stack = []
+        self.on_stack = set()
+        self.functions = {}
+        self.deps = {}
+        self.callees = {}
+        self.finished = {}
+        self.checked = set()
+
+    def digest(self, entry: Function):
+        """Returns the digest of `entry`, or None if it is out of scope."""
+        if not self._in_scope(entry):
+            return None
+        memo = self._reusable(entry)
+        if memo is not None:
+            return memo.value
+        work = [self._visit(entry)]
+        while work:
+            key, callees = work[-1]
+            for callee in callees:
+                if not self._in_scope(callee):
+                    continue
+                callee_key = _memo_key(callee.function)
+                self.callees[key].add(callee_key)
+                if callee_key in self.finished:
+                    continue
+                if callee_key in self.index:
+                    self.lowlink[key] = min(self.lowlink[key], self.index[callee_key])
+                    continue
+                memo = self._reusable(callee)
+                if memo is not None:
+                    self.finished[callee_key] = memo
+                    continue
+                work.append(self._visit(callee))
+                break
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    self.lowlink[parent] = min(self.lowlink[parent], self.lowlink[key])
+                if self.lowlink[key] == self.index[key]:
+                    self._finish_component(key)
+        return self.finished[_memo_key(entry.function)].value
+
+    def _in_scope(self, func: Function):
+        return func.ast is not None and func.filename.is_relative_to(self.root)
+
+    def _reusable(self, func: Function):
+        """Returns the memoized _Fingerprint of `func` if it is current and
+        does not belong to a component that is still being walked."""
+        memo = _memo(_memo_key(func.function), self.root, self.strict)
+        if (memo is None or not memo.component.isdisjoint(self.on_stack)
+                or not memo.deps.is_current(self.checked)):
+            return None
+        return memo
+
+    def _visit(self, func: Function):
+        key = _memo_key(func.function)
+        self.index[key] = self.lowlink[key] = len(self.index)
+        self.stack.append(key)
+        self.on_stack.add(key)
+        self.functions[key] = func
+        self.deps[key] = _Dependencies()
+        self.deps[key].add_file(func.filename)
+        self.callees[key] = set()
+        return key, self._iter_callees(func, self.deps[key])
+
+    def _iter_callees(self, func: Function, deps: _Dependencies):
+        # To recurse into a call; we must find the called function
+        for node in ast.walk(func.ast):
+            if type(node) == ast.Call:
+                called_func = Function.from_call(func, node, strict=self.strict, deps=deps)
+                if called_func:
+                    yield called_func
+                elif self.strict:
+                    raise ValueError(f"Unable to find function from {ast.dump(node)}")
+
+    def _finish_component(self, key):
+        members = []
+        while not members or members[-1] != key:
+            members.append(self.stack.pop())
+            self.on_stack.discard(members[-1])
+        component = frozenset(members)
+        deps = _Dependencies()
+        callees = set()
+        for member in members:
+            deps.update(self.deps[member])
+            callees |= self.callees[member]
+        callees -= component
+        deps.children.extend(self.finished[c].deps for c in callees)
+        names = {m: f'{self.functions[m].module_name}.{self.functions[m].name}' for m in members}
+        component_digest = _make_hash(sorted((names[m], self.functions[m].digest) for m in members),
+                                      sorted(self.finished[c].value for c in callees))
+        for member in members:
+            node = _Node(names[member], self.functions[member].filename,
+                         self.functions[member].digest, frozenset(self.callees[member]))
+            memo = _Fingerprint(_make_hash(names[member], component_digest), deps, component, node)
+            self.finished[member] = memo
+            _fingerprints.setdefault(member(), {})[(self.root, self.strict)] = memo
+        if _watcher is not None:
+            _watcher.watch(deps.files)
 
 
 def _value_hash(obj, strict: bool = False):
     """Returns a deterministic hash representing the value of obj if possible;
     otherwise returns None, or if `strict` then raises an exception."""
-    # Support deterministic hashes for functions as args!
-    if isinstance(obj, Callable):
-        return Function.from_func(obj, strict=strict).fingerprint()
-    # Do not use __hash__ if it was inherited from `object`
-    elif type(obj).__hash__ != object.__hash__:
-        try:
-            return hash(obj)
-        except Exception as e:
-            if strict:
-                raise ValueError(f"Unable to hash {type(obj)} {obj}: {e}")
-            else:
-                return None
-    else:
-        if strict:
-            raise ValueError(f"Unable to hash {type(obj)} {obj}: {e}")
-        else:
-            return None
+    return value_hash(obj, strict=strict)
 
 
 def _make_hash(*parts):
@@ -140,59 +518,685 @@ def _make_hash(*parts):
 
 
 def _func_fingerprint(func: Callable, root: Optional[str] = None, strict: bool = False):
+    """Returns the implementation fingerprint of `func`: the one in the loaded
+    manifest if there is one, or else a previously computed one if none of the
+    source files or call sites it depends on have changed since."""
+    if _manifest is not None:
+        fingerprint = _manifest.lookup(func, root, strict)
+        if fingerprint is not None:
+            return fingerprint
+    func = _unwrap(func)
+    if getattr(func, '__code__', None) is not None:
+        memo = _memo(_memo_key(func), _default_root(func, root), strict)
+        if memo is not None and memo.deps.is_current():
+            return memo.value
     return Function.from_func(func, strict=strict).fingerprint(root=root, strict=strict)
 
 
+# Functions passed as arguments are hashed by their implementation fingerprint
+hashing.fingerprint_function = _func_fingerprint
+
+
+def refresh_fingerprints():
+    """Discards all memoized implementation fingerprints, forcing them to be
+    recomputed from source on next use."""
+    _fingerprints.clear()
+    _source_index.invalidate()
+    linecache.clearcache()
+
+
+def _dependency_files(deps: _Dependencies):
+    """Returns the source files `deps` and its children depend on."""
+    files = set()
+    seen = set()
+    pending = [deps]
+    while pending:
+        deps = pending.pop()
+        if id(deps) not in seen:
+            seen.add(id(deps))
+            files.update(deps.files)
+            pending.extend(deps.children)
+    return files
+
+
+def _source_fingerprint(func: Callable, root: Optional[str], strict: bool):
+    """Returns the fingerprint of `func` computed from source, even if it is in
+    a loaded manifest, along with its memoized _Fingerprint if any."""
+    func = _unwrap(func)
+    fingerprint = Function.from_func(func, strict=strict).fingerprint(root=root, strict=strict)
+    return fingerprint, _memo(_memo_key(func), _default_root(func, root), strict)
+
+
+def _call_graph(memo: _Fingerprint, root: str, strict: bool):
+    """Returns the _Nodes reachable from the memoized fingerprint `memo`, by
+    name. Only the memoized fingerprints are walked, which are current right
+    after the fingerprint of `memo` has been computed."""
+    graph = {}
+    seen = set()
+    pending = [memo]
+    while pending:
+        memo = pending.pop()
+        if memo is None or memo.node is None or id(memo) in seen:
+            continue
+        seen.add(id(memo))
+        graph.setdefault(memo.node.name, memo.node)
+        pending.extend(_memo(callee, root, strict) for callee in memo.node.callees)
+    return graph
+
+
+def _callee_names(node: _Node, root: str, strict: bool):
+    names = set()
+    for callee in node.callees:
+        memo = _memo(callee, root, strict)
+        if memo is not None and memo.node is not None:
+            names.add(memo.node.name)
+    return names
+
+
+def load_manifest(path, check_files: bool = False):
+    """Loads the manifest of precomputed fingerprints at `path` (see
+    build_manifest()), replacing any loaded before. Cached functions found in
+    it are no longer inspected. If `check_files`, a function's fingerprint is
+    only used if the source files it depends on have the same size and mtime
+    as when the manifest was built. Pass None to unload the manifest."""
+    global _manifest
+    _manifest = None if path is None else Manifest.load(path, check_files=check_files)
+    return _manifest
+
+
+def build_manifest(modules, path=None) -> Manifest:
+    """Imports each of `modules` (names of packages or modules), along with the
+    submodules of packages, and writes the fingerprints of the cached
+    functions they define to a manifest at `path`. Defaults to
+    astrocache-manifest.json in the directory of the first package, so that
+    it is shipped along with it. Returns the Manifest."""
+    names = []
+    for name in modules:
+        module = importlib.import_module(name)
+        names.append(module.__name__)
+        if hasattr(module, '__path__'):
+            for info in pkgutil.walk_packages(module.__path__, module.__name__ + '.'):
+                importlib.import_module(info.name)
+        if path is None:
+            path = Path(module.__file__).parent / manifest.FILENAME
+    path = Path(path)
+    built = Manifest(path.parent)
+    for function, wrapper in sorted(_registry.items()):
+        if not any(function.startswith(name + '.') for name in names):
+            continue
+        root, strict, _ = _registry_options[function]
+        func = wrapper.__wrapped__
+        fingerprint, memo = _source_fingerprint(func, root, strict)
+        if fingerprint is None:
+            continue
+        built.add(function, str(fingerprint), root, strict,
+                  _dependency_files(memo.deps) if memo else ())
+        if memo is not None:
+            graph_root = _default_root(func, root)
+            for node in _call_graph(memo, graph_root, strict).values():
+                built.add_node(node.name, node.filename, node.digest,
+                               _callee_names(node, graph_root, strict))
+    built.save(path)
+    return built
+
+
+class Invalidation(NamedTuple):
+    """A cached function whose entries a source change invalidates."""
+    function: str
+    # The fingerprint in the manifest, and the current one (None if the
+    # function cannot be found any more)
+    fingerprint: str
+    current: Optional[str]
+    # The entries stored under the old fingerprint
+    entries: int
+    bytes: int
+    # The changed source files it depends on, and the functions in its call
+    # graph that were added, removed or changed, if the manifest has one
+    files: list
+    changed: list
+
+
+def diff(old, storage: Optional[Storage] = None,
+         import_modules: bool = True) -> list:
+    """Returns an Invalidation for each cached function in the manifest `old`
+    (a Manifest or the path of one, see build_manifest()) whose fingerprint
+    differs from that of its current source, e.g. to find out before a deploy
+    which caches will be recomputed.
+
+    Only functions depending on source files whose size or mtime changed since
+    the manifest was built are fingerprinted again; the others are known to be
+    unchanged. If `import_modules`, the modules defining them are imported
+    first. The entries are counted in `storage`, by default the default
+    storage."""
+    if not isinstance(old, Manifest):
+        old = Manifest.load(old)
+    storage = storage or _default_storage()
+    changed_files = old.changed_files()
+    invalidations = []
+    for function, entry in sorted(old.affected(changed_files).items()):
+        wrapper = _registered(function, import_modules=import_modules)
+        current, graph = None, {}
+        if wrapper is not None:
+            root, strict, _ = _registry_options[function]
+            func = wrapper.__wrapped__
+            try:
+                current, memo = _source_fingerprint(func, root, strict)
+            except Exception:
+                memo = None
+            if current is not None:
+                current = str(current)
+            if current == entry.fingerprint:
+                continue
+            if memo is not None:
+                graph = _call_graph(memo, _default_root(func, root), strict)
+        before = old.reachable(function)
+        changed = sorted(name for name in before.keys() | graph.keys()
+                         if name not in before or name not in graph
+                         or before[name].digest != graph[name].digest) if before else []
+        entries = size = 0
+        for stored in storage.entries(function):
+            if stored.key.fingerprint == entry.fingerprint:
+                entries += 1
+                size += stored.size
+        invalidations.append(Invalidation(function, entry.fingerprint, current, entries, size,
+                                          sorted(changed_files.keys() & entry.files), changed))
+    return invalidations
+
+
+def _discard_fingerprints(paths):
+    """Discards the memoized fingerprints depending on any of `paths`, and the
+    parsed source of those files. Called by the watcher when they change."""
+    for path in paths:
+        _source_index.invalidate(path)
+        linecache.checkcache(str(path))
+    # Dependencies known not to depend on any of `paths`
+    unaffected = set()
+    for func, memos in list(_fingerprints.items()):
+        for options, memo in list(memos.items()):
+            if _depends_on(memo, paths, unaffected):
+                del memos[options]
+        if not memos:
+            _fingerprints.pop(func, None)
+
+
+def _depends_on(memo: '_Fingerprint', paths, unaffected: set) -> bool:
+    """Returns True if `memo` depends on any of `paths`. Adds the ids of the
+    dependencies found not to depend on them to `unaffected`."""
+    seen = set()
+    pending = [memo.deps]
+    while pending:
+        deps = pending.pop()
+        if id(deps) in seen or id(deps) in unaffected:
+            continue
+        if not paths.isdisjoint(deps.files):
+            return True
+        seen.add(id(deps))
+        pending.extend(deps.children)
+    unaffected |= seen
+    return False
+
+
+def watch(interval: float = 1.0, backend: str = 'auto') -> FileWatcher:
+    """Watches the source files that memoized fingerprints depend on, and
+    discards the fingerprints as soon as one of their files changes. Until
+    then, calls no longer check whether those files have changed, which makes
+    them cheaper for functions with large call graphs. Useful in notebooks
+    and other long-running processes whose source is edited.
+
+    Files are watched with inotify where available (`backend` 'auto' or
+    'inotify'), or polled every `interval` seconds ('polling'). Returns the
+    FileWatcher, which is started once per process."""
+    global _watcher
+    if _watcher is None:
+        _watcher = FileWatcher(_discard_fingerprints, interval=interval, backend=backend)
+        for memos in list(_fingerprints.values()):
+            for memo in list(memos.values()):
+                _watcher.watch(memo.deps.files)
+    return _watcher
+
+
+def stop_watching():
+    """Stops the watcher started by watch(); files are checked on every call
+    again."""
+    global _watcher
+    watcher, _watcher = _watcher, None
+    if watcher is not None:
+        watcher.stop()
+
+
 def _arg_fingerprint(args: list, kwargs: dict, strict: bool = False):
     return [
         *[_value_hash(x, strict=strict) for x in args],
-        *[(k, _value_hash(v)) for k,v in kwargs.items()],
+        *[(k, _value_hash(v, strict=strict)) for k,v in kwargs.items()],
     ]
 
 
-@contextmanager
-def _atomic_writer(path, mode='w'):
-    """Yields temp file and moves it to specified path on context exit. Creates
-    destination directory if it doesn't already exist."""
-    if 'a' in mode:
-        raise ValueError('Cannot append atomically')
-    parent = os.path.dirname(path)
-    os.makedirs(parent, exist_ok=True)
-    f = tempfile.NamedTemporaryFile(mode=mode, dir=parent, delete=False)
-    try:
+class _ArgumentKey:
+    """Reduces the arguments of a call of `func` to what its cache key covers.
+    Arguments are bound to the signature of `func`, with defaults applied, so
+    that positional and keyword forms of a call have the same key, and the
+    parameters named in `ignore` are left out. If `key` is given, it is called
+    with the arguments instead, and its result alone is hashed."""
+
+    def __init__(self, func: Callable, ignore=(), key: Optional[Callable] = None):
+        if ignore and key is not None:
+            raise ValueError("Pass either ignore or key")
         try:
-            yield f
-        finally:
-            f.close()
-        os.rename(f.name, path)
-    except Exception:
-        os.remove(f.name)
-        raise
+            self.signature = inspect.signature(func)
+        except (TypeError, ValueError):
+            self.signature = None
+        self.ignore = frozenset([ignore] if isinstance(ignore, str) else ignore)
+        unknown = self.ignore - set(self.signature.parameters if self.signature else ())
+        if unknown:
+            raise ValueError(f"Cannot ignore {sorted(unknown)}: not parameters of "
+                             f"{_function_name(func)}")
+        self.key = key
+
+    def fingerprint(self, args: list, kwargs: dict, strict: bool = False):
+        if self.key is not None:
+            return [_value_hash(self.key(*args, **kwargs), strict=strict)]
+        if self.signature is None:
+            return _arg_fingerprint(args, kwargs, strict=strict)
+        try:
+            bound = self.signature.bind(*args, **kwargs)
+        except TypeError:
+            # The call itself will fail; key it as given
+            return _arg_fingerprint(args, kwargs, strict=strict)
+        bound.apply_defaults()
+        return [(name, _value_hash(value, strict=strict))
+                for name, value in bound.arguments.items() if name not in self.ignore]
+
+
+# _ArgumentKey of each function, by the undecorated function
+_argument_keys = weakref.WeakKeyDictionary()
+
+
+def _argument_key(func: Callable) -> _ArgumentKey:
+    try:
+        return _argument_keys[func]
+    except KeyError:
+        pass
+    except TypeError:
+        # Not weakly referenceable, e.g. a builtin
+        return _ArgumentKey(func)
+    argument_key = _argument_keys[func] = _ArgumentKey(func)
+    return argument_key
+
+
+def _default_storage():
+    """Returns the Storage selected by ASTROCACHE_STORAGE for CACHE_DIR, in
+    front of the shared ASTROCACHE_REMOTE tier if it is set."""
+    key = (STORAGE, str(CACHE_DIR), REMOTE)
+    if key not in _storages:
+        if STORAGE == 'filesystem':
+            storage = FilesystemStorage(CACHE_DIR)
+        elif STORAGE == 'sqlite':
+            storage = SQLiteStorage(Path(CACHE_DIR) / 'cache.sqlite')
+        else:
+            raise ValueError(f"Unknown ASTROCACHE_STORAGE {STORAGE!r}; "
+                             "expected 'filesystem' or 'sqlite'")
+        if REMOTE:
+            remote = (HTTPStorage(REMOTE) if REMOTE.startswith(('http://', 'https://'))
+                      else FilesystemStorage(REMOTE))
+            storage = TieredStorage(storage, remote)
+        _storages[key] = storage
+    return _storages[key]
+
+
+def _forget_memory(storage: Optional[Storage] = None, function: Optional[str] = None,
+                   fingerprint: Optional[str] = None, key: Optional[Key] = None):
+    """Drops values held in memory for entries removed from `storage`."""
+    for memory in list(_memory_caches):
+        if key is not None:
+            memory.discard(storage, key)
+        else:
+            memory.invalidate(storage, function, fingerprint)
+
+
+def _use_storage(storage: Storage):
+    """Applies the global size limit to `storage` the first time it is used."""
+    if id(storage) not in _limited_storages:
+        _limited_storages.add(id(storage))
+        _evictor.add_limit(storage, Limit(MAX_BYTES, MAX_ENTRIES, EVICTION))
+    return storage
+
 
+def evict():
+    """Enforces every size limit now, instead of waiting for the background
+    evictor. Returns the number of entries evicted."""
+    return _evictor.run()
 
-def _write_cache(path, data):
-    with _atomic_writer(path, 'wb') as f:
-        pickle.dump(data, f)
-    return data
+
+def _registered(function: str, import_modules: bool = False):
+    """Returns the cached function named `function` if it has been decorated in
+    this process. If `import_modules`, first tries to import the module it
+    was defined in."""
+    if function not in _registry and import_modules:
+        parts = function.split('.')
+        for i in range(len(parts) - 1, 0, -1):
+            module = '.'.join(parts[:i])
+            if module == '__main__':
+                break
+            try:
+                importlib.import_module(module)
+                break
+            except ImportError:
+                continue
+    return _registry.get(function)
 
 
-def _read_cache(path):
-    with open(path, 'rb') as f:
-        return pickle.load(f)
+def gc(storage: Optional[Storage] = None, remove_unknown: bool = False,
+       import_modules: bool = False):
+    """Removes entries produced by outdated implementations of cached
+    functions, i.e. whose fingerprint no longer matches the current source.
+    Only entry metadata is read.
+
+    Entries of functions that have not been decorated in this process cannot be
+    checked. If `import_modules`, the modules defining them are imported to
+    decorate them; otherwise, or if that fails, they are kept unless
+    `remove_unknown` is True. Stored data that no entry refers to any more is
+    removed too. Returns the number of entries removed."""
+    storage = storage or _default_storage()
+    current = {}
+    removed = 0
+    for function, fingerprint in list(storage.fingerprints()):
+        if function not in current:
+            wrapper = _registered(function, import_modules=import_modules)
+            try:
+                current[function] = wrapper.fingerprint() if wrapper else None
+            except Exception:
+                # The current implementation cannot be fingerprinted (e.g. a
+                # strict function whose source is gone); leave it alone.
+                current[function] = fingerprint
+        if current[function] is None and not remove_unknown:
+            continue
+        if fingerprint != current[function]:
+            removed += storage.invalidate(function, fingerprint)
+            _forget_memory(storage, function, fingerprint)
+    storage.flush()
+    storage.sweep()
+    return removed
 
 
-def clear_cache():
-    if os.path.isdir(CACHE_DIR):
-        shutil.rmtree(CACHE_DIR)
+class _Options(NamedTuple):
+    """The arguments of cache() that invalidate() needs to find entries."""
+    root: Optional[str]
+    strict: bool
+    storage: Optional[Storage]
+
+
+def invalidate(func=None, args: Optional[tuple] = None, kwargs: Optional[dict] = None,
+               module: Optional[str] = None, fingerprint: Optional[str] = None,
+               storage: Optional[Storage] = None) -> int:
+    """Removes the entries of the cached function `func` (the function or its
+    name), or of every cached function in `module` and its submodules. Given
+    `args` and/or `kwargs`, only removes the entry of calling `func` with
+    them; given `fingerprint`, only the entries of that implementation.
+
+    Entries are removed from `storage`, or from the storage each function was
+    decorated with (the default storage for `module`, along with those of the
+    functions decorated in this process). Only the removed entries, and the
+    names of the stored functions for `module`, are looked at. Returns the
+    number of entries removed."""
+    if (func is None) == (module is None):
+        raise ValueError("Pass either func or module")
+    if func is not None:
+        if callable(func):
+            func = getattr(func, '__wrapped__', func)
+            name = _function_name(func)
+        else:
+            name, func = func, None
+        options = _registry_options.get(name, _Options(None, False, None))
+        store = storage or options.storage or _default_storage()
+        if args is not None or kwargs is not None:
+            if func is None:
+                wrapper = _registered(name, import_modules=True)
+                if wrapper is None:
+                    raise LookupError(f"Cached function {name} not found")
+                func = wrapper.__wrapped__
+            key = _get_cache_key(func, list(args or ()), kwargs or {}, root=options.root,
+                                 strict=options.strict, fingerprint=fingerprint)
+            removed = int(store.delete(key))
+            _forget_memory(store, key=key)
+        else:
+            removed = store.invalidate(name, fingerprint)
+            _forget_memory(store, name, fingerprint)
+        store.flush()
+        return removed
+    if storage is not None:
+        storages = [storage]
+    else:
+        storages = {id(_default_storage()): _default_storage()}
+        for name, options in _registry_options.items():
+            if options.storage is not None and name.startswith(module + '.'):
+                storages[id(options.storage)] = options.storage
+        storages = storages.values()
+    removed = 0
+    for store in storages:
+        for name in store.functions(module + '.'):
+            removed += store.invalidate(name, fingerprint)
+            _forget_memory(store, name, fingerprint)
+        store.flush()
+    return removed
+
+
+def warm(func, arg_iterable=None, workers: Optional[int] = None, executor: str = 'process',
+         limit: Optional[int] = None) -> int:
+    """Computes and stores the results of calls to the cached function `func`
+    (or the name of one) ahead of traffic, e.g. right after a deploy changed
+    its implementation, so that no caller has to wait for them.
+
+    The calls are the items of `arg_iterable`, as in func.map(), or by default
+    the calls recorded in the entries of its previous implementations (see
+    `record_args` in cache()), those read most often first. Calls already
+    cached are skipped, and at most `limit` calls are computed, by up to
+    `workers` processes (or threads, if `executor` is 'thread'). Results are
+    stored as they complete. Returns the number of results stored."""
+    if isinstance(func, str):
+        name, func = func, _registered(func, import_modules=True)
+        if func is None:
+            raise LookupError(f"Cached function {name} not found")
+    if not hasattr(func, 'warm'):
+        raise TypeError(f"{func!r} is not a cached function, or is a coroutine function")
+    return func.warm(arg_iterable, workers=workers, executor=executor, limit=limit)
+
+
+def clear_cache(storage: Optional[Storage] = None):
+    storage = storage or _default_storage()
+    storage.clear()
+    _forget_memory(storage)
+
+
+def _function_name(func: Callable):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def _get_cache_key(func: Callable, args: list, kwargs: dict,
+                   root: Optional[str] = None, strict: bool = False,
+                   fingerprint: Optional[str] = None):
+    """Returns the Key of the entry for calling `func` with `args` and
+    `kwargs`. Pass the implementation `fingerprint` if it is already known."""
+    if fingerprint is None:
+        fingerprint = _func_fingerprint(func, root=root, strict=strict)
+    arguments = _argument_key(func).fingerprint(args, kwargs, strict=strict)
+    cache_id = _make_hash(fingerprint, arguments)
+    return Key(_function_name(func), str(fingerprint), cache_id)
 
 
 def _get_cache_id(func: Callable, args: list, kwargs: dict,
                  root: Optional[str] = None, strict: bool = False):
-    return _make_hash(_func_fingerprint(func, root=root, strict=strict),
-                      _arg_fingerprint(args, kwargs, strict=strict))
+    return _get_cache_key(func, args, kwargs, root=root, strict=strict).id
+
+
+_EXECUTORS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+
+
+def _chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _call_wrapped(function: str, args: tuple, kwargs: Optional[dict] = None):
+    """Calls the undecorated version of the cached function named `function`.
+    Used by map() and warm() in worker processes, which cannot be sent the
+    undecorated function itself since pickle finds its name bound to the
+    wrapper."""
+    wrapper = _registered(function, import_modules=True)
+    if wrapper is None:
+        raise LookupError(f"Cached function {function} not found")
+    return wrapper.__wrapped__(*args, **(kwargs or {}))
+
+
+def _measured_cache_key(func: Callable, args: list, kwargs: dict, root: Optional[str],
+                        strict: bool, call: CallStats, fingerprint: Optional[str] = None):
+    """Returns the Key from _get_cache_key(), adding the time spent
+    fingerprinting `func` (unless `fingerprint` is given) and hashing the
+    arguments to `call`."""
+    start = time.perf_counter()
+    if fingerprint is None:
+        fingerprint = _func_fingerprint(func, root=root, strict=strict)
+        start = call.add('fingerprint', start)
+    key = _get_cache_key(func, args, kwargs, root=root, strict=strict, fingerprint=fingerprint)
+    call.add('arg_hash', start)
+    return key
+
+
+# Returned by lookups that found no usable entry
+_MISSING = object()
+
+
+class _Stale(KeyError):
+    """Raised by lookups that found a result due to be recomputed. Callers
+    that cannot use it treat it as a miss."""
+
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+
+
+_revalidation_lock = threading.Lock()
+_revalidation_executor = None
 
 
-def cache(root: Optional[str] = None, strict: bool = False):
+def _revalidation_pool() -> ThreadPoolExecutor:
+    """Returns the threads that recompute stale results in the background."""
+    global _revalidation_executor
+    with _revalidation_lock:
+        if _revalidation_executor is None:
+            _revalidation_executor = ThreadPoolExecutor(
+                thread_name_prefix='astrocache-revalidate')
+        return _revalidation_executor
+
+
+def _revalidated(task: asyncio.Task, call: CallStats):
+    """Records a background recomputation of a coroutine function's stale
+    result, reporting its failure if it failed."""
+    record_stats(call)
+    if not task.cancelled() and task.exception() is not None:
+        warnings.warn(f"Recomputing {call.function} failed: {task.exception()!r}",
+                      RuntimeWarning)
+
+
+def _async_wrapper(func: Callable, root: Optional[str], strict: bool,
+                   storage: Optional[Storage], single_flight: bool,
+                   lock_timeout: Optional[float], load: Callable, save: Callable):
+    """Returns the cached version of the coroutine function `func`. The cache
+    key is computed, and entries read and written, in the event loop's default
+    executor. Concurrent calls with the same key in one event loop await a
+    single call of `func`. Stale results are recomputed by a task that no
+    caller awaits."""
+    # (loop, id(storage), Key) -> Task computing the entry
+    inflight = {}
+
+    def lookup(store, args, kwargs, no_cache, call):
+        """Returns (key, result or _MISSING, whether the result is stale)."""
+        key = _measured_cache_key(func, args, kwargs, root, strict, call)
+        if no_cache or REFRESH:
+            return key, _MISSING, False
+        try:
+            return key, load(store, key, call), False
+        except _Stale as stale:
+            return key, stale.data, True
+        except KeyError:
+            return key, _MISSING, False
+
+    async def call_func(args, kwargs, call):
+        start = time.perf_counter()
+        call.misses += 1
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            call.add('compute', start)
+
+    async def compute(loop, store, key, args, kwargs, call):
+        run = functools.partial(loop.run_in_executor, None)
+        if not single_flight:
+            data = await call_func(args, kwargs, call)
+            await run(save, store, key, data, call, args, kwargs)
+            return data
+        lock = _key_locks.hold((id(store), key), store.lock_path(key), lock_timeout)
+        await run(lock.__enter__)
+        try:
+            # Another process may have stored the result while we waited
+            if not REFRESH:
+                try:
+                    return await run(load, store, key, call)
+                except KeyError:
+                    pass
+            data = await call_func(args, kwargs, call)
+            await run(save, store, key, data, call, args, kwargs)
+            await run(store.flush)
+            return data
+        finally:
+            await run(lock.__exit__, None, None, None)
+
+    @functools.wraps(func)
+    async def wrapper(*args, no_cache=False, **kwargs):
+        call = CallStats(_function_name(func))
+        try:
+            loop = asyncio.get_running_loop()
+            store = _use_storage(storage or _default_storage())
+            key, data, stale = await loop.run_in_executor(None, lookup, store, args, kwargs,
+                                                          no_cache, call)
+            if no_cache:
+                return await func(*args, **kwargs)
+            flight = (loop, id(store), key)
+            if stale and flight not in inflight:
+                revalidation = CallStats(call.function)
+                task = loop.create_task(compute(loop, store, key, args, kwargs, revalidation))
+                inflight[flight] = task
+                task.add_done_callback(lambda task: _revalidated(task, revalidation))
+                task.add_done_callback(lambda _: inflight.pop(flight, None))
+            if data is not _MISSING:
+                return data
+            task = inflight.get(flight)
+            if task is None:
+                task = loop.create_task(compute(loop, store, key, args, kwargs, call))
+                inflight[flight] = task
+                task.add_done_callback(lambda _: inflight.pop(flight, None))
+            else:
+                # Served by the call already computing it
+                call.hits += 1
+            # Cancelling one caller must not cancel the computation others await
+            return await asyncio.shield(task)
+        finally:
+            record_stats(call)
+
+    return wrapper
+
+
+def cache(root: Optional[str] = None, strict: bool = False,
+          storage: Optional[Storage] = None, max_bytes=None,
+          max_entries: Optional[int] = None, eviction: str = 'lru',
+          single_flight: bool = False, lock_timeout: Optional[float] = None,
+          memory: bool = False, memory_max_bytes=None,
+          serializer='pickle', compress: Optional[str] = None,
+          level: Optional[int] = None, ttl=None, stale_while_revalidate=None,
+          ignore=(), key: Optional[Callable] = None, record_args: bool = False):
     """
     Decorator that adds a durable cache to the wrapped function.
 
@@ -200,7 +1204,9 @@ def cache(root: Optional[str] = None, strict: bool = False):
     implementation. The implementation is determined recursively, but inspection
     is limited to source files within `root`. The cache is stored in the
     directory specified by the ASTROCACHE_DIR environment variable or in a
-    (deterministic) temporary directory if ASTROCACHE_DIR is not set.
+    (deterministic) temporary directory if ASTROCACHE_DIR is not set. Entries
+    are stored one file per entry, or in a single SQLite database if the
+    ASTROCACHE_STORAGE environment variable is set to 'sqlite'.
 
     Parameters:
     root (Optional[str]): The root directory for source code inspection. This
@@ -210,6 +1216,60 @@ def cache(root: Optional[str] = None, strict: bool = False):
     strict (bool): If True, raises an exception for any unhashable arguments or
                    if any referenced functions cannot be found. If False, skips
                    over unhashable parts and unfound functions. Defaults to False.
+    storage (Optional[Storage]): The backend to store entries in, e.g. a
+                                 FilesystemStorage or SQLiteStorage. Defaults to
+                                 the backend selected by ASTROCACHE_STORAGE.
+    max_bytes (Optional[int | str]): The most bytes this function's entries may
+                                     take up, e.g. 1000000 or '500M'. Unbounded
+                                     by default.
+    max_entries (Optional[int]): The most entries this function may keep.
+                                 Unbounded by default.
+    eviction (str): Which entries to evict first when over a limit: 'lru'
+                    (least recently used) or 'lfu' (least frequently used).
+                    Defaults to 'lru'.
+    single_flight (bool): If True, concurrent calls with the same arguments,
+                          in this or other processes, wait for the first of
+                          them to compute and store the result instead of all
+                          computing it. Defaults to False.
+    lock_timeout (Optional[float]): How many seconds a single-flight call waits
+                                    for another caller before computing the
+                                    result itself. Waits as long as the other
+                                    caller's process is alive by default.
+    memory (bool): If True, recently used results are also kept in memory, so
+                   repeated calls return them without reading or unpickling
+                   them. Such calls return the same object each time, so it
+                   should not be mutated. Defaults to False.
+    memory_max_bytes (Optional[int | str]): The most bytes (measured stored)
+                                            of results kept in memory, e.g.
+                                            '100M'. Defaults to 64 MiB.
+    serializer (str | Serializer): How results are stored: 'pickle', or
+                                   'pickle5' to store large buffers (e.g. NumPy
+                                   arrays) out-of-band and memory-map them on
+                                   hits, or a Serializer. Defaults to 'pickle'.
+    compress (Optional[str]): Compresses stored entries with 'zlib', 'bz2' or
+                              'lzma', or with 'auto' to use zlib unless an
+                              entry is small or a sample of it does not
+                              compress well. Out-of-band buffers are not
+                              compressed. Uncompressed by default.
+    level (Optional[int]): The compression level. Defaults to the codec's
+                           default.
+    ttl (Optional[float | timedelta]): How long results are used for after
+                                       they are computed, in seconds. Results
+                                       never expire by default.
+    stale_while_revalidate (Optional[float | timedelta]): For how long after
+                                       `ttl` a result is still returned, while
+                                       it is recomputed in a background thread
+                                       and replaced. Requires `ttl`.
+    ignore (Iterable[str]): Names of parameters left out of the cache key,
+                            e.g. connections, loggers or progress bars.
+    key (Optional[Callable]): Called with the arguments of each call, returns
+                              what the cache key covers instead of them, e.g.
+                              `lambda config, x: (config.version, x)`.
+    record_args (bool): If True, entries also record the arguments of the call
+                        that produced them, and their reads are counted, so
+                        that astrocache.warm() can replay the most read of
+                        them once the implementation changes. Defaults to
+                        False.
 
     Returns:
     Callable: A wrapped function with caching applied.
@@ -237,17 +1297,394 @@ def cache(root: Optional[str] = None, strict: bool = False):
       directory do not trigger cache invalidation.
     - Setting `ASTROCACHE_REFRESH` environment variable to a truthy value bypasses
       the cache and forces function execution.
+    - Coroutine functions (`async def`) are supported: the wrapper is itself a
+      coroutine function, which caches the awaited result and does its disk
+      I/O in the event loop's default executor.
+    - The `ASTROCACHE_MAX_BYTES` and `ASTROCACHE_MAX_ENTRIES` environment
+      variables bound the whole cache, evicting by `ASTROCACHE_EVICTION` ('lru'
+      by default). Eviction runs in a background thread, so limits may briefly
+      be exceeded.
     """
+    limit = Limit(parse_size(max_bytes), max_entries, eviction).validate()
+    serializer_ = get_serializer(serializer)
+    compression.validate(compress)
+    ttl = expiry.seconds(ttl)
+    stale_while_revalidate = expiry.seconds(stale_while_revalidate) or 0.0
+    if stale_while_revalidate and ttl is None:
+        raise ValueError("stale_while_revalidate requires a ttl")
+
     def decorator(func):
+        function_name = _function_name(func)
+        _argument_keys[func] = _ArgumentKey(func, ignore, key)
+        # Storages this function's limit has been applied to
+        limited = set()
+
+        if memory:
+            l1 = MemoryCache(parse_size(memory_max_bytes))
+            _memory_caches.add(l1)
+        # (id(storage), Key) of the entries being recomputed in the background
+        revalidating = set()
+
+        def check_age(written, data):
+            """Returns `data` if written recently enough, raises _Stale holding
+            it if within the stale window, or raises KeyError if expired."""
+            if ttl is None:
+                return data
+            state = expiry.state(written, time.time(), ttl, stale_while_revalidate)
+            if state == expiry.EXPIRED:
+                raise KeyError(written)
+            if state == expiry.STALE:
+                raise _Stale(data)
+            return data
+
+        def decode(store, key, stored, call):
+            """Returns (result, time written) for the entry `stored`, raising
+            KeyError if it has expired."""
+            # Arguments are recorded if written with record_args, which may
+            # since have been turned off
+            stored = arguments.strip(stored)
+            # Entries written with a ttl are stamped even if it has since been
+            # removed, in which case they never expire
+            written, stored = expiry.unstamp(stored)
+            if ttl is not None and expiry.state(written, time.time(), ttl,
+                                                stale_while_revalidate) == expiry.EXPIRED:
+                raise KeyError(key)
+            start = time.perf_counter()
+            buffers = store.read_buffers(key) if serializer_.out_of_band else []
+            start = call.add('read', start)
+            serialized = compression.decompress(stored)
+            data = serializer_.loads(serialized, buffers)
+            call.add('deserialize', start)
+            call.bytes_read += len(stored) + sum(b.nbytes for b in buffers)
+            _evictor.accessed(store, key)
+            if memory:
+                l1.put(store, key, (written, data) if ttl is not None else data,
+                       len(serialized) + sum(b.nbytes for b in buffers))
+            return data, written
+
+        def load_memory(store, key):
+            """Returns (result, time written) held in memory for `key`, or
+            raises KeyError."""
+            if ttl is None:
+                return l1.get(store, key), None
+            written, data = l1.get(store, key)
+            return data, written
+
+        def load(store, key, call):
+            """Returns the result stored for `key`. Raises KeyError if there is
+            none, or if it has expired; raises _Stale, holding the result, if
+            it is due to be recomputed."""
+            if record_args:
+                # warm() replays the calls read most often first
+                _evictor.track(store)
+            if memory:
+                try:
+                    data, written = load_memory(store, key)
+                except KeyError:
+                    pass
+                else:
+                    _evictor.accessed(store, key)
+                    call.hits += 1
+                    return check_age(written, data)
+            start = time.perf_counter()
+            try:
+                stored = store.read(key)
+            finally:
+                call.add('read', start)
+            data, written = decode(store, key, stored, call)
+            call.hits += 1
+            return check_age(written, data)
+
+        def load_many(store, keys, call, stale):
+            """Returns {key: result} for each of `keys` that has an unexpired
+            entry, and adds the keys of stale results to `stale`."""
+            if record_args:
+                _evictor.track(store)
+            found = {}
+            if memory:
+                for key in keys:
+                    try:
+                        found[key] = load_memory(store, key)
+                    except KeyError:
+                        continue
+                    _evictor.accessed(store, key)
+            missing = [key for key in keys if key not in found]
+            start = time.perf_counter()
+            stored = store.read_many(missing)
+            call.add('read', start)
+            for key, data in stored.items():
+                try:
+                    found[key] = decode(store, key, data, call)
+                except KeyError:
+                    continue
+            results = {}
+            for key, (data, written) in found.items():
+                try:
+                    results[key] = check_age(written, data)
+                except _Stale:
+                    results[key] = data
+                    stale.add(key)
+                except KeyError:
+                    continue
+            call.hits += len(results)
+            return results
+
+        def save_many(store, results, call, calls=None):
+            """Stores each (key, result) pair of `results`. If `record_args`,
+            `calls` maps each key to the (args, kwargs) it was computed with."""
+            start = time.perf_counter()
+            records = []
+            written = time.time()
+            for key, data in results:
+                serialized, buffers = serializer_.dumps(data)
+                stored = compression.compress(serialized, compress, level)
+                if ttl is not None:
+                    stored = expiry.stamp(stored, written)
+                if record_args and key in calls:
+                    stored = arguments.record(stored, *calls[key])
+                records.append((key, stored, buffers))
+                if memory:
+                    l1.put(store, key, (written, data) if ttl is not None else data,
+                           len(serialized) + sum(b.nbytes for b in buffers))
+            if not records:
+                return
+            start = call.add('serialize', start)
+            store.write_many(records)
+            call.add('write', start)
+            call.bytes_written += sum(len(data) + sum(memoryview(b).nbytes for b in buffers)
+                                      for _, data, buffers in records)
+            if limit and store not in limited:
+                limited.add(store)
+                _evictor.add_limit(store, limit, function_name)
+            _evictor.written(store)
+
+        def save(store, key, data, call, args=(), kwargs=None):
+            save_many(store, [(key, data)], call, {key: (args, kwargs or {})})
+
+        def compute(store, key, args, kwargs, call):
+            start = time.perf_counter()
+            call.misses += 1
+            try:
+                data = func(*args, **kwargs)
+            finally:
+                call.add('compute', start)
+            save(store, key, data, call, args, kwargs)
+            return data
+
+        def revalidate(store, key, args, kwargs):
+            """Recomputes the stale entry for `key` in a background thread,
+            unless that is already underway."""
+            flight = (id(store), key)
+            with _revalidation_lock:
+                if flight in revalidating:
+                    return
+                revalidating.add(flight)
+
+            def run():
+                call = CallStats(function_name)
+                try:
+                    compute(store, key, args, kwargs, call)
+                    store.flush()
+                except Exception as e:
+                    # The stale result is kept until it expires
+                    warnings.warn(f"Recomputing {function_name} failed: {e!r}", RuntimeWarning)
+                finally:
+                    with _revalidation_lock:
+                        revalidating.discard(flight)
+                    record_stats(call)
+
+            _revalidation_pool().submit(run)
+
         @functools.wraps(func)
         def wrapper(*args, no_cache=False, **kwargs):
-            cache_id = _get_cache_id(func, args, kwargs, root=root, strict=strict)
-            cache_path = os.path.join(CACHE_DIR, cache_id)
-            if (not REFRESH) and (not no_cache) and os.path.isfile(cache_path):
-                return _read_cache(cache_path)
-            data = func(*args, **kwargs)
-            if not no_cache:
-                _write_cache(cache_path, data)
-            return data
+            call = CallStats(function_name)
+            try:
+                store = _use_storage(storage or _default_storage())
+                key = _measured_cache_key(func, args, kwargs, root, strict, call)
+                if no_cache:
+                    return func(*args, **kwargs)
+                if REFRESH:
+                    return compute(store, key, args, kwargs, call)
+                try:
+                    return load(store, key, call)
+                except _Stale as stale:
+                    revalidate(store, key, args, kwargs)
+                    return stale.data
+                except KeyError:
+                    pass
+                if not single_flight:
+                    return compute(store, key, args, kwargs, call)
+                with _key_locks.hold((id(store), key), store.lock_path(key), lock_timeout):
+                    # Another caller may have stored the result while we waited
+                    try:
+                        return load(store, key, call)
+                    except KeyError:
+                        pass
+                    data = compute(store, key, args, kwargs, call)
+                    # Make the result visible to waiting processes
+                    store.flush()
+                    return data
+            finally:
+                record_stats(call)
+
+        def map(iterable, workers: Optional[int] = None, executor: str = 'thread',
+                chunk_size: int = 1000):
+            """Yields the result of calling the function with each item of
+            `iterable`, in order. Tuples are unpacked into positional
+            arguments; any other item is passed as the only argument.
+
+            Items are processed in chunks of `chunk_size`: the entries of a
+            chunk are looked up together, the missing results are computed by
+            up to `workers` threads or processes (`executor` is 'thread' or
+            'process'), and are stored together once the chunk is done. Each
+            chunk is measured as one call in astrocache.stats()."""
+            if executor not in _EXECUTORS:
+                raise ValueError(f"Unknown executor {executor!r}; expected 'thread' or 'process'")
+            store = _use_storage(storage or _default_storage())
+            fingerprint = None
+            pool = _EXECUTORS[executor](max_workers=workers)
+            try:
+                for chunk in _chunks(iterable, chunk_size):
+                    call = CallStats(function_name)
+                    if fingerprint is None:
+                        start = time.perf_counter()
+                        fingerprint = _func_fingerprint(func, root=root, strict=strict)
+                        call.add('fingerprint', start)
+                    calls = [item if isinstance(item, tuple) else (item,) for item in chunk]
+                    keys = [_measured_cache_key(func, args, {}, root, strict, call, fingerprint)
+                            for args in calls]
+                    stale = set()
+                    found = {} if REFRESH else load_many(store, keys, call, stale)
+                    for key, args in zip(keys, calls):
+                        if key in stale:
+                            stale.discard(key)
+                            revalidate(store, key, args, {})
+                    futures = {}
+                    for key, args in zip(keys, calls):
+                        if key not in found and key not in futures:
+                            if executor == 'process':
+                                futures[key] = pool.submit(_call_wrapped, function_name, args)
+                            else:
+                                futures[key] = pool.submit(func, *args)
+                    call.misses += len(futures)
+                    computed = {}
+                    try:
+                        for key in keys:
+                            if key in found:
+                                yield found[key]
+                                continue
+                            if key not in computed:
+                                start = time.perf_counter()
+                                computed[key] = futures[key].result()
+                                call.add('compute', start)
+                            yield computed[key]
+                    finally:
+                        save_many(store, computed.items(), call,
+                                  {key: (args, {}) for key, args in zip(keys, calls)})
+                        record_stats(call)
+            finally:
+                pool.shutdown(cancel_futures=True)
+
+        def recorded_calls(store, current: str):
+            """Yields the (args, kwargs) recorded in the entries of previous
+            implementations, those read most often first."""
+            # Count the reads not handed to the storage yet
+            _evictor.apply_accesses()
+            entries = [entry for entry in store.entries(function_name)
+                       if entry.key.fingerprint != current]
+            entries.sort(key=lambda entry: (-entry.hits, -entry.accessed))
+            for entry in entries:
+                try:
+                    recorded = arguments.recorded(store.read(entry.key))
+                except KeyError:
+                    continue
+                if recorded is not None:
+                    yield recorded
+
+        def warm(iterable=None, workers: Optional[int] = None, executor: str = 'process',
+                 limit: Optional[int] = None):
+            """Computes and stores the results of calls that are not cached yet.
+            See astrocache.warm()."""
+            if executor not in _EXECUTORS:
+                raise ValueError(f"Unknown executor {executor!r}; expected 'thread' or 'process'")
+            store = _use_storage(storage or _default_storage())
+            call = CallStats(function_name)
+            start = time.perf_counter()
+            fingerprint = _func_fingerprint(func, root=root, strict=strict)
+            call.add('fingerprint', start)
+            if iterable is None:
+                calls = recorded_calls(store, str(fingerprint))
+            else:
+                calls = ((item if isinstance(item, tuple) else (item,), {}) for item in iterable)
+            workers = workers or os.cpu_count() or 1
+            pool = _EXECUTORS[executor](max_workers=workers)
+            pending = {}
+            seen = set()
+            warmed = 0
+
+            def finish(at_most: int):
+                """Waits for calls to finish until at most `at_most` are
+                pending, storing their results."""
+                nonlocal warmed
+                while len(pending) > at_most:
+                    start = time.perf_counter()
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    call.add('compute', start)
+                    for future in done:
+                        key, args, kwargs = pending.pop(future)
+                        try:
+                            data = future.result()
+                        except Exception as e:
+                            warnings.warn(f"Warming {function_name} failed: {e!r}",
+                                          RuntimeWarning)
+                            continue
+                        save(store, key, data, call, args, kwargs)
+                        warmed += 1
+
+            try:
+                for args, kwargs in calls:
+                    if limit is not None and len(seen) >= limit:
+                        break
+                    key = _measured_cache_key(func, args, kwargs, root, strict, call,
+                                              fingerprint)
+                    if key in seen or store.contains(key):
+                        continue
+                    seen.add(key)
+                    # Queue at most two calls per worker, so they run in order
+                    finish(2 * workers - 1)
+                    if executor == 'process':
+                        future = pool.submit(_call_wrapped, function_name, args, kwargs)
+                    else:
+                        future = pool.submit(func, *args, **kwargs)
+                    pending[future] = (key, args, kwargs)
+                    call.misses += 1
+                finish(0)
+            finally:
+                pool.shutdown(cancel_futures=True)
+                store.flush()
+                record_stats(call)
+            return warmed
+
+        if inspect.iscoroutinefunction(func):
+            wrapper = _async_wrapper(func, root, strict, storage, single_flight,
+                                     lock_timeout, load, save)
+
+        def fingerprint():
+            """Returns the fingerprint of the current implementation."""
+            return str(_func_fingerprint(func, root=root, strict=strict))
+
+        def cache_clear():
+            """Removes every entry of this function, of any implementation."""
+            return invalidate(func)
+
+        wrapper.fingerprint = fingerprint
+        wrapper.cache_clear = cache_clear
+        if not inspect.iscoroutinefunction(func):
+            wrapper.map = map
+            wrapper.warm = warm
+        if memory:
+            wrapper.memory = l1
+        _registry[function_name] = wrapper
+        _registry_options[function_name] = _Options(root, strict, storage)
         return wrapper
     return decorator
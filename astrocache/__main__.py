@@ -0,0 +1,157 @@
+"""Command line interface: python -m astrocache <command>"""
+
+import importlib
+import sys
+
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+import astrocache
+
+
+def _configure(args):
+    if args.dir:
+        astrocache.CACHE_DIR = args.dir
+    if args.storage:
+        astrocache.STORAGE = args.storage
+
+
+def gc(args):
+    for module in args.module:
+        importlib.import_module(module)
+    removed = astrocache.gc(remove_unknown=args.remove_unknown,
+                            import_modules=not args.no_import)
+    print(f"Removed {removed} stale entries")
+
+
+def build_manifest(args):
+    built = astrocache.build_manifest(args.package, path=args.output)
+    print(f"Wrote the fingerprints of {len(built.entries)} cached functions to "
+          f"{args.output or built.directory / astrocache.manifest.FILENAME}")
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1000 or unit == 'GB':
+            break
+        size /= 1000
+    return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+
+
+def diff(args):
+    for module in args.module:
+        importlib.import_module(module)
+    old = astrocache.Manifest.load(args.manifest, directory=args.source_dir)
+    invalidations = astrocache.diff(old, import_modules=not args.no_import)
+    for inv in invalidations:
+        reason = 'removed' if inv.current is None else 'changed'
+        print(f"{inv.function}: {reason}, {inv.entries} entries, {_format_bytes(inv.bytes)}")
+        if inv.changed:
+            print(f"    functions: {', '.join(inv.changed)}")
+        print(f"    files: {', '.join(inv.files)}")
+    print(f"{len(invalidations)} cached functions, "
+          f"{sum(inv.entries for inv in invalidations)} entries, "
+          f"{_format_bytes(sum(inv.bytes for inv in invalidations))} invalidated")
+
+
+def warm(args):
+    for module in args.module:
+        importlib.import_module(module)
+    for function in args.function:
+        warmed = astrocache.warm(function, workers=args.workers, executor=args.executor,
+                                 limit=args.limit)
+        print(f"Warmed {warmed} entries of {function}")
+
+
+def serve(args):
+    server = astrocache.remote.serve(args.directory, host=args.host, port=args.port)
+    print(f"Serving {args.directory} at http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def main(argv=None):
+    ap = ArgumentParser(prog='python -m astrocache', formatter_class=RawTextHelpFormatter,
+                        description='Manages the astrocache cache.')
+    ap.add_argument('--dir', help='Cache directory (default: $ASTROCACHE_DIR)')
+    ap.add_argument('--storage', choices=['filesystem', 'sqlite'],
+                    help='Storage backend (default: $ASTROCACHE_STORAGE)')
+    commands = ap.add_subparsers(dest='command', required=True)
+
+    gc_parser = commands.add_parser('gc', help='Remove entries of outdated implementations',
+                                    description='''
+Removes entries whose fingerprint no longer matches the current source of the
+function that produced them. The modules defining cached functions are imported
+to compute their current fingerprints.''')
+    gc_parser.add_argument('-m', '--module', action='append', default=[],
+                           help='Import this module first (may be repeated)')
+    gc_parser.add_argument('--no-import', action='store_true',
+                           help="Don't import modules to find cached functions")
+    gc_parser.add_argument('--remove-unknown', action='store_true',
+                           help='Also remove entries of functions that cannot be found')
+    gc_parser.set_defaults(func=gc)
+
+    manifest_parser = commands.add_parser('build-manifest',
+                                          help='Precompute the fingerprints of cached functions',
+                                          description='''
+Imports the given packages and their submodules, and writes the fingerprints of
+the cached functions they define to a manifest. Load it at runtime by setting
+$ASTROCACHE_MANIFEST to its path, or with astrocache.load_manifest(), to skip
+inspecting the source of those functions.''')
+    manifest_parser.add_argument('package', nargs='+', help='Package or module to import')
+    manifest_parser.add_argument('-o', '--output',
+                                 help='Manifest file to write (default: '
+                                      'astrocache-manifest.json in the first package)')
+    manifest_parser.set_defaults(func=build_manifest)
+
+    diff_parser = commands.add_parser('diff', help='Show what a source change invalidates',
+                                      description='''
+Compares the current source to a manifest written by build-manifest (e.g. at the
+last deploy), and lists the cached functions whose fingerprint changed, with the
+number and size of their entries that will be recomputed. Only the functions
+depending on source files whose size or mtime changed are fingerprinted again.''')
+    diff_parser.add_argument('manifest', help='Manifest built from the old source')
+    diff_parser.add_argument('--source-dir',
+                             help="Directory the manifest's paths are relative to "
+                                  "(default: the manifest's)")
+    diff_parser.add_argument('-m', '--module', action='append', default=[],
+                             help='Import this module first (may be repeated)')
+    diff_parser.add_argument('--no-import', action='store_true',
+                             help="Don't import modules to find cached functions")
+    diff_parser.set_defaults(func=diff)
+
+    warm_parser = commands.add_parser('warm', help='Precompute results of changed functions',
+                                      description='''
+Replays the calls recorded in the entries of previous implementations of cached
+functions (decorated with record_args=True) against their current
+implementation, those read most often first, and stores the results. Calls
+already cached are skipped.''')
+    warm_parser.add_argument('function', nargs='+',
+                             help='Name of a cached function, e.g. mypackage.jobs.simulate')
+    warm_parser.add_argument('-m', '--module', action='append', default=[],
+                             help='Import this module first (may be repeated)')
+    warm_parser.add_argument('-j', '--workers', type=int,
+                             help='Number of worker processes (default: one per CPU)')
+    warm_parser.add_argument('--executor', choices=['process', 'thread'], default='process',
+                             help='Compute in worker processes or threads')
+    warm_parser.add_argument('--limit', type=int,
+                             help='Compute at most this many results per function')
+    warm_parser.set_defaults(func=warm)
+
+    serve_parser = commands.add_parser('serve', help='Serve a shared cache over HTTP',
+                                       description='''
+Serves the entries of a shared cache tier from a directory over HTTP, as a
+stand-in for an object store. Point $ASTROCACHE_REMOTE at its URL.''')
+    serve_parser.add_argument('directory', help='Directory to store entries in')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    serve_parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    serve_parser.set_defaults(func=serve)
+
+    args = ap.parse_args(argv)
+    _configure(args)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,57 @@
+"""Arguments recorded in entries, so that they can be replayed against a new
+implementation of their function (see astrocache.warm()).
+
+Entries of functions cached with `record_args` start with the pickled
+arguments of the call that produced them:
+
+    MAGIC (4 bytes) | VERSION (1 byte) | length (4 bytes) | pickled (args, kwargs) | payload
+
+The record is added outside of any other header, so reading the arguments
+does not touch the payload. Calls whose arguments cannot be pickled are stored
+without it.
+"""
+
+import pickle
+import struct
+
+from typing import Optional, Tuple
+
+MAGIC = b'\x00ACA'
+VERSION = 1
+_HEADER = struct.Struct('>4sBI')
+
+
+def record(data: bytes, args: tuple, kwargs: dict) -> bytes:
+    """Returns `data` with `args` and `kwargs` recorded before it."""
+    try:
+        pickled = pickle.dumps((tuple(args), dict(kwargs)), protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return data
+    return _HEADER.pack(MAGIC, VERSION, len(pickled)) + pickled + data
+
+
+def _split(data: bytes) -> Tuple[Optional[memoryview], bytes]:
+    if not data.startswith(MAGIC) or len(data) < _HEADER.size:
+        return None, data
+    _, version, length = _HEADER.unpack_from(data)
+    if version != VERSION:
+        return None, data
+    end = _HEADER.size + length
+    return memoryview(data)[_HEADER.size:end], data[end:]
+
+
+def strip(data: bytes) -> bytes:
+    """Returns the payload of data returned by record(), or `data` itself if it
+    has no recorded arguments."""
+    return _split(data)[1]
+
+
+def recorded(data: bytes) -> Optional[Tuple[tuple, dict]]:
+    """Returns the (args, kwargs) recorded in `data`, or None."""
+    pickled, _ = _split(data)
+    if pickled is None:
+        return None
+    try:
+        return pickle.loads(pickled)
+    except Exception:
+        return None
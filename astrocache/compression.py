@@ -0,0 +1,84 @@
+"""Compression of entry data with the standard library's codecs.
+
+Compressed data starts with a small header naming its codec, so it is
+decompressed on read whatever the reading function's own settings are:
+
+    MAGIC (4 bytes) | VERSION (1 byte) | codec id (1 byte) | payload
+
+Data without the header is stored as is. Data that is left uncompressed but
+happens to start with MAGIC is given a header with the 'none' codec, so it is
+never mistaken for compressed data.
+"""
+
+import bz2
+import lzma
+import zlib
+
+from typing import Callable, NamedTuple, Optional
+
+MAGIC = b'\x00ACZ'
+VERSION = 1
+
+
+class Codec(NamedTuple):
+    id: int
+    # compress(data, level) -> bytes; level is None for the codec's default
+    compress: Callable
+    decompress: Callable
+
+
+CODECS = {
+    'none': Codec(0, lambda data, level: data, bytes),
+    'zlib': Codec(1, lambda data, level: zlib.compress(data, 6 if level is None else level),
+                  zlib.decompress),
+    'bz2': Codec(2, lambda data, level: bz2.compress(data, 9 if level is None else level),
+                 bz2.decompress),
+    'lzma': Codec(3, lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+_CODECS_BY_ID = {codec.id: codec for codec in CODECS.values()}
+
+# In 'auto' mode, data smaller than this is not compressed...
+AUTO_MIN_SIZE = 1024
+# ...nor is data whose first AUTO_SAMPLE_SIZE bytes, compressed quickly, shrink
+# to more than AUTO_MAX_RATIO of their size.
+AUTO_SAMPLE_SIZE = 64 << 10
+AUTO_MAX_RATIO = 0.9
+
+
+def validate(codec: Optional[str]) -> Optional[str]:
+    if codec is not None and codec != 'auto' and codec not in CODECS:
+        raise ValueError(f"Unknown compression {codec!r}; "
+                         f"expected one of {sorted(CODECS.keys() | {'auto'})}")
+    return codec
+
+
+def _header(codec: Codec):
+    return MAGIC + bytes([VERSION, codec.id])
+
+
+def _compressible(data: bytes):
+    if len(data) < AUTO_MIN_SIZE:
+        return False
+    sample = data[:AUTO_SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) <= AUTO_MAX_RATIO * len(sample)
+
+
+def compress(data: bytes, codec: Optional[str] = None, level: Optional[int] = None) -> bytes:
+    """Returns `data` compressed with `codec` ('zlib', 'bz2', 'lzma', or 'auto'
+    for zlib if a sample of `data` compresses well), or `data` itself if
+    `codec` is None."""
+    if codec == 'auto':
+        codec = 'zlib' if _compressible(data) else 'none'
+    if codec is None or codec == 'none':
+        return _header(CODECS['none']) + data if data.startswith(MAGIC) else data
+    return _header(CODECS[codec]) + CODECS[codec].compress(data, level)
+
+
+def decompress(data: bytes) -> bytes:
+    """Returns the data that compress() returned `data` for."""
+    if not data.startswith(MAGIC):
+        return data
+    version, codec_id = data[len(MAGIC)], data[len(MAGIC) + 1]
+    if version != VERSION or codec_id not in _CODECS_BY_ID:
+        raise ValueError(f"Unsupported compressed entry (version {version}, codec {codec_id})")
+    return _CODECS_BY_ID[codec_id].decompress(memoryview(data)[len(MAGIC) + 2:])
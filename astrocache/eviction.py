@@ -0,0 +1,192 @@
+"""Size limits for cache storage, enforced by evicting entries in the
+background.
+
+Reads are recorded in memory as they happen and handed to the storage in
+batches, so tracking access costs a dictionary update per hit. A daemon thread
+wakes up after writes (or periodically), applies recorded accesses and evicts
+entries in small batches until every limit is met again.
+"""
+
+import atexit
+import re
+import threading
+import time
+
+from typing import Callable, NamedTuple, Optional
+
+from .storage import EVICTION_POLICIES, Key, Storage
+
+_SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(size) -> Optional[int]:
+    """Parses a size such as 1000, '500M' or '2G' into a number of bytes."""
+    if size is None or isinstance(size, int):
+        return size
+    match = re.fullmatch(r'\s*(\d+)\s*([KMGT]?)B?\s*', str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size {size!r}")
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2).upper()]
+
+
+class Limit(NamedTuple):
+    """Limit bounds the entries in a storage, or those produced by one
+    function. Entries are evicted in the order given by `policy`, which is
+    'lru' (least recently used) or 'lfu' (least frequently used)."""
+    max_bytes: Optional[int] = None
+    max_entries: Optional[int] = None
+    policy: str = 'lru'
+
+    def validate(self):
+        if self.policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {self.policy!r}; "
+                             f"expected one of {sorted(EVICTION_POLICIES)}")
+        return self
+
+    def __bool__(self):
+        return self.max_bytes is not None or self.max_entries is not None
+
+
+class Evictor:
+    """Evictor enforces Limits on storages from a background thread. The
+    thread runs every `interval` seconds, or after a write, but no more than
+    once every `cooldown` seconds. `on_delete(storage, key)` is called for each
+    evicted entry."""
+
+    def __init__(self, interval: float = 10.0, cooldown: float = 1.0,
+                 batch_size: int = 100,
+                 on_delete: Optional[Callable[[Storage, Key], None]] = None):
+        self.interval = interval
+        self.cooldown = cooldown
+        self.batch_size = batch_size
+        self.on_delete = on_delete
+        # id(storage) -> (storage, {function or None: Limit})
+        self._limits = {}
+        # id(storage) -> storage, for storages whose reads are recorded
+        self._tracked = {}
+        # id(storage) -> {Key: [hits, last accessed]}
+        self._accesses = {}
+        self._lock = threading.Lock()
+        # Held by run(), so that concurrent runs do not evict the same excess twice
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add_limit(self, storage: Storage, limit: Limit, function: Optional[str] = None):
+        """Bounds the entries in `storage`, or those produced by `function`."""
+        if not limit:
+            return
+        limit.validate()
+        with self._lock:
+            self._limits.setdefault(id(storage), (storage, {}))[1][function] = limit
+        self.track(storage)
+
+    def track(self, storage: Storage):
+        """Records reads of the entries of `storage` from now on, and hands
+        them to it in batches (see Storage.touch()), from the background
+        thread and at exit."""
+        if id(storage) in self._tracked:
+            return
+        with self._lock:
+            if not self._tracked:
+                atexit.register(self._apply_at_exit)
+            self._tracked[id(storage)] = storage
+            self._accesses.setdefault(id(storage), {})
+
+    def accessed(self, storage: Storage, key: Key):
+        """Records a read of `key`, if `storage` is tracked (see track()); it
+        is once it has any limits."""
+        if id(storage) not in self._accesses:
+            return
+        with self._lock:
+            record = self._accesses[id(storage)].setdefault(key, [0, 0.0])
+            record[0] += 1
+            record[1] = time.time()
+
+    def written(self, storage: Storage):
+        """Wakes up the background thread, if `storage` has any limits, or
+        starts it if its reads are tracked."""
+        if id(storage) in self._limits:
+            self._start()
+            self._wakeup.set()
+        elif id(storage) in self._tracked:
+            self._start()
+
+    def apply_accesses(self):
+        """Hands the reads recorded so far to their storages."""
+        with self._lock:
+            tracked = list(self._tracked.values())
+            accesses = {sid: self._accesses[sid] for sid in self._accesses}
+            for sid in self._accesses:
+                self._accesses[sid] = {}
+        for storage in tracked:
+            records = accesses.get(id(storage))
+            if not records:
+                continue
+            for key, (hits, accessed) in records.items():
+                storage.touch(key, accessed, hits)
+            storage.flush()
+
+    def _apply_at_exit(self):
+        try:
+            self.apply_accesses()
+        except Exception:
+            # Best effort, e.g. the storage may have been removed
+            pass
+
+    def run(self):
+        """Applies recorded accesses and evicts entries until every limit is
+        met. Called periodically by the background thread."""
+        with self._run_lock:
+            self.apply_accesses()
+            with self._lock:
+                limits = list(self._limits.values())
+            removed = 0
+            for storage, function_limits in limits:
+                for function, limit in function_limits.items():
+                    removed += self._enforce(storage, function, limit)
+            return removed
+
+    def _enforce(self, storage: Storage, function: Optional[str], limit: Limit):
+        usage = storage.usage(function)
+        excess_entries = usage.entries - limit.max_entries if limit.max_entries is not None else 0
+        excess_bytes = usage.bytes - limit.max_bytes if limit.max_bytes is not None else 0
+        removed = 0
+        while excess_entries > 0 or excess_bytes > 0:
+            victims = storage.victims(function, limit.policy,
+                                      max(self.batch_size, excess_entries))
+            if not victims:
+                break
+            for entry in victims:
+                if storage.evict(entry.key):
+                    if self.on_delete is not None:
+                        self.on_delete(storage, entry.key)
+                    removed += 1
+                    excess_entries -= 1
+                    excess_bytes -= entry.size
+                if excess_entries <= 0 and excess_bytes <= 0:
+                    break
+            # Let other threads run between batches
+            time.sleep(0)
+        storage.flush()
+        return removed
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='astrocache-evictor',
+                                                daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.run()
+            except Exception:
+                # Eviction is best effort; try again on the next wakeup
+                pass
+            time.sleep(self.cooldown)
@@ -0,0 +1,65 @@
+"""Expiry of entries of functions cached with a time-to-live.
+
+Such entries start with a small header recording when they were written, so
+their age is known as soon as they are read, before they are deserialized:
+
+    MAGIC (4 bytes) | VERSION (1 byte) | written (8-byte float, Unix time) | payload
+
+The header is added outside of compression. Entries of functions without a
+time-to-live are stored without it.
+"""
+
+import struct
+
+from datetime import timedelta
+from typing import Optional, Tuple
+
+MAGIC = b'\x00ACT'
+VERSION = 1
+_HEADER = struct.Struct('>4sBd')
+
+# The states of an entry, by age
+FRESH = 'fresh'
+STALE = 'stale'
+EXPIRED = 'expired'
+
+
+def seconds(duration) -> Optional[float]:
+    """Returns `duration` (a number of seconds or a timedelta) in seconds."""
+    if duration is None:
+        return None
+    if isinstance(duration, timedelta):
+        duration = duration.total_seconds()
+    if duration < 0:
+        raise ValueError(f"Invalid duration {duration!r}")
+    return float(duration)
+
+
+def stamp(data: bytes, written: float) -> bytes:
+    """Returns `data` with a header recording that it was written at `written`."""
+    return _HEADER.pack(MAGIC, VERSION, written) + data
+
+
+def unstamp(data: bytes) -> Tuple[Optional[float], bytes]:
+    """Returns (written, payload) for data returned by stamp(), or
+    (None, data) for data without a header."""
+    if not data.startswith(MAGIC) or len(data) < _HEADER.size:
+        return None, data
+    _, version, written = _HEADER.unpack_from(data)
+    if version != VERSION:
+        return None, data
+    return written, data[_HEADER.size:]
+
+
+def state(written: Optional[float], now: float, ttl: float, stale: float = 0.0) -> str:
+    """Returns whether an entry written at `written` is FRESH (at most `ttl`
+    seconds old), STALE (at most `stale` seconds more), or EXPIRED. Entries
+    of unknown age are EXPIRED."""
+    if written is None:
+        return EXPIRED
+    age = now - written
+    if age <= ttl:
+        return FRESH
+    if age <= ttl + stale:
+        return STALE
+    return EXPIRED
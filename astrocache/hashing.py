@@ -0,0 +1,259 @@
+"""Deterministic hashing of argument values.
+
+Values are hashed by feeding a canonical, type-tagged encoding of them into a
+BLAKE2b digest, so the same value hashes the same way in every process
+(unlike hash(), which is randomized for str and bytes). Contiguous buffers
+(bytes, bytearray, memoryview, mmap, NumPy arrays) are hashed through a
+memoryview without copying, and containers are hashed structurally; dicts and
+sets hash the same regardless of ordering.
+
+Hashers for other types can be added with register_hasher().
+"""
+
+import dataclasses
+import datetime
+import decimal
+import enum
+import fractions
+import functools
+import hashlib
+import os
+import struct
+import sys
+import types
+import uuid
+
+from typing import Callable, Optional
+
+# Set by astrocache: fingerprint_function(func, strict=...) returns the
+# implementation fingerprint of a function passed as an argument.
+fingerprint_function = None
+
+_hashers = {}
+# type -> hasher (or None) found for it by walking its MRO
+_dispatch = {}
+
+
+class UnhashableError(ValueError):
+    pass
+
+
+def register_hasher(cls: type, hasher: Optional[Callable] = None):
+    """Registers `hasher` for `cls` and its subclasses. A hasher takes a value
+    and returns any value astrocache can hash (e.g. a tuple of the fields that
+    matter, or bytes), which is hashed in its place. Can be used as a
+    decorator:
+
+        @astrocache.register_hasher(Config)
+        def hash_config(config):
+            return (config.version, config.seed)
+    """
+    if hasher is None:
+        return functools.partial(register_hasher, cls)
+    _hashers[cls] = hasher
+    _dispatch.clear()
+    return hasher
+
+
+def _registered_hasher(cls: type):
+    try:
+        return _dispatch[cls]
+    except KeyError:
+        pass
+    hasher = next((_hashers[c] for c in cls.__mro__ if c in _hashers), None)
+    _dispatch[cls] = hasher
+    return hasher
+
+
+def _qualified_name(obj):
+    return f'{getattr(obj, "__module__", None)}.{getattr(obj, "__qualname__", type(obj).__qualname__)}'
+
+
+class _Hasher:
+    """Feeds the canonical encoding of values into a digest."""
+
+    def __init__(self, strict: bool = False, active: Optional[set] = None):
+        self.strict = strict
+        self.digest = hashlib.blake2b(digest_size=16)
+        # ids of containers being hashed, to detect cycles
+        self.active = set() if active is None else active
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+    def _tag(self, tag: bytes, length: Optional[int] = None):
+        self.digest.update(tag)
+        if length is not None:
+            self.digest.update(struct.pack('<Q', length))
+
+    def _bytes(self, tag: bytes, data):
+        self._tag(tag, len(data))
+        self.digest.update(data)
+
+    def _str(self, tag: bytes, s: str):
+        self._bytes(tag, s.encode('utf-8', 'surrogatepass'))
+
+    def _subdigest(self, obj):
+        sub = _Hasher(self.strict, self.active)
+        sub.update(obj)
+        return sub.digest.digest()
+
+    def update(self, obj):
+        cls = type(obj)
+        # Fast paths for the most common argument types
+        if obj is None:
+            self._tag(b'N')
+        elif cls is bool:
+            self._tag(b'T' if obj else b'F')
+        elif cls is int:
+            # str() refuses ints of more than 4300 digits on Python 3.11+
+            self._bytes(b'i', obj.to_bytes((obj.bit_length() + 8) // 8, 'little', signed=True))
+        elif cls is float:
+            self._bytes(b'f', struct.pack('<d', obj))
+        elif cls is str:
+            self._str(b's', obj)
+        elif cls is bytes:
+            self._bytes(b'b', obj)
+        elif _registered_hasher(cls) is not None:
+            self._str(b'R', _qualified_name(cls))
+            self.update(_registered_hasher(cls)(obj))
+        elif self._update_numpy(obj) or self._update_pandas(obj):
+            pass
+        elif isinstance(obj, (tuple, list, dict, set, frozenset)):
+            self._update_container(obj)
+        elif isinstance(obj, (bytearray, memoryview)) or _is_buffer(obj):
+            self._update_buffer(obj)
+        elif callable(obj) and self._update_callable(obj):
+            pass
+        elif isinstance(obj, enum.Enum):
+            self._str(b'E', f'{_qualified_name(cls)}.{obj.name}')
+        elif dataclasses.is_dataclass(obj):
+            self._str(b'D', _qualified_name(cls))
+            self.update(tuple((f.name, getattr(obj, f.name))
+                              for f in dataclasses.fields(obj)))
+        elif isinstance(obj, os.PathLike):
+            self._str(b'P', _qualified_name(cls))
+            self.update(os.fspath(obj))
+        elif isinstance(obj, (int, float, complex, str, bytes)):
+            # Subclasses of builtins hash like their base type
+            base = next(b for b in (int, float, complex, str, bytes) if isinstance(obj, b))
+            self._str(b'S', _qualified_name(cls))
+            self.update(base(obj))
+        # Do not use __hash__ if it was inherited from `object`
+        elif cls.__hash__ is not None and cls.__hash__ != object.__hash__:
+            if self.strict:
+                # hash() may differ between processes, e.g. if it hashes a str
+                raise UnhashableError(f"Unable to hash {cls} {obj} deterministically: "
+                                      f"register a hasher for it with astrocache.register_hasher()")
+            try:
+                self._str(b'H', str(hash(obj)))
+            except Exception as e:
+                raise UnhashableError(f"Unable to hash {cls} {obj}: {e}")
+        else:
+            raise UnhashableError(f"Unable to hash {cls} {obj}")
+
+    def _update_container(self, obj):
+        if id(obj) in self.active:
+            raise UnhashableError(f"Unable to hash {type(obj)}: it contains itself")
+        self.active.add(id(obj))
+        try:
+            if isinstance(obj, (tuple, list)):
+                self._tag(b'l' if isinstance(obj, list) else b't', len(obj))
+                if type(obj) not in (tuple, list):
+                    self._str(b'S', _qualified_name(type(obj)))
+                for item in obj:
+                    self.update(item)
+            elif isinstance(obj, dict):
+                self._tag(b'd', len(obj))
+                for item in sorted(self._subdigest(k) + self._subdigest(v) for k, v in obj.items()):
+                    self.digest.update(item)
+            else:
+                self._tag(b'e', len(obj))
+                for item in sorted(self._subdigest(x) for x in obj):
+                    self.digest.update(item)
+        finally:
+            self.active.discard(id(obj))
+
+    def _update_buffer(self, obj):
+        with memoryview(obj) as view:
+            self._str(b'B', f'{view.format}{view.shape}')
+            if view.c_contiguous:
+                with view.cast('B') as data:
+                    self._bytes(b'b', data)
+            else:
+                self._bytes(b'b', view.tobytes())
+
+    def _update_callable(self, obj):
+        if hasattr(obj, '__code__'):
+            self._str(b'C', _qualified_name(obj))
+            self.update(fingerprint_function(obj, strict=self.strict))
+        elif isinstance(obj, functools.partial):
+            self._str(b'p', _qualified_name(type(obj)))
+            self.update((obj.func, obj.args, obj.keywords))
+        elif isinstance(obj, (type, types.BuiltinFunctionType)):
+            self._str(b'c', _qualified_name(obj))
+        else:
+            return False
+        return True
+
+    def _update_numpy(self, obj):
+        np = sys.modules.get('numpy')
+        if np is None:
+            return False
+        if isinstance(obj, np.ndarray):
+            self._str(b'A', f'{obj.dtype.str}{obj.shape}')
+            if obj.dtype.hasobject:
+                self.update(obj.tolist())
+            else:
+                self._update_buffer(np.ascontiguousarray(obj))
+        elif isinstance(obj, np.generic):
+            self._str(b'a', obj.dtype.str)
+            self.update(obj.item() if obj.dtype.hasobject else obj.tobytes())
+        else:
+            return False
+        return True
+
+    def _update_pandas(self, obj):
+        pd = sys.modules.get('pandas')
+        if pd is None or not isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+            return False
+        self._str(b'X', _qualified_name(type(obj)))
+        if isinstance(obj, pd.DataFrame):
+            self.update([str(dtype) for dtype in obj.dtypes])
+            self.update(obj.columns)
+        else:
+            self.update(str(obj.dtype))
+            self.update(obj.name)
+        try:
+            self.update(pd.util.hash_pandas_object(obj).to_numpy())
+        except TypeError as e:
+            raise UnhashableError(f"Unable to hash {type(obj)}: {e}")
+        return True
+
+
+def _is_buffer(obj):
+    try:
+        memoryview(obj).release()
+    except TypeError:
+        return False
+    return True
+
+
+def value_hash(obj, strict: bool = False):
+    """Returns a deterministic hash representing the value of obj if possible;
+    otherwise returns None, or if `strict` then raises an exception."""
+    hasher = _Hasher(strict)
+    try:
+        hasher.update(obj)
+    except UnhashableError:
+        if strict:
+            raise
+        return None
+    return hasher.hexdigest()
+
+
+# Standard library value types whose hash() is not stable across processes
+for _cls in (datetime.date, datetime.time, datetime.timedelta, datetime.timezone,
+             decimal.Decimal, fractions.Fraction, range, slice, complex):
+    register_hasher(_cls, repr)
+register_hasher(uuid.UUID, lambda u: u.bytes)
@@ -0,0 +1,236 @@
+"""Instrumentation of cached functions.
+
+Each call of a cached function is measured as a CallStats: whether it hit or
+missed, how many bytes it read and wrote, and how long it spent in each phase
+of the call. Completed calls are added up per function by every active Stats
+collector (there is always one for the whole process), and handed to the
+hook set with set_hook(), if any.
+"""
+
+import math
+import threading
+import time
+
+from typing import Callable, Dict, Optional
+
+# The phases of a call, in order
+PHASES = ('fingerprint', 'arg_hash', 'read', 'deserialize', 'compute', 'serialize', 'write')
+
+
+class CallStats:
+    """CallStats measures one call of the cached function named `function`
+    (or one chunk of calls, for func.map()). Phase timings are in seconds."""
+
+    __slots__ = ('function', 'hits', 'misses', 'bytes_read', 'bytes_written', 'timings')
+
+    def __init__(self, function: str):
+        self.function = function
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.timings = {}
+
+    def add(self, phase: str, start: float) -> float:
+        """Adds the time since `start` (a time.perf_counter() value) to
+        `phase`, and returns the current time to start the next phase with."""
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - start
+        return now
+
+    def __repr__(self):
+        return (f'CallStats({self.function!r}, hits={self.hits}, misses={self.misses}, '
+                f'bytes_read={self.bytes_read}, bytes_written={self.bytes_written}, '
+                f'timings={self.timings})')
+
+
+class Histogram:
+    """Histogram counts durations in buckets that double in width, starting
+    with durations up to one microsecond."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        # n -> number of durations in (2**(n-1), 2**n] microseconds
+        self.buckets = {}
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        bucket = max(0, math.ceil(math.log2(seconds * 1e6))) if seconds > 0 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other: 'Histogram'):
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Returns an upper bound on the `q` quantile (e.g. 0.99) of the
+        durations, accurate to a factor of two."""
+        if not self.count:
+            return 0.0
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= q * self.count:
+                return min(2 ** bucket / 1e6, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count, 'total': self.total, 'mean': self.mean,
+            'min': self.min if self.count else 0.0, 'max': self.max,
+            'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+        }
+
+
+class FunctionStats:
+    """FunctionStats adds up the CallStats of one function."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.timings = {phase: Histogram() for phase in PHASES}
+
+    def add(self, call: CallStats):
+        self.hits += call.hits
+        self.misses += call.misses
+        self.bytes_read += call.bytes_read
+        self.bytes_written += call.bytes_written
+        for phase, seconds in call.timings.items():
+            self.timings[phase].add(seconds)
+
+    def merge(self, other: 'FunctionStats'):
+        self.hits += other.hits
+        self.misses += other.misses
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        for phase, histogram in other.timings.items():
+            self.timings[phase].merge(histogram)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits or self.misses else 0.0
+
+    @property
+    def overhead(self) -> float:
+        """Total seconds spent caching, i.e. outside of the function itself."""
+        return sum(h.total for phase, h in self.timings.items() if phase != 'compute')
+
+    def as_dict(self) -> dict:
+        return {
+            'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate,
+            'bytes_read': self.bytes_read, 'bytes_written': self.bytes_written,
+            'overhead': self.overhead,
+            'timings': {phase: h.as_dict() for phase, h in self.timings.items() if h.count},
+        }
+
+
+class Stats:
+    """Stats holds FunctionStats by function name. Used as a context manager,
+    it starts out empty and collects the calls completed inside the block:
+
+        with astrocache.stats() as stats:
+            ...
+        print(stats.summary())
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.functions: Dict[str, FunctionStats] = {}
+
+    def add(self, call: CallStats):
+        with self._lock:
+            if call.function not in self.functions:
+                self.functions[call.function] = FunctionStats()
+            self.functions[call.function].add(call)
+
+    def __getitem__(self, function: str) -> FunctionStats:
+        return self.functions[function]
+
+    def __contains__(self, function: str) -> bool:
+        return function in self.functions
+
+    def copy(self) -> 'Stats':
+        copy = Stats()
+        with self._lock:
+            for function, stats in self.functions.items():
+                copy.functions[function] = FunctionStats()
+                copy.functions[function].merge(stats)
+        return copy
+
+    def reset(self):
+        with self._lock:
+            self.functions = {}
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {function: stats.as_dict() for function, stats in self.functions.items()}
+
+    def summary(self) -> str:
+        """Returns a table of the functions' hits, misses, and the seconds
+        spent computing and on caching overhead, most overhead first."""
+        lines = [f'{"function":40} {"hits":>8} {"misses":>8} {"compute":>10} {"overhead":>10}']
+        with self._lock:
+            functions = sorted(self.functions.items(), key=lambda item: -item[1].overhead)
+            for function, stats in functions:
+                lines.append(f'{function:40} {stats.hits:8} {stats.misses:8} '
+                             f'{stats.timings["compute"].total:10.4f} {stats.overhead:10.4f}')
+        return '\n'.join(lines)
+
+    def __enter__(self):
+        self.reset()
+        with _lock:
+            _collectors.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        with _lock:
+            _collectors.remove(self)
+
+
+_lock = threading.Lock()
+# Stats of every call made in this process
+_totals = Stats()
+_collectors = [_totals]
+_hook = None
+
+
+def record(call: CallStats):
+    """Adds `call` to every active collector, and hands it to the hook."""
+    for collector in tuple(_collectors):
+        collector.add(call)
+    if _hook is not None:
+        try:
+            _hook(call)
+        except Exception:
+            # Forwarding stats is best effort; never fail a cached call over it
+            pass
+
+
+def stats() -> Stats:
+    """Returns a copy of the stats of every call made in this process so far.
+    Use it as a context manager to collect only the calls made inside the
+    block instead."""
+    return _totals.copy()
+
+
+def set_hook(hook: Optional[Callable[[CallStats], None]]):
+    """Calls `hook` with the CallStats of every completed call, e.g. to
+    forward them to a metrics system. Pass None to remove it."""
+    global _hook
+    _hook = hook
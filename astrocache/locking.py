@@ -0,0 +1,145 @@
+"""Single-flight locking, so that concurrent callers computing the same entry
+wait for the first one to finish instead of all computing it.
+
+Within a process, callers wait on a lock per key. Across processes, the caller
+holding that lock also takes an advisory fcntl.flock() on a lock file next to
+the entry. The lock file records the pid and host of its holder and is removed
+when the lock is released, so a lock file that is still locked but whose holder
+has exited (e.g. because a forked child inherited its descriptor) can be
+recognized as stale and broken. Where fcntl is unavailable, only callers in
+the same process are coalesced.
+"""
+
+import os
+import socket
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Hashable, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_HOST = socket.gethostname()
+
+
+class KeyLocks:
+    """KeyLocks hands out exclusive locks by key. Lock files are polled while
+    they are held elsewhere, starting every `poll_interval` seconds and backing
+    off to every `max_poll_interval` seconds."""
+
+    def __init__(self, poll_interval: float = 0.01, max_poll_interval: float = 0.5):
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._lock = threading.Lock()
+        # key -> [threading.Lock, number of callers using it]
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key: Hashable, path=None, timeout: Optional[float] = None):
+        """Holds the lock for `key`, and the lock file at `path` if provided.
+        Yields True once both are held, or False if `timeout` seconds passed
+        first; the caller should then proceed without the lock."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            record = self._locks.setdefault(key, [threading.Lock(), 0])
+            record[1] += 1
+        try:
+            if not record[0].acquire(timeout=-1 if timeout is None else timeout):
+                yield False
+                return
+            try:
+                fd = None
+                if path is not None and fcntl is not None:
+                    fd = self._lock_file(os.fspath(path), deadline)
+                    if fd is None:
+                        yield False
+                        return
+                try:
+                    yield True
+                finally:
+                    if fd is not None:
+                        self._unlock_file(os.fspath(path), fd)
+            finally:
+                record[0].release()
+        finally:
+            with self._lock:
+                record[1] -= 1
+                if not record[1]:
+                    del self._locks[key]
+
+    def _lock_file(self, path: str, deadline: Optional[float]) -> Optional[int]:
+        delay = self.poll_interval
+        while True:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                if _break_stale_lock(path):
+                    continue
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                remaining = float('inf') if deadline is None else deadline - time.monotonic()
+                time.sleep(max(0.0, min(delay, remaining)))
+                delay = min(delay * 2, self.max_poll_interval)
+                continue
+            # The file may have been removed, by its previous holder or as a
+            # stale lock, between opening and locking it; if so, the lock is on
+            # a file nobody else will see.
+            if not _same_file(path, fd):
+                os.close(fd)
+                continue
+            os.ftruncate(fd, 0)
+            os.write(fd, f'{os.getpid()} {_HOST}\n'.encode())
+            return fd
+
+    @staticmethod
+    def _unlock_file(path: str, fd: int):
+        try:
+            # Remove the file before unlocking it, so waiters retry on a new file
+            if _same_file(path, fd):
+                os.remove(path)
+        finally:
+            os.close(fd)
+
+
+def _same_file(path: str, fd: int) -> bool:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    fst = os.fstat(fd)
+    return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+
+def _holder_exited(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _break_stale_lock(path: str) -> bool:
+    """Removes the lock file at `path` if it was written by a process on this
+    host that has exited. Returns True if it was removed."""
+    try:
+        with open(path, 'rb') as f:
+            owner = f.read().decode(errors='replace').split()
+            fd = f.fileno()
+            if len(owner) != 2 or not owner[0].isdigit() or owner[1] != _HOST:
+                return False
+            if not _holder_exited(int(owner[0])) or not _same_file(path, fd):
+                return False
+            os.remove(path)
+    except FileNotFoundError:
+        # Released in the meantime
+        return True
+    return True
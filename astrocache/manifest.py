@@ -0,0 +1,195 @@
+"""Precomputed fingerprints of cached functions.
+
+A manifest maps the names of cached functions to their implementation
+fingerprints, as computed when it was built (e.g. by
+`python -m astrocache build-manifest <package>` at deploy time). Functions
+found in a loaded manifest are not inspected at all: their source is neither
+read nor parsed, so they can be cached where the source is unavailable, such
+as in zipapps or bytecode-only installs.
+
+Each entry also records the size and mtime of the source files its fingerprint
+depends on, relative to the manifest's directory where possible. Unless the
+manifest is loaded with `check_files`, they are not looked at.
+
+Alongside the entries, the manifest holds the call graph the fingerprints were
+computed from: for each function reached, the file defining it, the digest of
+its AST and the functions it calls. Comparing it to the current source shows
+which functions changed and which cached functions depend on them (see
+astrocache.diff()).
+"""
+
+import json
+import os
+import threading
+
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+VERSION = 1
+FILENAME = 'astrocache-manifest.json'
+
+
+class ManifestEntry:
+    __slots__ = ('fingerprint', 'root', 'strict', 'files', 'valid')
+
+    def __init__(self, fingerprint: str, root: Optional[str], strict: bool, files: dict):
+        self.fingerprint = fingerprint
+        self.root = root
+        self.strict = strict
+        # path -> (mtime_ns, size)
+        self.files = files
+        # Whether the files are unchanged, once checked
+        self.valid = None
+
+    def as_dict(self) -> dict:
+        return {'fingerprint': self.fingerprint, 'root': self.root, 'strict': self.strict,
+                'files': {path: list(state) for path, state in self.files.items()}}
+
+
+class GraphNode:
+    __slots__ = ('file', 'digest', 'calls')
+
+    def __init__(self, file: Optional[str], digest: Optional[str], calls):
+        self.file = file
+        self.digest = digest
+        # Names of the functions it calls
+        self.calls = list(calls)
+
+    def as_dict(self) -> dict:
+        return {'file': self.file, 'digest': self.digest, 'calls': self.calls}
+
+
+class Manifest:
+    """Manifest holds the fingerprints of cached functions by name. Entries
+    are only used for functions decorated with the same `root` and `strict`
+    as when they were computed. If `check_files`, an entry is only used if
+    the size and mtime of each of its source files are unchanged; they are
+    checked on its first lookup."""
+
+    def __init__(self, directory: Optional[Path] = None, check_files: bool = False):
+        self.directory = Path(directory) if directory is not None else Path.cwd()
+        self.check_files = check_files
+        self.entries: Dict[str, ManifestEntry] = {}
+        self.graph: Dict[str, GraphNode] = {}
+        self._lock = threading.Lock()
+
+    def add(self, function: str, fingerprint: str, root: Optional[str], strict: bool,
+            files=()):
+        """Adds the fingerprint of the function named `function`, which
+        depends on the source files `files`."""
+        states = {}
+        for filename in files:
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            states[self._relative(filename)] = (st.st_mtime_ns, st.st_size)
+        self.entries[function] = ManifestEntry(fingerprint, root, strict, states)
+
+    def add_node(self, function: str, filename, digest: Optional[str], calls=()):
+        """Adds the function named `function`, defined in `filename`, to the
+        call graph, unless it is already there."""
+        if function not in self.graph:
+            file = self._relative(filename) if filename is not None else None
+            self.graph[function] = GraphNode(file, digest, sorted(calls))
+
+    def reachable(self, function: str) -> Dict[str, GraphNode]:
+        """Returns the nodes of the call graph reachable from `function`,
+        including its own, by name."""
+        found = {}
+        pending = [function]
+        while pending:
+            name = pending.pop()
+            node = self.graph.get(name)
+            if node is not None and name not in found:
+                found[name] = node
+                pending.extend(node.calls)
+        return found
+
+    def changed_files(self) -> Dict[str, Optional[tuple]]:
+        """Returns the source files of entries whose size or mtime differs from
+        when the manifest was built, with their state now (None if they are
+        gone). Only these files are read to find out what changed."""
+        changed, unchanged = {}, set()
+        for entry in self.entries.values():
+            for path, state in entry.files.items():
+                if path in changed or path in unchanged:
+                    continue
+                now = self._state(path)
+                if now == tuple(state):
+                    unchanged.add(path)
+                else:
+                    changed[path] = now
+        return changed
+
+    def affected(self, files) -> Dict[str, ManifestEntry]:
+        """Returns the entries whose fingerprint depends on any of `files`."""
+        files = set(files)
+        return {name: entry for name, entry in self.entries.items()
+                if not files.isdisjoint(entry.files)}
+
+    def lookup(self, func: Callable, root: Optional[str], strict: bool) -> Optional[str]:
+        """Returns the fingerprint of `func` if it is in the manifest, or None."""
+        entry = self.entries.get(f'{func.__module__}.{func.__qualname__}')
+        if entry is None or entry.root != root or entry.strict != strict:
+            return None
+        if self.check_files:
+            if entry.valid is None:
+                with self._lock:
+                    entry.valid = all(self._state(path) == tuple(state)
+                                      for path, state in entry.files.items())
+            if not entry.valid:
+                return None
+        return entry.fingerprint
+
+    def _relative(self, filename) -> str:
+        path = Path(filename).resolve()
+        try:
+            return path.relative_to(self.directory.resolve()).as_posix()
+        except ValueError:
+            return str(path)
+
+    def _state(self, path: str):
+        try:
+            st = os.stat(self.directory / path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def dumps(self) -> str:
+        return json.dumps({
+            'version': VERSION,
+            'functions': {name: entry.as_dict() for name, entry in sorted(self.entries.items())},
+            'graph': {name: node.as_dict() for name, node in sorted(self.graph.items())},
+        }, indent=1)
+
+    def save(self, path):
+        Path(path).write_text(self.dumps())
+
+    @classmethod
+    def loads(cls, text: str, directory: Optional[Path] = None,
+              check_files: bool = False) -> 'Manifest':
+        data = json.loads(text)
+        if data.get('version') != VERSION:
+            raise ValueError(f"Unsupported manifest version {data.get('version')!r}")
+        manifest = cls(directory, check_files)
+        for name, entry in data['functions'].items():
+            manifest.entries[name] = ManifestEntry(entry['fingerprint'], entry['root'],
+                                                   entry['strict'], entry['files'])
+        # Manifests built before the call graph was recorded have none
+        for name, node in data.get('graph', {}).items():
+            manifest.graph[name] = GraphNode(node['file'], node['digest'], node['calls'])
+        return manifest
+
+    @classmethod
+    def load(cls, path, check_files: bool = False,
+             directory: Optional[Path] = None) -> 'Manifest':
+        """Reads the manifest at `path`: a path, or a file-like object with
+        read_text() (e.g. from importlib.resources.files(), for manifests
+        inside zipapps). The paths of source files in it are relative to
+        `directory`, by default the one containing it."""
+        if isinstance(path, (str, os.PathLike)):
+            path = Path(path)
+        if directory is None:
+            directory = path.parent if isinstance(path, Path) else None
+        return cls.loads(path.read_text(), directory, check_files)
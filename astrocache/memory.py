@@ -0,0 +1,81 @@
+"""In-process cache tier that keeps recently used values in memory, in front
+of a storage backend.
+
+Hits are answered from a dictionary, without touching the storage or
+unpickling, and return the same object every time. Each value is accounted
+for by the size of its serialized form, which is already known when it is
+written or read from storage.
+"""
+
+import threading
+
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .storage import Key, Storage, Usage
+
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+class MemoryCache:
+    """MemoryCache holds values by storage and Key, evicting the least
+    recently used once they take up more than `max_bytes`."""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        # (id(storage), Key) -> (value, size), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, storage: Storage, key: Key) -> Any:
+        """Returns the value held for `key`, or raises KeyError."""
+        with self._lock:
+            value, _ = self._entries[id(storage), key]
+            self._entries.move_to_end((id(storage), key))
+            return value
+
+    def put(self, storage: Storage, key: Key, value: Any, size: int):
+        """Holds `value`, whose serialized form is `size` bytes long, for `key`."""
+        if size > self.max_bytes:
+            self.discard(storage, key)
+            return
+        with self._lock:
+            old = self._entries.pop((id(storage), key), None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[id(storage), key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def discard(self, storage: Storage, key: Key) -> bool:
+        """Drops the value held for `key`. Returns True if there was one."""
+        with self._lock:
+            old = self._entries.pop((id(storage), key), None)
+            if old is not None:
+                self._bytes -= old[1]
+            return old is not None
+
+    def invalidate(self, storage: Optional[Storage] = None, function: Optional[str] = None,
+                   fingerprint: Optional[str] = None) -> int:
+        """Drops the values held for `storage` (or any storage) produced by
+        `function` and/or `fingerprint`. Returns the number dropped."""
+        with self._lock:
+            matches = [(sid, key) for sid, key in self._entries
+                       if (storage is None or sid == id(storage))
+                       and (function is None or key.function == function)
+                       and (fingerprint is None or key.fingerprint == fingerprint)]
+            for match in matches:
+                self._bytes -= self._entries.pop(match)[1]
+            return len(matches)
+
+    def usage(self) -> Usage:
+        with self._lock:
+            return Usage(len(self._entries), self._bytes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
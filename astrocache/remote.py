@@ -0,0 +1,545 @@
+"""Shared cache tiers, so that hosts can reuse each other's results.
+
+TieredStorage puts a local storage in front of a remote one shared by many
+hosts: a FilesystemStorage on a network filesystem, or an HTTPStorage talking
+to an object-store-like HTTP endpoint. Reads are answered locally if possible,
+and entries fetched from the remote tier are kept locally. Writes go to the
+local tier and are uploaded in the background.
+
+HTTPStorage stores each entry as one object, at <url>/<function>/<fingerprint>/<id>,
+with PUT, GET, HEAD and DELETE. Objects carry a SHA-256 digest of their contents,
+which is checked on download, so corrupt or truncated objects are treated as
+missing. Listing uses GET <url>/?prefix=<prefix>[&delimiter=/], which returns
+a JSON list of {"key", "size", "mtime"} objects, or of common prefixes with a
+delimiter. serve() runs a server implementing this protocol on a local
+directory, as a stand-in for a real object store.
+"""
+
+import hashlib
+import http.client
+import itertools
+import json
+import os
+import queue
+import stat
+import struct
+import tempfile
+import threading
+import time
+import warnings
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from glob import escape as glob_escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from .storage import Entry, Key, Storage, Usage
+
+# digest, number of buffers
+_HEADER = struct.Struct('>32sI')
+_LENGTH = struct.Struct('>Q')
+
+
+def _pack(data: bytes, buffers: Sequence) -> bytes:
+    """Frames `data` and `buffers` as one object, prefixed by its digest."""
+    parts = [memoryview(data)] + [memoryview(b).cast('B') for b in buffers]
+    body = b''.join([struct.pack('>I', len(buffers))]
+                    + [_LENGTH.pack(part.nbytes) for part in parts] + parts)
+    return hashlib.sha256(body).digest() + body
+
+
+def _unpack(obj: bytes) -> Optional[Tuple[bytes, List[memoryview]]]:
+    """Returns (data, buffers) framed by _pack(), or None if `obj` does not
+    match its digest."""
+    if len(obj) < _HEADER.size or hashlib.sha256(memoryview(obj)[32:]).digest() != obj[:32]:
+        return None
+    _, count = _HEADER.unpack_from(obj)
+    offset = _HEADER.size
+    lengths = []
+    for _ in range(count + 1):
+        lengths.append(_LENGTH.unpack_from(obj, offset)[0])
+        offset += _LENGTH.size
+    view = memoryview(obj)
+    parts = []
+    for length in lengths:
+        parts.append(view[offset:offset + length])
+        offset += length
+    return bytes(parts[0]), parts[1:]
+
+
+class _ConnectionPool:
+    """Keeps up to `size` idle keep-alive connections to one host."""
+
+    def __init__(self, url: str, size: int, timeout: float):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL {url!r}; expected http:// or https://")
+        self._connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                  else http.client.HTTPConnection)
+        self._netloc = parts.netloc
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(size)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None):
+        """Returns (status, response body). Retries once on a fresh connection
+        if a pooled one turns out to be closed."""
+        for attempt in range(2):
+            try:
+                conn = self._idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._connection_class(self._netloc, timeout=self.timeout)
+                reused = False
+            try:
+                conn.request(method, path, body=body)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            return response.status, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class HTTPStorage(Storage):
+    """Stores entries as objects under `url`, reusing up to `pool_size`
+    connections. Does not track accesses, so it cannot be evicted from;
+    bound the local tier in front of it instead."""
+
+    def __init__(self, url: str, pool_size: int = 8, timeout: float = 30.0):
+        self.url = url.rstrip('/')
+        self._base = urlsplit(self.url).path
+        self._pool = _ConnectionPool(self.url, pool_size, timeout)
+        # The last object read by each thread, so read_buffers() after read()
+        # of the same key needs no second request
+        self._recent = threading.local()
+
+    def _path(self, key: Key) -> str:
+        return f'{self._base}/{quote(key.function, safe="")}/{key.fingerprint}/{key.id}'
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None,
+                 expect=(200, 201, 204)):
+        status, data = self._pool.request(method, path, body)
+        if status == 404:
+            return None
+        if status not in expect:
+            raise OSError(f"{method} {self.url}{path[len(self._base):]} failed with {status}")
+        return data
+
+    def _get(self, key: Key):
+        recent = getattr(self._recent, 'value', None)
+        if recent is not None and recent[0] == key:
+            return recent[1]
+        obj = self._request('GET', self._path(key))
+        unpacked = _unpack(obj) if obj is not None else None
+        if obj is not None and unpacked is None:
+            warnings.warn(f"Ignoring corrupt object for {key} at {self.url}", RuntimeWarning)
+        self._recent.value = (key, unpacked)
+        return unpacked
+
+    def read(self, key: Key) -> bytes:
+        self._recent.value = None
+        unpacked = self._get(key)
+        if unpacked is None:
+            raise KeyError(key)
+        return unpacked[0]
+
+    def read_buffers(self, key: Key) -> List[memoryview]:
+        unpacked = self._get(key)
+        return unpacked[1] if unpacked is not None else []
+
+    def write(self, key: Key, data: bytes, buffers: Sequence = ()):
+        self._request('PUT', self._path(key), _pack(data, buffers))
+
+    def contains(self, key: Key) -> bool:
+        # Without downloading the object, so its digest is not checked
+        return self._request('HEAD', self._path(key)) is not None
+
+    def delete(self, key: Key) -> bool:
+        return self._request('DELETE', self._path(key)) is not None
+
+    def _list(self, prefix: str, delimiter: bool = False) -> list:
+        query = f'?prefix={quote(prefix, safe="")}' + ('&delimiter=/' if delimiter else '')
+        return json.loads(self._request('GET', f'{self._base}/{query}') or b'[]')
+
+    def _prefix(self, function: Optional[str], fingerprint: Optional[str] = None) -> str:
+        if function is None:
+            return ''
+        return quote(function, safe='') + '/' + (fingerprint + '/' if fingerprint else '')
+
+    def entries(self, function: Optional[str] = None) -> Iterator[Entry]:
+        for obj in self._list(self._prefix(function)):
+            function_, fingerprint, id_ = obj['key'].split('/')
+            yield Entry(Key(unquote(function_), fingerprint, id_), obj['size'], obj['mtime'], 0)
+
+    def invalidate(self, function: Optional[str] = None,
+                   fingerprint: Optional[str] = None) -> int:
+        removed = 0
+        if function is None:
+            functions = self.functions()
+        else:
+            functions = [function]
+        for function in functions:
+            for obj in self._list(self._prefix(function, fingerprint)):
+                if self._request('DELETE', f'{self._base}/{obj["key"]}') is not None:
+                    removed += 1
+        return removed
+
+    def functions(self, prefix: str = '') -> List[str]:
+        names = (unquote(p.rstrip('/')) for p in self._list('', delimiter=True))
+        return sorted(name for name in names if name.startswith(prefix))
+
+    def touch(self, key: Key, accessed: float, hits: int = 1):
+        pass
+
+    def clear(self):
+        self.invalidate()
+
+    def close(self):
+        self._pool.close()
+
+
+class TieredStorage(Storage):
+    """Reads entries from `local`, falling back to `remote` and keeping what
+    it finds locally. Writes go to `local`, and are uploaded to `remote` by up
+    to `workers` background threads (at most `max_pending` uploads are queued
+    before writes wait for them); flush() waits for every upload. Uploads read
+    entries back from `local` rather than keeping copies, so entries evicted
+    from it before their upload starts are not uploaded.
+
+    Limits and eviction apply to the local tier only: entries() and usage()
+    describe it, and evicting an entry removes its local copy. Removing
+    entries with delete() or invalidate() removes them from both tiers, while
+    clear() only clears the local tier.
+
+    Failures of the remote tier are counted in `failed_uploads` and
+    `failed_downloads`, and reported with a warning at most once every
+    `FAILURE_WARNING_INTERVAL` seconds."""
+
+    FAILURE_WARNING_INTERVAL = 60.0
+
+    def __init__(self, local: Storage, remote: Storage, workers: int = 8,
+                 max_pending: int = 1000):
+        self.local = local
+        self.remote = remote
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix='astrocache-remote')
+        self._lock = threading.Lock()
+        self._uploads = set()
+        # Keys being fetched in the background, by prefetch()
+        self._fetches = {}
+        self.failed_uploads = 0
+        self.failed_downloads = 0
+        # When failures were last reported, and how many were not since
+        self._warned = None
+        self._unreported = 0
+
+    def _fetch(self, key: Key) -> bytes:
+        """Copies the entry for `key` from the remote tier to the local one,
+        and returns its data, or raises KeyError. The remote tier being
+        unavailable counts as a miss."""
+        try:
+            data = self.remote.read(key)
+            buffers = self.remote.read_buffers(key)
+        except KeyError:
+            raise
+        except Exception as e:
+            self.failed_downloads += 1
+            self._failed(f"Reading {key} from the remote tier failed: {e}")
+            raise KeyError(key) from None
+        self.local.write(key, data, buffers)
+        return data
+
+    def read(self, key: Key) -> bytes:
+        try:
+            return self.local.read(key)
+        except KeyError:
+            pass
+        with self._lock:
+            fetch = self._fetches.get(key)
+        if fetch is not None:
+            fetch.result()
+            return self.local.read(key)
+        return self._fetch(key)
+
+    def read_buffers(self, key: Key) -> List[memoryview]:
+        return self.local.read_buffers(key)
+
+    def read_many(self, keys: Sequence[Key]) -> Dict[Key, bytes]:
+        found = self.local.read_many(keys)
+        missing = [key for key in keys if key not in found]
+        futures = {key: self._pool.submit(self._fetch, key) for key in missing}
+        for key, future in futures.items():
+            try:
+                found[key] = future.result()
+            except KeyError:
+                continue
+        return found
+
+    def prefetch(self, keys: Iterable[Key]):
+        """Starts copying the entries for `keys` from the remote tier to the
+        local one in the background, so that reading them later is local."""
+        for key in keys:
+            if self.local.contains(key):
+                continue
+            with self._lock:
+                if key in self._fetches:
+                    continue
+                future = self._pool.submit(self._fetch, key)
+                self._fetches[key] = future
+            future.add_done_callback(lambda _, key=key: self._forget_fetch(key))
+
+    def _forget_fetch(self, key: Key):
+        with self._lock:
+            self._fetches.pop(key, None)
+
+    def write(self, key: Key, data: bytes, buffers: Sequence = ()):
+        self.local.write(key, data, buffers)
+        self._upload([key])
+
+    def write_many(self, records: Iterable[Tuple[Key, bytes, Sequence]]):
+        records = list(records)
+        self.local.write_many(records)
+        self._upload([key for key, _, _ in records])
+
+    def _upload(self, keys: List[Key]):
+        with self._lock:
+            pending = list(self._uploads) if len(self._uploads) >= self.max_pending else ()
+        if pending:
+            wait(pending)
+        future = self._pool.submit(self._copy_to_remote, keys)
+        with self._lock:
+            self._uploads.add(future)
+        future.add_done_callback(self._uploaded)
+
+    def _copy_to_remote(self, keys: List[Key]):
+        """Uploads the local entries for `keys` one at a time, so that at most
+        one of them is held in memory per upload thread."""
+        for key in keys:
+            try:
+                data = self.local.read(key)
+            except KeyError:
+                # Evicted or deleted before it could be uploaded
+                continue
+            self.remote.write(key, data, self.local.read_buffers(key))
+
+    def _uploaded(self, future):
+        with self._lock:
+            self._uploads.discard(future)
+        if future.exception() is not None:
+            self.failed_uploads += 1
+            self._failed(f"Upload to the remote tier failed: {future.exception()}")
+
+    def _failed(self, message: str):
+        """Warns with `message`, unless failures were reported less than
+        FAILURE_WARNING_INTERVAL seconds ago, in which case it is counted
+        towards the next warning."""
+        with self._lock:
+            now = time.monotonic()
+            if self._warned is not None and now - self._warned < self.FAILURE_WARNING_INTERVAL:
+                self._unreported += 1
+                return
+            self._warned, unreported, self._unreported = now, self._unreported, 0
+        if unreported:
+            message += f" ({unreported} other failures since the last warning)"
+        warnings.warn(message, RuntimeWarning)
+
+    def contains(self, key: Key) -> bool:
+        if self.local.contains(key):
+            return True
+        try:
+            return self.remote.contains(key)
+        except (OSError, http.client.HTTPException):
+            # As in read(), the remote tier being unavailable counts as a miss
+            return False
+
+    def delete(self, key: Key) -> bool:
+        self._wait_for_uploads()
+        return self.remote.delete(key) | self.local.delete(key)
+
+    def evict(self, key: Key) -> bool:
+        return self.local.delete(key)
+
+    def invalidate(self, function: Optional[str] = None,
+                   fingerprint: Optional[str] = None) -> int:
+        self._wait_for_uploads()
+        local = self.local.invalidate(function, fingerprint)
+        return max(local, self.remote.invalidate(function, fingerprint))
+
+    def entries(self, function: Optional[str] = None) -> Iterator[Entry]:
+        return self.local.entries(function)
+
+    def keys(self, function: Optional[str] = None) -> Iterator[Key]:
+        return self.local.keys(function)
+
+    def fingerprints(self) -> Iterator[Tuple[str, str]]:
+        seen = set()
+        for pair in itertools.chain(self.local.fingerprints(), self.remote.fingerprints()):
+            if pair not in seen:
+                seen.add(pair)
+                yield pair
+
+    def functions(self, prefix: str = '') -> List[str]:
+        return sorted(set(self.local.functions(prefix)) | set(self.remote.functions(prefix)))
+
+    def touch(self, key: Key, accessed: float, hits: int = 1):
+        self.local.touch(key, accessed, hits)
+
+    def lock_path(self, key: Key) -> Optional[Path]:
+        return self.local.lock_path(key)
+
+    def usage(self, function: Optional[str] = None) -> Usage:
+        return self.local.usage(function)
+
+    def victims(self, function: Optional[str] = None, policy: str = 'lru',
+                count: int = 100) -> List[Entry]:
+        return self.local.victims(function, policy, count)
+
+    def clear(self):
+        self.local.clear()
+
+    def sweep(self) -> int:
+        return self.local.sweep() + self.remote.sweep()
+
+    def _wait_for_uploads(self):
+        with self._lock:
+            pending = list(self._uploads)
+        wait(pending)
+
+    def flush(self):
+        self._wait_for_uploads()
+        self.local.flush()
+        self.remote.flush()
+
+    def close(self):
+        self.flush()
+        self.local.close()
+        self.remote.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves objects stored as files under `server.directory`."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _file(self) -> Optional[Path]:
+        parts = urlsplit(self.path).path.strip('/').split('/')
+        if len(parts) != 3 or any(part in ('', '.', '..') for part in parts):
+            return None
+        return self.server.directory.joinpath(*parts)
+
+    def _respond(self, status: int, body: bytes = b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        if 'prefix' in query or urlsplit(self.path).path.strip('/') == '':
+            return self._list(query.get('prefix', [''])[0], 'delimiter' in query)
+        path = self._file()
+        try:
+            with open(path, 'rb') as f:
+                return self._respond(200, f.read())
+        except (OSError, TypeError):
+            return self._respond(404)
+
+    def do_HEAD(self):
+        path = self._file()
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError):
+            return self._respond(404)
+        if not stat.S_ISREG(st.st_mode):
+            return self._respond(404)
+        self.send_response(200)
+        self.send_header('Content-Length', str(st.st_size))
+        self.end_headers()
+
+    def do_PUT(self):
+        path = self._file()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if path is None:
+            return self._respond(400)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+        self._respond(201)
+
+    def do_DELETE(self):
+        path = self._file()
+        try:
+            os.remove(path)
+        except (OSError, TypeError):
+            return self._respond(404)
+        # Remove the fingerprint and function directories once empty, so that
+        # listings only show functions that have objects
+        for directory in (path.parent, path.parent.parent):
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+        self._respond(204)
+
+    def _list(self, prefix: str, delimiter: bool):
+        root = self.server.directory
+        if delimiter:
+            names = sorted(p.name + '/' for p in root.iterdir()
+                           if p.is_dir() and (p.name + '/').startswith(prefix))
+            return self._respond(200, json.dumps(names).encode())
+        objects = []
+        # Only descend into the directories the prefix selects
+        top = prefix.split('/')[0]
+        for function_dir in ([root / top] if '/' in prefix else root.glob(f'{glob_escape(top)}*')):
+            for path in function_dir.glob('*/*'):
+                key = path.relative_to(root).as_posix()
+                if path.name.startswith('.tmp') or not key.startswith(prefix):
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                objects.append({'key': key, 'size': st.st_size, 'mtime': st.st_mtime})
+        self._respond(200, json.dumps(objects).encode())
+
+
+def serve(directory, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Starts serving the objects of HTTPStorage from `directory`, in a
+    background thread, and returns the server; its URL is
+    f'http://{host}:{server.server_port}'. Call server.shutdown() to stop it.
+    Meant for tests and small deployments, not as a production object store."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.directory = Path(directory)
+    server.directory.mkdir(parents=True, exist_ok=True)
+    server.thread = threading.Thread(target=server.serve_forever, name='astrocache-server',
+                                     daemon=True)
+    server.thread.start()
+    return server
@@ -0,0 +1,89 @@
+"""Serializers convert results to and from the data stored in cache entries.
+
+Besides the entry's data, a serializer may produce out-of-band buffers, which
+are stored separately and handed back to it when the entry is read. With
+OutOfBandPickleSerializer, large buffers inside a result (such as the contents
+of NumPy arrays or Arrow tables) are stored this way using pickle protocol 5.
+FilesystemStorage stores each buffer in its own file and memory-maps it
+read-only when read, so a hit maps the buffers rather than reading or copying
+them, and the result's arrays are read-only views of the mapped files.
+"""
+
+import pickle
+
+from typing import Any, List, Sequence, Tuple, Union
+
+
+class Serializer:
+    """Serializer is the interface implemented by serializers."""
+
+    # Whether dumps() may return out-of-band buffers, which loads() expects back
+    out_of_band = False
+
+    def dumps(self, value: Any) -> Tuple[bytes, List[memoryview]]:
+        """Returns the data and out-of-band buffers representing `value`."""
+        raise NotImplementedError
+
+    def loads(self, data: bytes, buffers: Sequence[memoryview] = ()) -> Any:
+        """Returns the value represented by `data` and `buffers`."""
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    """Pickles values in-band, i.e. entirely into the entry's data."""
+
+    def __init__(self, protocol: int = pickle.DEFAULT_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, value: Any) -> Tuple[bytes, List[memoryview]]:
+        return pickle.dumps(value, protocol=self.protocol), []
+
+    def loads(self, data: bytes, buffers: Sequence[memoryview] = ()) -> Any:
+        return pickle.loads(data)
+
+
+class OutOfBandPickleSerializer(Serializer):
+    """Pickles values with protocol 5, storing contiguous buffers of at least
+    `min_size` bytes out-of-band. Values whose types do not support protocol 5
+    buffers are pickled in-band as usual."""
+
+    out_of_band = True
+
+    def __init__(self, min_size: int = 1 << 16):
+        self.min_size = min_size
+
+    def dumps(self, value: Any) -> Tuple[bytes, List[memoryview]]:
+        buffers = []
+
+        def buffer_callback(buffer: pickle.PickleBuffer):
+            try:
+                view = buffer.raw()
+            except BufferError:
+                # Not contiguous
+                return True
+            if view.nbytes < self.min_size:
+                return True
+            buffers.append(view)
+            return False
+
+        return pickle.dumps(value, protocol=5, buffer_callback=buffer_callback), buffers
+
+    def loads(self, data: bytes, buffers: Sequence[memoryview] = ()) -> Any:
+        return pickle.loads(data, buffers=buffers)
+
+
+SERIALIZERS = {
+    'pickle': PickleSerializer(),
+    'pickle5': OutOfBandPickleSerializer(),
+}
+
+
+def get_serializer(serializer: Union[str, Serializer]) -> Serializer:
+    """Returns `serializer`, or the serializer it names."""
+    if isinstance(serializer, Serializer):
+        return serializer
+    try:
+        return SERIALIZERS[serializer]
+    except KeyError:
+        raise ValueError(f"Unknown serializer {serializer!r}; "
+                         f"expected one of {sorted(SERIALIZERS)}") from None
@@ -0,0 +1,1099 @@
+"""Storage backends for cache entries.
+
+A backend stores opaque byte strings addressed by a Key, which records the
+function and implementation fingerprint that produced an entry alongside its
+cache id. Keeping the function and fingerprint next to each entry lets
+backends invalidate everything a function (or one version of it) produced
+without touching unrelated entries.
+"""
+
+import atexit
+import hashlib
+import heapq
+import itertools
+import mmap
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+
+class Key(NamedTuple):
+    """Key identifies a cache entry."""
+    function: str
+    fingerprint: str
+    id: str
+
+
+class Entry(NamedTuple):
+    """Entry describes a stored entry without loading it."""
+    key: Key
+    size: int
+    accessed: float
+    hits: int
+
+
+class Usage(NamedTuple):
+    entries: int
+    bytes: int
+
+
+# Sort keys for the entries evicted first under each eviction policy
+EVICTION_POLICIES = {
+    'lru': lambda entry: entry.accessed,
+    'lfu': lambda entry: (entry.hits, entry.accessed),
+}
+
+
+@contextmanager
+def _atomic_writer(path, mode='w'):
+    """Yields temp file and moves it to specified path on context exit. Creates
+    destination directory if it doesn't already exist."""
+    if 'a' in mode:
+        raise ValueError('Cannot append atomically')
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    f = tempfile.NamedTemporaryFile(mode=mode, dir=parent, delete=False)
+    try:
+        try:
+            yield f
+        finally:
+            f.close()
+        os.rename(f.name, path)
+    except Exception:
+        os.remove(f.name)
+        raise
+
+
+def _digest(data) -> str:
+    """Returns the content address of `data`."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class Storage:
+    """Storage is the interface implemented by cache storage backends."""
+
+    def read(self, key: Key) -> bytes:
+        """Returns the data stored for `key`, or raises KeyError."""
+        raise NotImplementedError
+
+    def write(self, key: Key, data: bytes, buffers: Sequence = ()):
+        """Stores `data`, and any out-of-band `buffers` (objects supporting the
+        buffer protocol), for `key`, replacing any existing entry."""
+        raise NotImplementedError
+
+    def read_buffers(self, key: Key) -> List[memoryview]:
+        """Returns the out-of-band buffers stored for `key`, in order."""
+        return []
+
+    def read_many(self, keys: Sequence[Key]) -> Dict[Key, bytes]:
+        """Returns {key: data} for each of `keys` that has an entry."""
+        found = {}
+        for key in keys:
+            try:
+                found[key] = self.read(key)
+            except KeyError:
+                continue
+        return found
+
+    def write_many(self, records: Iterable[Tuple[Key, bytes, Sequence]]):
+        """Stores each (key, data, buffers) record, as write() would."""
+        for key, data, buffers in records:
+            self.write(key, data, buffers)
+
+    def contains(self, key: Key) -> bool:
+        try:
+            self.read(key)
+        except KeyError:
+            return False
+        return True
+
+    def delete(self, key: Key) -> bool:
+        """Removes the entry for `key`. Returns True if it existed."""
+        raise NotImplementedError
+
+    def evict(self, key: Key) -> bool:
+        """Removes the entry for `key` to enforce a size limit. Returns True
+        if it existed."""
+        return self.delete(key)
+
+    def invalidate(self, function: Optional[str] = None,
+                   fingerprint: Optional[str] = None) -> int:
+        """Removes every entry produced by `function` and/or `fingerprint`.
+        Returns the number of entries removed."""
+        raise NotImplementedError
+
+    def keys(self, function: Optional[str] = None) -> Iterator[Key]:
+        """Yields the key of every stored entry, or of every entry produced by
+        `function`."""
+        for entry in self.entries(function):
+            yield entry.key
+
+    def entries(self, function: Optional[str] = None) -> Iterator[Entry]:
+        """Yields the metadata of every stored entry, or of every entry
+        produced by `function`."""
+        raise NotImplementedError
+
+    def fingerprints(self) -> Iterator[Tuple[str, str]]:
+        """Yields each distinct (function, fingerprint) pair that has entries."""
+        seen = set()
+        for key in self.keys():
+            if (key.function, key.fingerprint) not in seen:
+                seen.add((key.function, key.fingerprint))
+                yield key.function, key.fingerprint
+
+    def functions(self, prefix: str = '') -> List[str]:
+        """Returns the names of the functions that have entries and start with
+        `prefix`."""
+        return sorted({function for function, _ in self.fingerprints()
+                       if function.startswith(prefix)})
+
+    def touch(self, key: Key, accessed: float, hits: int = 1):
+        """Records `hits` reads of `key`, the last of them at time `accessed`."""
+        raise NotImplementedError
+
+    def lock_path(self, key: Key) -> Optional[Path]:
+        """Returns the path of the file used to lock `key` across processes,
+        or None if this backend has no place for lock files."""
+        return None
+
+    def usage(self, function: Optional[str] = None) -> Usage:
+        """Returns the number and total size of stored entries, or of entries
+        produced by `function`."""
+        entries = size = 0
+        for entry in self.entries(function):
+            entries += 1
+            size += entry.size
+        return Usage(entries, size)
+
+    def victims(self, function: Optional[str] = None, policy: str = 'lru',
+                count: int = 100) -> List[Entry]:
+        """Returns up to `count` entries (produced by `function`, if provided)
+        in the order `policy` would evict them."""
+        return heapq.nsmallest(count, self.entries(function), key=EVICTION_POLICIES[policy])
+
+    def clear(self):
+        """Removes every entry."""
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Removes stored data that no entry refers to any more, e.g. because
+        entries referring to it were removed concurrently. Returns the number
+        of bytes freed."""
+        return 0
+
+    def flush(self):
+        """Makes pending writes durable."""
+
+    def close(self):
+        self.flush()
+
+
+class FilesystemStorage(Storage):
+    """Stores each entry as its own file. Entries are laid out by function and
+    fingerprint, and sharded by the first two characters of their id:
+
+        <path>/<function>/<fingerprint>/<id[:2]>/<id>
+
+    Identical data of at least `dedup_min_size` bytes (smaller files would
+    take up a filesystem block each anyway) is stored once: each entry is a
+    hard link to a blob named by the size and digest of its data, so the
+    number of links to a blob counts its references. Each blob is also
+    indexed by its inode with a symbolic link (which does not add to its
+    link count), so that when the last entry linking to a blob is removed,
+    the blob is found and removed too without listing other blobs. Where hard
+    links are not supported, entries hold their data themselves.
+
+        <path>/.blobs/<size>/<digest>
+        <path>/.blobs/.inodes/<inode> -> ../<size>/<digest>
+
+    Writes are atomic: entries are linked (or written) under a temporary name
+    and renamed. Out-of-band buffers are stored the same way as separate files
+    next to their entry (`.<id>.<n>.buf`), written before it, and are
+    memory-mapped read-only when read, so reading them copies nothing. Each
+    entry's mtime records when it, or an entry with identical data, was last
+    read or written, and the number of times it was read is kept in a file
+    next to it (`.<id>.hits`) once it has been read.
+
+    usage() and victims() answer from memory, so that enforcing limits does
+    not walk the tree every time: usage() from running totals of each
+    function's entries, and victims() from a short list of the entries to
+    evict first, found by walking the tree once per `VICTIM_BATCHES` batches
+    of victims. Both are kept up to date by this instance's writes, removals
+    and touches, and listed again after `listing_ttl` seconds to pick up
+    changes made by other processes. Listing does not block other calls:
+    changes made while listing are tracked, and counted once each whether or
+    not the listing saw them."""
+
+    # Batches of victims found per walk of the tree
+    VICTIM_BATCHES = 10
+
+    def __init__(self, path, dedup_min_size: int = 4096, listing_ttl: float = 60.0):
+        self.path = Path(path)
+        self.dedup_min_size = dedup_min_size
+        self.listing_ttl = listing_ttl
+        self._lock = threading.Lock()
+        # Held while listing the totals of a function, so that it is listed once
+        self._listing_lock = threading.Lock()
+        # function -> _Totals of its entries, once usage() needed them
+        self._totals = {}
+        # function -> _Listing of its totals in progress
+        self._listings = {}
+        # (function or None, policy) -> _Victims, once victims() needed them
+        self._victims = {}
+        # id(keys) -> (function or None, keys changed during a victims() listing)
+        self._victim_listings = {}
+
+    def _function_dir(self, function: str):
+        return self.path / quote(function, safe='')
+
+    def _entry_path(self, key: Key):
+        return self._function_dir(key.function) / key.fingerprint / key.id[:2] / key.id
+
+    def _buffer_path(self, key: Key, index: int):
+        return self._entry_path(key).with_name(f'.{key.id}.{index}.buf')
+
+    def _hits_path(self, key: Key):
+        return self._entry_path(key).with_name(f'.{key.id}.hits')
+
+    @staticmethod
+    def _read_hits(path) -> int:
+        try:
+            with open(path) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _blob_dir(self, size: int):
+        return self.path / '.blobs' / str(size)
+
+    def _inode_path(self, inode: int):
+        return self.path / '.blobs' / '.inodes' / str(inode)
+
+    def _index(self, blob: Path):
+        """Indexes `blob` by its inode."""
+        index = self._inode_path(os.stat(blob).st_ino)
+        os.makedirs(index.parent, exist_ok=True)
+        tmp = index.with_name(f'.{index.name}.{uuid.uuid4().hex}.tmp')
+        os.symlink(f'../{blob.parent.name}/{blob.name}', tmp)
+        os.replace(tmp, index)
+
+    def read(self, key: Key) -> bytes:
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def read_buffers(self, key: Key) -> List[memoryview]:
+        buffers = []
+        for index in itertools.count():
+            try:
+                f = open(self._buffer_path(key, index), 'rb')
+            except FileNotFoundError:
+                return buffers
+            with f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    # Empty files cannot be mapped
+                    buffers.append(memoryview(b''))
+                else:
+                    buffers.append(memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)))
+
+    def write(self, key: Key, data: bytes, buffers: Sequence = ()):
+        old_size = self._size(key)
+        # The entry is written last, so it is never visible without its buffers
+        for index, buffer in enumerate(buffers):
+            self._store(self._buffer_path(key, index), buffer)
+        self._store(self._entry_path(key), data)
+        self._remove_buffers(key, start=len(buffers))
+        size = memoryview(data).nbytes + sum(memoryview(b).nbytes for b in buffers)
+        self._changed(key, int(old_size is None), size - (old_size or 0))
+
+    def _store(self, path: Path, data):
+        """Atomically makes `path` hold `data`, replacing the file there."""
+        data = memoryview(data)
+        old = self._stat(path)
+        if (data.nbytes < self.dedup_min_size
+                or not self._link(self._blob_dir(data.nbytes) / _digest(data), path, data)):
+            with _atomic_writer(path, 'wb') as f:
+                f.write(data)
+        if old is not None:
+            new = self._stat(path)
+            if new is None or new.st_ino != old.st_ino:
+                self._release(old)
+
+    def _link(self, blob: Path, path: Path, data: memoryview) -> bool:
+        """Makes `path` a link to `blob`, writing `data` to `blob` first if it
+        does not exist. Returns False if hard links are not supported."""
+        os.makedirs(path.parent, exist_ok=True)
+        for _ in range(3):
+            if not blob.exists():
+                with _atomic_writer(blob, 'wb') as f:
+                    f.write(data)
+                try:
+                    self._index(blob)
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    # Without symbolic links, the blob is found by scanning
+                    pass
+            try:
+                if os.path.samestat(os.stat(path), os.stat(blob)):
+                    # Renaming a link over another link to the same file
+                    # would leave both in place
+                    return True
+            except FileNotFoundError:
+                pass
+            tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+            try:
+                os.link(blob, tmp)
+            except FileNotFoundError:
+                # Removed along with its last entry in the meantime
+                continue
+            except OSError:
+                return False
+            os.replace(tmp, path)
+            return True
+        return False
+
+    def _release(self, st: os.stat_result):
+        """Removes the blob linked to by a file that had status `st` and has
+        been removed, if that file was the blob's last other link."""
+        if st.st_nlink != 2:
+            return
+        blob_dir = self._blob_dir(st.st_size)
+        index = self._inode_path(st.st_ino)
+        try:
+            blob = index.parent / os.readlink(index)
+            if os.stat(blob).st_ino != st.st_ino:
+                raise FileNotFoundError(blob)
+            os.remove(blob)
+            os.remove(index)
+        except OSError:
+            # Not indexed (or the index is outdated): look for it by inode
+            try:
+                for blob in os.scandir(blob_dir):
+                    if blob.inode() == st.st_ino:
+                        os.remove(blob.path)
+                        break
+            except OSError:
+                pass
+        try:
+            os.rmdir(blob_dir)
+        except OSError:
+            # Other blobs of the same size remain
+            pass
+
+    def _unlink(self, path: Path) -> bool:
+        """Removes the file at `path`, and its blob if nothing else links to it.
+        Returns True if the file existed."""
+        st = self._stat(path)
+        if st is None:
+            return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        self._release(st)
+        return True
+
+    @staticmethod
+    def _stat(path) -> Optional[os.stat_result]:
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def _remove_buffers(self, key: Key, start: int = 0):
+        for index in itertools.count(start):
+            if not self._unlink(self._buffer_path(key, index)):
+                return
+
+    def contains(self, key: Key) -> bool:
+        return os.path.isfile(self._entry_path(key))
+
+    def lock_path(self, key: Key) -> Optional[Path]:
+        # Hidden, so that it is not mistaken for an entry
+        return self._entry_path(key).with_name(f'.{key.id}.lock')
+
+    def delete(self, key: Key) -> bool:
+        size = self._size(key)
+        try:
+            os.remove(self._hits_path(key))
+        except FileNotFoundError:
+            pass
+        try:
+            removed = self._unlink(self._entry_path(key))
+        finally:
+            self._remove_buffers(key)
+        if removed and size is not None:
+            self._changed(key, -1, -size)
+        else:
+            self._changed(key)
+        return removed
+
+    def invalidate(self, function: Optional[str] = None,
+                   fingerprint: Optional[str] = None) -> int:
+        # Listed again when next needed
+        with self._lock:
+            for name in list(self._totals):
+                if function is None or name == function:
+                    del self._totals[name]
+            for name, listing in self._listings.items():
+                if function is None or name == function:
+                    listing.invalid = True
+            for name, policy in list(self._victims):
+                if function is None or name in (None, function):
+                    del self._victims[name, policy]
+        if function is not None:
+            function_dirs = [self._function_dir(function)]
+        else:
+            function_dirs = self._subdirs(self.path)
+        removed = 0
+        for function_dir in function_dirs:
+            if fingerprint is not None:
+                fingerprint_dirs = [function_dir / fingerprint]
+            else:
+                fingerprint_dirs = self._subdirs(function_dir)
+            for fingerprint_dir in fingerprint_dirs:
+                for shard_dir in self._subdirs(fingerprint_dir):
+                    for entry in os.scandir(shard_dir):
+                        is_entry = entry.name.startswith(shard_dir.name)
+                        if (is_entry or entry.name.endswith('.buf')) and self._unlink(entry.path):
+                            removed += is_entry
+                shutil.rmtree(fingerprint_dir, ignore_errors=True)
+            if fingerprint is None:
+                shutil.rmtree(function_dir, ignore_errors=True)
+        return removed
+
+    def _shards(self, function: Optional[str] = None) -> Iterator[Tuple[str, str, Path]]:
+        """Yields (function, fingerprint, shard directory) for every shard."""
+        if function is None:
+            function_dirs = self._subdirs(self.path)
+        else:
+            function_dirs = [self._function_dir(function)]
+        for function_dir in function_dirs:
+            for fingerprint_dir in self._subdirs(function_dir):
+                for shard_dir in self._subdirs(fingerprint_dir):
+                    yield unquote(function_dir.name), fingerprint_dir.name, shard_dir
+
+    def keys(self, function: Optional[str] = None) -> Iterator[Key]:
+        for function, fingerprint, shard_dir in self._shards(function):
+            for entry in os.scandir(shard_dir):
+                if entry.is_file() and entry.name.startswith(shard_dir.name):
+                    yield Key(function, fingerprint, entry.name)
+
+    def fingerprints(self) -> Iterator[Tuple[str, str]]:
+        for function_dir in self._subdirs(self.path):
+            for fingerprint_dir in self._subdirs(function_dir):
+                yield unquote(function_dir.name), fingerprint_dir.name
+
+    def functions(self, prefix: str = '') -> List[str]:
+        # Only the function directories are listed, not their entries
+        functions = (unquote(function_dir.name) for function_dir in self._subdirs(self.path))
+        return sorted(function for function in functions if function.startswith(prefix))
+
+    def entries(self, function: Optional[str] = None) -> Iterator[Entry]:
+        for function, fingerprint, shard_dir in self._shards(function):
+            yield from self._shard_entries(function, fingerprint, shard_dir)
+
+    def _shard_entries(self, function: str, fingerprint: str, shard_dir: Path) -> List[Entry]:
+        stats, buffer_bytes, hits = [], {}, {}
+        for entry in os.scandir(shard_dir):
+            try:
+                if entry.name.startswith(shard_dir.name):
+                    stats.append((entry.name, entry.stat()))
+                elif entry.name.endswith('.buf'):
+                    id_ = entry.name[1:].split('.', 1)[0]
+                    buffer_bytes[id_] = buffer_bytes.get(id_, 0) + entry.stat().st_size
+                elif entry.name.endswith('.hits'):
+                    hits[entry.name[1:].split('.', 1)[0]] = self._read_hits(entry.path)
+            except FileNotFoundError:
+                continue
+        return [Entry(Key(function, fingerprint, id_), st.st_size + buffer_bytes.get(id_, 0),
+                      st.st_mtime, hits.get(id_, 0))
+                for id_, st in stats]
+
+    def touch(self, key: Key, accessed: float, hits: int = 1):
+        try:
+            os.utime(self._entry_path(key), (accessed, accessed))
+        except FileNotFoundError:
+            return
+        # Just read, so no longer among the first to evict
+        self._changed(key)
+        if hits:
+            # Concurrent touches of the same entry may lose some hits
+            path = self._hits_path(key)
+            total = self._read_hits(path) + hits
+            try:
+                with _atomic_writer(path) as f:
+                    f.write(str(total))
+            except FileNotFoundError:
+                # Removed in the meantime
+                pass
+
+    def _size(self, key: Key) -> Optional[int]:
+        """Returns the size of the entry for `key` and its buffers, or None if
+        there is no entry."""
+        st = self._stat(self._entry_path(key))
+        if st is None:
+            return None
+        size = st.st_size
+        for index in itertools.count():
+            st = self._stat(self._buffer_path(key, index))
+            if st is None:
+                return size
+            size += st.st_size
+
+    def _changed(self, key: Key, entries: int = 0, size: int = 0):
+        """Records that the entry for `key` was just written, read or removed,
+        changing the number and size of entries by `entries` and `size`."""
+        with self._lock:
+            totals = self._totals.get(key.function)
+            if totals is not None:
+                totals.add(entries, size)
+            listing = self._listings.get(key.function)
+            if listing is not None:
+                shard_dir = self._entry_path(key).parent
+                if shard_dir == listing.shard_dir:
+                    # It may or may not have been seen; listed again at the end of the shard
+                    listing.changed.add(key)
+                elif shard_dir not in listing.shard_dirs:
+                    # Listed already, or in a shard created since listing started
+                    listing.totals.add(entries, size)
+            for (function, _), victims in self._victims.items():
+                if function in (None, key.function):
+                    victims.entries.pop(key, None)
+            for function, changed in self._victim_listings.values():
+                if function in (None, key.function):
+                    changed.add(key)
+
+    def _expired(self, listed: float) -> bool:
+        return time.monotonic() - listed > self.listing_ttl
+
+    def usage(self, function: Optional[str] = None) -> Usage:
+        functions = self.functions() if function is None else [function]
+        entries = size = 0
+        for function in functions:
+            totals = self._totals.get(function)
+            if totals is None or self._expired(totals.listed):
+                totals = self._list_totals(function)
+            entries += totals.entries
+            size += totals.bytes
+        return Usage(entries, size)
+
+    def _list_totals(self, function: str) -> '_Totals':
+        """Lists the entries of `function` shard by shard, without the lock
+        held, and swaps in their totals."""
+        with self._listing_lock:
+            totals = self._totals.get(function)
+            if totals is not None and not self._expired(totals.listed):
+                # Listed by another thread in the meantime
+                return totals
+            shards = list(self._shards(function))
+            listing = _Listing(shard_dir for _, _, shard_dir in shards)
+            with self._lock:
+                self._listings[function] = listing
+            try:
+                for function, fingerprint, shard_dir in shards:
+                    with self._lock:
+                        listing.shard_dirs.discard(shard_dir)
+                        listing.shard_dir = shard_dir
+                    sizes = {entry.key: entry.size
+                             for entry in self._shard_entries(function, fingerprint, shard_dir)}
+                    with self._lock:
+                        for key in listing.changed:
+                            sizes[key] = self._size(key)
+                        sizes = [size for size in sizes.values() if size is not None]
+                        listing.totals.add(len(sizes), sum(sizes))
+                        listing.shard_dir = None
+                        listing.changed.clear()
+                with self._lock:
+                    if not listing.invalid:
+                        self._totals[function] = listing.totals
+            finally:
+                with self._lock:
+                    del self._listings[function]
+            return listing.totals
+
+    def victims(self, function: Optional[str] = None, policy: str = 'lru',
+                count: int = 100) -> List[Entry]:
+        victims = self._victims.get((function, policy))
+        if victims is None or not victims.entries or self._expired(victims.listed):
+            # Listed without the lock held, less the entries changed meanwhile
+            changed = set()
+            with self._lock:
+                self._victim_listings[id(changed)] = function, changed
+            try:
+                entries = heapq.nsmallest(count * self.VICTIM_BATCHES, self.entries(function),
+                                          key=EVICTION_POLICIES[policy])
+            finally:
+                with self._lock:
+                    del self._victim_listings[id(changed)]
+            with self._lock:
+                victims = _Victims(entry for entry in entries if entry.key not in changed)
+                self._victims[function, policy] = victims
+        with self._lock:
+            return list(itertools.islice(victims.entries.values(), count))
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+            self._victims.clear()
+            for listing in self._listings.values():
+                listing.invalid = True
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+
+    def sweep(self) -> int:
+        freed = 0
+        for blob_dir in self._subdirs(self.path / '.blobs'):
+            for blob in os.scandir(blob_dir):
+                try:
+                    # Skip blobs still being written
+                    if len(blob.name) == 32 and blob.stat().st_nlink == 1:
+                        os.remove(blob.path)
+                        freed += int(blob_dir.name)
+                except FileNotFoundError:
+                    continue
+            try:
+                os.rmdir(blob_dir)
+            except OSError:
+                pass
+        # Index links whose blob is gone
+        try:
+            for index in os.scandir(self.path / '.blobs' / '.inodes'):
+                if index.is_symlink() and not os.path.exists(index.path):
+                    os.remove(index.path)
+        except FileNotFoundError:
+            pass
+        return freed
+
+    @staticmethod
+    def _subdirs(path):
+        # Hidden directories, such as .blobs, hold no entries
+        try:
+            return [Path(e.path) for e in os.scandir(path)
+                    if e.is_dir() and not e.name.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+
+class _Totals:
+    """The number and total size of the entries of one function in a
+    FilesystemStorage, as listed at `listed` (a time.monotonic() timestamp)
+    and updated since."""
+
+    def __init__(self):
+        self.listed = time.monotonic()
+        self.entries = self.bytes = 0
+
+    def add(self, entries: int, size: int):
+        self.entries += entries
+        self.bytes += size
+
+
+class _Listing:
+    """A listing of the totals of one function of a FilesystemStorage in
+    progress: the shards still to list, the one being listed and the entries
+    changed in it since it started."""
+
+    def __init__(self, shard_dirs: Iterable[Path]):
+        self.totals = _Totals()
+        self.shard_dirs = set(shard_dirs)
+        self.shard_dir = None
+        self.changed = set()
+        # Set when the entries were invalidated while listing
+        self.invalid = False
+
+
+class _Victims:
+    """The entries of a FilesystemStorage to evict first, in order, as listed
+    at `listed` (a time.monotonic() timestamp), less those written, read or
+    removed since."""
+
+    def __init__(self, entries: Iterable[Entry]):
+        self.listed = time.monotonic()
+        self.entries = {entry.key: entry for entry in entries}
+
+
+class SQLiteStorage(Storage):
+    """Stores every entry in a single SQLite database, indexed by function and
+    id, and by function and fingerprint. Like the directories of
+    FilesystemStorage, the function is part of an entry's identity.
+
+    The database runs in WAL mode so readers never block on writers. Writes and
+    touches are queued in memory and committed in batches, each in one short
+    transaction, once `batch_size` of them are pending or `commit_interval`
+    seconds after the first of them, whichever comes first; the database is
+    only locked while a batch is written, not between writes. Pending writes
+    are visible to reads made through the same instance, and are committed at
+    exit. Removals commit the pending writes and then take effect at once.
+
+    Entries and out-of-band buffers refer to their data by digest, and
+    identical data is stored once in the blobs table, which counts references
+    to each blob; triggers remove blobs once nothing refers to them. Buffers
+    are copied when read."""
+
+    SCHEMA_VERSION = 5
+
+    def __init__(self, path, batch_size: int = 100, commit_interval: float = 1.0,
+                 timeout: float = 30.0):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        # Queued (method, args) calls, and the (data, buffers) they write by
+        # (function, id), made by process _queue_pid
+        self._pending = []
+        self._written = {}
+        self._queue_pid = None
+        self._timer = None
+        atexit.register(self.close)
+
+    def _connect(self):
+        # Connections must not be shared with forked children
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        os.makedirs(self.path.parent, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if conn.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+            conn.execute('BEGIN IMMEDIATE')
+            # Another process may have migrated the schema while we waited
+            if conn.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+                self._create_schema(conn)
+            conn.execute('COMMIT')
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+
+    def _create_schema(self, conn):
+        # Entries are only a cache, so old schemas are dropped rather than migrated
+        conn.execute('DROP TABLE IF EXISTS entries')
+        conn.execute('DROP TABLE IF EXISTS usage')
+        conn.execute('DROP TABLE IF EXISTS buffers')
+        conn.execute('DROP TABLE IF EXISTS blobs')
+        conn.execute('''
+            CREATE TABLE entries (
+                function TEXT NOT NULL,
+                id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (function, id)
+            )''')
+        conn.execute('CREATE INDEX entries_function ON entries (function, fingerprint)')
+        conn.execute('CREATE INDEX entries_fingerprint ON entries (fingerprint)')
+        conn.execute('CREATE INDEX entries_accessed ON entries (accessed)')
+        conn.execute('CREATE INDEX entries_hits ON entries (hits, accessed)')
+        conn.execute('''
+            CREATE TABLE buffers (
+                function TEXT NOT NULL,
+                id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (function, id, position)
+            )''')
+        conn.execute('''
+            CREATE TABLE blobs (
+                digest TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0
+            )''')
+        # Per-function totals, maintained by triggers so usage() is a lookup
+        conn.execute('''
+            CREATE TABLE usage (
+                function TEXT PRIMARY KEY,
+                entries INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            )''')
+        conn.execute('''
+            CREATE TRIGGER entries_insert AFTER INSERT ON entries BEGIN
+                INSERT INTO usage VALUES (NEW.function, 1, NEW.size)
+                ON CONFLICT (function) DO UPDATE
+                SET entries = entries + 1, bytes = bytes + NEW.size;
+                UPDATE blobs SET refs = refs + 1 WHERE digest = NEW.digest;
+            END''')
+        conn.execute('''
+            CREATE TRIGGER entries_update AFTER UPDATE OF size ON entries BEGIN
+                UPDATE usage SET bytes = bytes + NEW.size - OLD.size
+                WHERE function = NEW.function;
+            END''')
+        conn.execute('''
+            CREATE TRIGGER entries_update_digest AFTER UPDATE OF digest ON entries BEGIN
+                UPDATE blobs SET refs = refs + 1 WHERE digest = NEW.digest;
+                UPDATE blobs SET refs = refs - 1 WHERE digest = OLD.digest;
+                DELETE FROM blobs WHERE digest = OLD.digest AND refs <= 0;
+            END''')
+        conn.execute('''
+            CREATE TRIGGER entries_delete AFTER DELETE ON entries BEGIN
+                UPDATE usage SET entries = entries - 1, bytes = bytes - OLD.size
+                WHERE function = OLD.function;
+                DELETE FROM buffers WHERE function = OLD.function AND id = OLD.id;
+                UPDATE blobs SET refs = refs - 1 WHERE digest = OLD.digest;
+                DELETE FROM blobs WHERE digest = OLD.digest AND refs <= 0;
+            END''')
+        conn.execute('''
+            CREATE TRIGGER buffers_insert AFTER INSERT ON buffers BEGIN
+                UPDATE blobs SET refs = refs + 1 WHERE digest = NEW.digest;
+            END''')
+        conn.execute('''
+            CREATE TRIGGER buffers_delete AFTER DELETE ON buffers BEGIN
+                UPDATE blobs SET refs = refs - 1 WHERE digest = OLD.digest;
+                DELETE FROM blobs WHERE digest = OLD.digest AND refs <= 0;
+            END''')
+        conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def _fetchone(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchone()
+
+    def _fetchall(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    @contextmanager
+    def _transaction(self):
+        """Yields the connection inside a transaction, after committing the
+        pending writes, and commits it afterwards."""
+        with self._lock:
+            self.flush()
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def _modify(self, sql, params=()):
+        """Executes a write in its own transaction."""
+        with self._transaction() as conn:
+            return conn.execute(sql, params)
+
+    def _queue(self, method, *args):
+        """Queues the call method(conn, *args) to be made in the next batch.
+        Must be called with the lock held."""
+        if self._queue_pid != os.getpid():
+            # Forked: the writes queued by the parent are the parent's to make
+            self._pending, self._written, self._timer = [], {}, None
+            self._queue_pid = os.getpid()
+        self._pending.append((method, args))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.commit_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _pending_write(self, key: Key):
+        """Returns the (data, buffers) of a pending write of `key`, or None."""
+        with self._lock:
+            if self._queue_pid != os.getpid():
+                return None
+            return self._written.get((key.function, key.id))
+
+    def read(self, key: Key) -> bytes:
+        pending = self._pending_write(key)
+        if pending is not None:
+            return pending[0]
+        row = self._fetchone('SELECT data FROM entries JOIN blobs USING (digest) '
+                             'WHERE function = ? AND id = ?', (key.function, key.id))
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def read_many(self, keys: Sequence[Key]) -> Dict[Key, bytes]:
+        found, by_function = {}, {}
+        for key in keys:
+            pending = self._pending_write(key)
+            if pending is not None:
+                found[key] = pending[0]
+            else:
+                by_function.setdefault(key.function, {})[key.id] = key
+        for function, by_id in by_function.items():
+            ids = list(by_id)
+            # Stay well below SQLite's limit on the number of parameters
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._fetchall(f'SELECT id, data FROM entries JOIN blobs USING (digest) '
+                                      f'WHERE function = ? AND id IN '
+                                      f'({", ".join("?" * len(batch))})', [function, *batch])
+                for id_, data in rows:
+                    found[by_id[id_]] = data
+        return found
+
+    def read_buffers(self, key: Key) -> List[memoryview]:
+        pending = self._pending_write(key)
+        if pending is not None:
+            return [memoryview(buffer) for buffer in pending[1]]
+        rows = self._fetchall('SELECT data FROM buffers JOIN blobs USING (digest) '
+                              'WHERE function = ? AND id = ? ORDER BY position',
+                              (key.function, key.id))
+        return [memoryview(row[0]) for row in rows]
+
+    def write(self, key: Key, data: bytes, buffers: Sequence = ()):
+        # Copied, since the caller may reuse its buffers before the batch is written
+        data = bytes(data)
+        buffers = [bytes(memoryview(buffer).cast('B')) for buffer in buffers]
+        with self._lock:
+            self._queue(self._insert, key, data, buffers, time.time())
+            self._written[(key.function, key.id)] = (data, buffers)
+
+    def _insert(self, conn, key: Key, data: bytes, buffers: List[bytes], accessed: float):
+        size = len(data) + sum(len(buffer) for buffer in buffers)
+        digest, buffer_digests = _digest(data), [_digest(b) for b in buffers]
+        # The old buffers are released first: releasing them removes blobs
+        # left without references, which may be the blobs inserted below
+        conn.execute('DELETE FROM buffers WHERE function = ? AND id = ?',
+                     (key.function, key.id))
+        # Blobs are counted as referenced by the triggers on entries and buffers
+        conn.executemany('INSERT INTO blobs (digest, data) VALUES (?, ?) ON CONFLICT DO NOTHING',
+                         [(digest, data), *zip(buffer_digests, buffers)])
+        conn.execute('''
+            INSERT INTO entries (function, id, fingerprint, digest, size, accessed)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (function, id) DO UPDATE
+            SET digest = excluded.digest, size = excluded.size, accessed = excluded.accessed
+        ''', (key.function, key.id, key.fingerprint, digest, size, accessed))
+        conn.executemany('INSERT INTO buffers VALUES (?, ?, ?, ?)',
+                         [(key.function, key.id, position, buffer_digest)
+                          for position, buffer_digest in enumerate(buffer_digests)])
+
+    def lock_path(self, key: Key) -> Optional[Path]:
+        return (self.path.with_name(f'{self.path.name}-locks') / quote(key.function, safe='')
+                / key.id[:2] / f'{key.id}.lock')
+
+    def contains(self, key: Key) -> bool:
+        if self._pending_write(key) is not None:
+            return True
+        return self._fetchone('SELECT 1 FROM entries WHERE function = ? AND id = ?',
+                              (key.function, key.id)) is not None
+
+    def delete(self, key: Key) -> bool:
+        return self._modify('DELETE FROM entries WHERE function = ? AND id = ?',
+                            (key.function, key.id)).rowcount > 0
+
+    def invalidate(self, function: Optional[str] = None,
+                   fingerprint: Optional[str] = None) -> int:
+        clauses, params = [], []
+        if function is not None:
+            clauses.append('function = ?')
+            params.append(function)
+        if fingerprint is not None:
+            clauses.append('fingerprint = ?')
+            params.append(fingerprint)
+        where = ' AND '.join(clauses) or '1'
+        return self._modify(f'DELETE FROM entries WHERE {where}', params).rowcount
+
+    def entries(self, function: Optional[str] = None) -> Iterator[Entry]:
+        self.flush()
+        where, params = ('AND function = ?', (function,)) if function is not None else ('', ())
+        rowid = 0
+        while True:
+            rows = self._fetchall(f'''
+                SELECT rowid, function, fingerprint, id, size, accessed, hits FROM entries
+                WHERE rowid > ? {where} ORDER BY rowid LIMIT 1000
+            ''', (rowid, *params))
+            for rowid, function_, fingerprint, id_, size, accessed, hits in rows:
+                yield Entry(Key(function_, fingerprint, id_), size, accessed, hits)
+            if not rows:
+                return
+
+    def fingerprints(self) -> Iterator[Tuple[str, str]]:
+        self.flush()
+        yield from self._fetchall('SELECT DISTINCT function, fingerprint FROM entries')
+
+    def functions(self, prefix: str = '') -> List[str]:
+        self.flush()
+        # A range scan of the usage table's primary key
+        if not prefix:
+            rows = self._fetchall('SELECT function FROM usage WHERE entries > 0 ORDER BY function')
+        else:
+            end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            rows = self._fetchall('SELECT function FROM usage WHERE function >= ? AND function < ? '
+                                  'AND entries > 0 ORDER BY function', (prefix, end))
+        return [function for function, in rows]
+
+    def touch(self, key: Key, accessed: float, hits: int = 1):
+        with self._lock:
+            self._queue(self._touch, key, accessed, hits)
+
+    @staticmethod
+    def _touch(conn, key: Key, accessed: float, hits: int):
+        conn.execute('UPDATE entries SET accessed = max(accessed, ?), hits = hits + ? '
+                     'WHERE function = ? AND id = ?', (accessed, hits, key.function, key.id))
+
+    def usage(self, function: Optional[str] = None) -> Usage:
+        self.flush()
+        if function is None:
+            row = self._fetchone('SELECT total(entries), total(bytes) FROM usage')
+        else:
+            row = self._fetchone('SELECT entries, bytes FROM usage WHERE function = ?', (function,))
+        return Usage(int(row[0]), int(row[1])) if row else Usage(0, 0)
+
+    def victims(self, function: Optional[str] = None, policy: str = 'lru',
+                count: int = 100) -> List[Entry]:
+        self.flush()
+        order = {'lru': 'accessed', 'lfu': 'hits, accessed'}[policy]
+        where, params = ('WHERE function = ?', (function,)) if function is not None else ('', ())
+        rows = self._fetchall(f'''
+            SELECT function, fingerprint, id, size, accessed, hits FROM entries
+            {where} ORDER BY {order} LIMIT ?
+        ''', (*params, count))
+        return [Entry(Key(*row[:3]), *row[3:]) for row in rows]
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM entries')
+            conn.execute('DELETE FROM blobs')
+
+    def sweep(self) -> int:
+        with self._transaction() as conn:
+            freed = conn.execute('SELECT total(length(data)) FROM blobs WHERE refs <= 0').fetchone()[0]
+            conn.execute('DELETE FROM blobs WHERE refs <= 0')
+        return int(freed)
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._queue_pid != os.getpid() or not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            try:
+                conn = self._connect()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for method, args in pending:
+                        method(conn, *args)
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+                conn.execute('COMMIT')
+            finally:
+                self._written.clear()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,197 @@
+"""Watching of source files, so that fingerprints depending on them can be
+discarded as soon as they change instead of checking the files on every call.
+
+On Linux, the directories containing watched files are watched with inotify
+(through ctypes, so nothing needs to be installed). Elsewhere, or if inotify
+is unavailable, the size and mtime of each watched file are polled every
+`interval` seconds instead, as are the files whose directory inotify could
+not watch (e.g. once `max_user_watches` is used up). Either way, changes are reported from a daemon
+thread, by calling `on_change` with the changed paths.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import warnings
+
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set
+
+# inotify event masks, from <sys/inotify.h>
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_CLOEXEC = 0o2000000
+_MASK = (_IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE
+         | _IN_DELETE | _IN_DELETE_SELF)
+_EVENT = struct.Struct('iIII')
+
+
+def _state(path: Path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class FileWatcher:
+    """FileWatcher calls `on_change` with the set of watched files that
+    changed, from a background thread. `backend` is 'inotify', 'polling', or
+    'auto' to use inotify where available."""
+
+    def __init__(self, on_change: Callable[[Set[Path]], None], interval: float = 1.0,
+                 backend: str = 'auto'):
+        if backend not in ('auto', 'inotify', 'polling'):
+            raise ValueError(f"Unknown backend {backend!r}; expected 'auto', 'inotify' or "
+                             "'polling'")
+        self.on_change = on_change
+        self.interval = interval
+        self._lock = threading.Lock()
+        # Watched file -> its (mtime_ns, size) when it was last known current
+        self.files: Dict[Path, Optional[tuple]] = {}
+        # Watched files that are polled even with inotify
+        self._polled: Set[Path] = set()
+        self._stop = threading.Event()
+        self._inotify = None
+        if backend != 'polling':
+            self._inotify = _Inotify.create()
+            if self._inotify is None and backend == 'inotify':
+                raise OSError("inotify is not available")
+        self.backend = 'inotify' if self._inotify else 'polling'
+        self._thread = threading.Thread(target=self._loop, name='astrocache-watcher',
+                                        daemon=True)
+        self._thread.start()
+
+    def watch(self, files: Dict[Path, Optional[tuple]]):
+        """Watches each of `files`, a dict of path -> (mtime_ns, size) as it
+        was when read. Files that have already changed since are reported
+        right away."""
+        changed = set()
+        with self._lock:
+            for path, state in files.items():
+                if path in self.files:
+                    continue
+                self.files[path] = state
+                if self._inotify and not self._inotify.add(path.parent):
+                    self._polled.add(path)
+                if _state(path) != state:
+                    changed.add(path)
+        if changed:
+            self._report(changed)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        if self._inotify:
+            self._inotify.close()
+
+    def _report(self, changed: Set[Path]):
+        with self._lock:
+            for path in changed:
+                self.files.pop(path, None)
+                self._polled.discard(path)
+        try:
+            self.on_change(changed)
+        except Exception as e:
+            warnings.warn(f"Failed to handle changes to {sorted(map(str, changed))}: {e}",
+                          RuntimeWarning)
+
+    def _loop(self):
+        polled = time.monotonic()
+        while not self._stop.is_set():
+            if self._inotify:
+                paths = self._inotify.read(self.interval)
+                if paths is None:
+                    # Events were lost; fall back to comparing every file
+                    changed = self._poll()
+                else:
+                    with self._lock:
+                        changed = {path for path in paths if path in self.files}
+                    if self._polled and time.monotonic() - polled >= self.interval:
+                        polled = time.monotonic()
+                        changed |= self._poll(self._polled)
+            else:
+                self._stop.wait(self.interval)
+                changed = self._poll()
+            if changed:
+                self._report(changed)
+
+    def _poll(self, paths: Optional[Set[Path]] = None):
+        """Returns the watched files (of `paths`, if provided) that changed."""
+        with self._lock:
+            files = [(path, self.files.get(path)) for path in (paths if paths is not None
+                                                               else self.files)
+                     if path in self.files]
+        return {path for path, state in files if _state(path) != state}
+
+
+class _Inotify:
+    """A minimal inotify instance watching directories."""
+
+    def __init__(self, libc, fd: int):
+        self._libc = libc
+        self._fd = fd
+        # watch descriptor -> directory
+        self._dirs = {}
+        self._watched = set()
+
+    @classmethod
+    def create(cls) -> Optional['_Inotify']:
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            fd = libc.inotify_init1(_IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def add(self, directory: Path) -> bool:
+        """Watches `directory`. Returns False if it cannot be watched."""
+        if directory in self._watched:
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _MASK)
+        if wd < 0:
+            return False
+        self._dirs[wd] = directory
+        self._watched.add(directory)
+        return True
+
+    def read(self, timeout: float) -> Optional[Set[Path]]:
+        """Returns the paths with events within `timeout` seconds, or None if
+        the event queue overflowed."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self._fd, 1 << 16)
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            directory = self._dirs.get(wd)
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                self._watched.discard(directory)
+            elif directory is not None and name:
+                paths.add(directory / os.fsdecode(name))
+        return paths
+
+    def close(self):
+        os.close(self._fd)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Benchmarks of astrocache's hot paths: fingerprinting, argument hashing and
+storage. Runs offline against synthetic workloads and prints a table, and
+optionally writes the results as JSON to compare later runs against:
+
+    PYTHONPATH=. benchmarks/bench.py --json baseline.json
+    PYTHONPATH=. benchmarks/bench.py --baseline baseline.json
+"""
+
+import importlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+
+import astrocache
+from astrocache import FilesystemStorage, Key, SQLiteStorage
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# (depth, fan-out) of the synthetic call graphs
+GRAPHS = [(1, 1), (4, 2), (8, 1), (3, 6), (6, 3)]
+# Sizes of the bytes and array arguments, in bytes
+PAYLOADS = [100, 10_000, 1_000_000, 64_000_000]
+DEFAULT_SIZES = '1e2,1e3,1e4'
+STORAGES = {
+    'filesystem': lambda path: FilesystemStorage(path / 'fs'),
+    'sqlite': lambda path: SQLiteStorage(path / 'cache.sqlite'),
+}
+
+
+def measure(fn, repeat: int, number: int = 1):
+    """Returns the median and minimum seconds per call of `fn`, over `repeat`
+    rounds of `number` calls."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return statistics.median(times), min(times)
+
+
+def write_graph(directory: Path, depth: int, fanout: int) -> str:
+    """Writes a module whose function `root` calls `fanout` functions, each
+    calling `fanout` more, `depth` levels deep, and returns its name."""
+    name = f'bench_graph_{depth}_{fanout}'
+    lines = []
+    level = ['f']
+    for d in range(depth):
+        below = [f'{caller}_{i}' for caller in level for i in range(fanout)]
+        for caller in level:
+            callees = [f'{caller}_{i}' for i in range(fanout)]
+            lines.append(f'def {caller}(x):')
+            lines.append(f'    y = x + {d}')
+            lines.extend(f'    y = {callee}(y) * 2' for callee in callees)
+            lines.append('    return y\n')
+        level = below
+    for leaf in level:
+        lines.append(f'def {leaf}(x):\n    return x - 1\n')
+    lines.append('def root(x):\n    return f(x)\n')
+    (directory / f'{name}.py').write_text('\n'.join(lines))
+    return name
+
+
+def bench_fingerprint(tmpdir: Path, repeat: int):
+    sys.path.insert(0, str(tmpdir))
+    results = {}
+    for depth, fanout in GRAPHS:
+        module = importlib.import_module(write_graph(tmpdir, depth, fanout))
+        functions = sum(fanout ** d for d in range(depth + 1)) + 1
+
+        def cold():
+            astrocache.refresh_fingerprints()
+            astrocache._func_fingerprint(module.root)
+
+        cold_median, cold_min = measure(cold, repeat)
+        warm_median, warm_min = measure(lambda: astrocache._func_fingerprint(module.root),
+                                        repeat, number=100)
+        results[f'fingerprint/depth={depth},fanout={fanout}'] = {
+            'functions': functions,
+            'cold_s': cold_median, 'cold_min_s': cold_min,
+            'warm_s': warm_median, 'warm_min_s': warm_min,
+        }
+    sys.path.remove(str(tmpdir))
+    return results
+
+
+def payloads(max_bytes: int):
+    for size in PAYLOADS:
+        if size > max_bytes:
+            continue
+        yield f'bytes/{size}', size, os.urandom(size)
+        if numpy is not None:
+            yield (f'ndarray/{size}', size,
+                   numpy.random.default_rng(0).random(size // 8, dtype=numpy.float64))
+    yield 'list/1000', None, list(range(1000))
+    yield 'dict/1000', None, {str(i): i for i in range(1000)}
+
+
+def bench_hashing(repeat: int, max_bytes: int):
+    results = {}
+    for name, size, payload in payloads(max_bytes):
+        number = 1 if size and size >= 1_000_000 else 100
+        median, best = measure(lambda: astrocache._value_hash(payload), repeat, number)
+        result = {'hash_s': median, 'hash_min_s': best}
+        if size:
+            result['throughput_mb_s'] = size / median / 1e6
+        results[f'hash/{name}'] = result
+    return results
+
+
+def populate(storage, count: int, data: bytes):
+    """Writes `count` entries of a synthetic function to `storage`."""
+    keys = [Key('bench.fn', 'fingerprint', f'{i:032x}') for i in range(count)]
+    for start in range(0, count, 10_000):
+        storage.write_many((key, data, ()) for key in keys[start:start + 10_000])
+    storage.flush()
+    return keys
+
+
+def bench_storage(tmpdir: Path, sizes, repeat: int):
+    results = {}
+    data = os.urandom(1000)
+    for backend, make_storage in STORAGES.items():
+        for count in sizes:
+            path = tmpdir / f'{backend}-{count}'
+            path.mkdir()
+            storage = make_storage(path)
+            start = time.perf_counter()
+            keys = populate(storage, count, data)
+            populate_s = time.perf_counter() - start
+            sample = random.Random(0).sample(keys, min(count, 1000))
+            missing = [key._replace(id=key.id + 'ff') for key in sample]
+
+            def read_hits():
+                for key in sample:
+                    storage.read(key)
+
+            def read_misses():
+                for key in missing:
+                    try:
+                        storage.read(key)
+                    except KeyError:
+                        pass
+
+            hit_s, _ = measure(read_hits, repeat)
+            miss_s, _ = measure(read_misses, repeat)
+            many_s, _ = measure(lambda: storage.read_many(sample), repeat)
+            results[f'storage/{backend}/{count}'] = {
+                'write_throughput_per_s': count / populate_s,
+                'read_hit_s': hit_s / len(sample),
+                'read_miss_s': miss_s / len(sample),
+                'read_many_per_key_s': many_s / len(sample),
+            }
+            storage.close()
+    return results
+
+
+def bench_calls(tmpdir: Path, repeat: int):
+    """Measures cached calls end to end: the latency of hits, the overhead a
+    miss adds to the function, and the throughput of func.map()."""
+    results = {}
+    for backend, make_storage in STORAGES.items():
+        for memory in (False, True):
+            name = f'call/{backend}' + ('/memory' if memory else '')
+            path = tmpdir / name.replace('/', '-')
+            path.mkdir()
+            storage = make_storage(path)
+
+            @astrocache.cache(storage=storage, memory=memory)
+            def identity(x):
+                return x
+
+            counter = iter(range(10 ** 9))
+            identity(-1)
+            hit_s, _ = measure(lambda: identity(-1), repeat, number=100)
+            miss_s, _ = measure(lambda: identity(next(counter)), repeat, number=100)
+            items = range(10 ** 6, 10 ** 6 + 1000)
+            start = time.perf_counter()
+            list(identity.map(items))
+            map_miss_s = time.perf_counter() - start
+            start = time.perf_counter()
+            list(identity.map(items))
+            map_hit_s = time.perf_counter() - start
+            results[name] = {
+                'hit_s': hit_s,
+                'miss_overhead_s': miss_s,
+                'map_miss_per_s': len(items) / map_miss_s,
+                'map_hit_per_s': len(items) / map_hit_s,
+            }
+            storage.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Prints each metric's ratio to `baseline`, and returns how many of them
+    regressed by more than `threshold`. Metrics ending in '_per_s' and
+    '_mb_s' are rates, where higher is better; all others are durations."""
+    regressions = 0
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old or not value or metric == 'functions':
+                continue
+            higher_is_better = metric.endswith(('_per_s', '_mb_s'))
+            slowdown = old / value if higher_is_better else value / old
+            flag = ''
+            if slowdown > threshold:
+                regressions += 1
+                flag = '  REGRESSION'
+            print(f'{name:45} {metric:24} {slowdown:6.2f}x{flag}')
+    return regressions
+
+
+def print_table(results: dict):
+    for name, metrics in results.items():
+        print(name)
+        for metric, value in metrics.items():
+            print(f'    {metric:28} {value:.6g}')
+
+
+def main():
+    ap = ArgumentParser(description=__doc__, formatter_class=ArgumentDefaultsHelpFormatter)
+    ap.add_argument('--sizes', default=DEFAULT_SIZES,
+                    help='Comma-separated numbers of stored entries to benchmark storage '
+                         'with, e.g. 1e2,1e4,1e6')
+    ap.add_argument('--max-payload', type=float, default=64e6,
+                    help='Largest argument to hash, in bytes')
+    ap.add_argument('--repeat', type=int, default=5, help='Rounds per measurement')
+    ap.add_argument('--only', action='append', choices=['fingerprint', 'hash', 'storage', 'call'],
+                    help='Run only these benchmarks (may be repeated)')
+    ap.add_argument('--json', help='Write the results to this file')
+    ap.add_argument('--baseline', help='Compare the results to those in this JSON file')
+    ap.add_argument('--threshold', type=float, default=1.25,
+                    help='Slowdown relative to the baseline that counts as a regression')
+    args = ap.parse_args()
+    only = set(args.only or ['fingerprint', 'hash', 'storage', 'call'])
+    sizes = [int(float(size)) for size in args.sizes.split(',')]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        astrocache.CACHE_DIR = tmpdir / 'default'
+        if 'fingerprint' in only:
+            results.update(bench_fingerprint(tmpdir, args.repeat))
+        if 'hash' in only:
+            results.update(bench_hashing(args.repeat, int(args.max_payload)))
+        if 'storage' in only:
+            results.update(bench_storage(tmpdir, sizes, args.repeat))
+        if 'call' in only:
+            results.update(bench_calls(tmpdir, args.repeat))
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'numpy': getattr(numpy, '__version__', None),
+                'results': results,
+            }, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        print(f'\nCompared to {args.baseline} (slowdown, higher is worse):')
+        regressions = compare(results, baseline, args.threshold)
+        print(f'{regressions} regressions')
+        sys.exit(bool(regressions))
+
+
+if __name__ == '__main__':
+    main()
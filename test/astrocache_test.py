@@ -227,6 +227,14 @@ with catch_exception():
     print("Calling strictly_cached([1])")
     print(strictly_cached([1]))
 
+class Opaque:
+    def __repr__(self):
+        return 'Opaque()'
+
+with catch_exception():
+    print("Calling strictly_cached(Opaque())")
+    print(strictly_cached(Opaque()))
+
 print("\nUse @astrocache.cache(strict=True) if you want to be sure all your "
       + "arguments are being included in the cache key.")
 
@@ -241,3 +249,116 @@ with catch_exception():
 with catch_exception():
     print("\nget_cache_id(make_thing, [[1]], {}, strict=True)")
     print(astrocache._get_cache_id(make_thing, [[1]], {}, strict=True))
+
+with catch_exception():
+    print("\nget_cache_id(make_thing, [Opaque()], {})")
+    print(astrocache._get_cache_id(make_thing, [Opaque()], {}))
+
+with catch_exception():
+    print("\nget_cache_id(make_thing, [[Opaque()]], {})")
+    print(astrocache._get_cache_id(make_thing, [[Opaque()]], {}))
+
+with catch_exception():
+    print("\nget_cache_id(make_thing, [[Opaque()]], {}, strict=True)")
+    print(astrocache._get_cache_id(make_thing, [[Opaque()]], {}, strict=True))
+
+print("""
+###############################################################################
+# fingerprint memoization
+###############################################################################
+""")
+
+print("Fingerprinting one() twice reuses the memoized fingerprint")
+print(astrocache._func_fingerprint(one) is astrocache._func_fingerprint(one))
+
+print("\nRebinding a callee invalidates the memoized fingerprint")
+before = astrocache._func_fingerprint(one)
+def make_thing(a):
+    return a + 4
+print(astrocache._func_fingerprint(one) != before)
+
+print("\nEditing a source file invalidates the memoized fingerprint")
+import importlib, sys, tempfile
+with tempfile.TemporaryDirectory() as tmpdir:
+    with open(f'{tmpdir}/edited.py', 'w') as f:
+        f.write("def edited(x):\n    return x + 1\n")
+    sys.path.insert(0, tmpdir)
+    edited = importlib.import_module('edited')
+    before = astrocache._func_fingerprint(edited.edited)
+    with open(f'{tmpdir}/edited.py', 'w') as f:
+        f.write("def edited(x):\n    return x + 22\n")
+    print(astrocache._func_fingerprint(edited.edited) != before)
+    sys.path.remove(tmpdir)
+
+print("\nrefresh_fingerprints() discards memoized fingerprints")
+before = astrocache._func_fingerprint(one)
+astrocache.refresh_fingerprints()
+after = astrocache._func_fingerprint(one)
+print(after is not before, after == before)
+
+print("""
+###############################################################################
+# source index
+###############################################################################
+""")
+
+print("Indexed definitions hash the same as definitions parsed on their own")
+indexed = astrocache.Function.from_func(foo.three)
+print(indexed.digest == astrocache._ast_digest(astrocache.ast.parse(inspect.getsource(foo.three))))
+
+print("\nEach source file is parsed once")
+astrocache._source_index.invalidate()
+a = astrocache._source_index.lookup(indexed.filename, foo.three.__code__)
+b = astrocache._source_index.lookup(indexed.filename, foo.three.__code__)
+print(a is b)
+
+print("\nDecorated definitions are found by the line of their first decorator")
+print(astrocache._source_index.lookup(astrocache.Path(__file__), cached_func.__wrapped__.__code__) is not None)
+
+print("""
+###############################################################################
+# recursive call graphs
+###############################################################################
+""")
+
+def factorial(n):
+    return 1 if n <= 1 else n * factorial(n - 1)
+
+def is_even(n):
+    return True if n == 0 else is_odd(n - 1)
+
+def is_odd(n):
+    return False if n == 0 else is_even(n - 1)
+
+print("Using the following definitions:")
+print(inspect.getsource(factorial))
+print(inspect.getsource(is_even))
+print(inspect.getsource(is_odd))
+
+print("Fingerprint hash for factorial():", astrocache._make_hash(astrocache._func_fingerprint(factorial)))
+print("Fingerprint hash for is_even():", astrocache._make_hash(astrocache._func_fingerprint(is_even)))
+print("Fingerprint hash for is_odd():", astrocache._make_hash(astrocache._func_fingerprint(is_odd)))
+
+print("\nChanging implementation of is_odd()")
+before = astrocache._func_fingerprint(is_even)
+def is_odd(n):
+    return n != 0 and is_even(n - 1)
+print("is_even() fingerprint changed:", astrocache._func_fingerprint(is_even) != before)
+
+@astrocache.cache()
+def cached_factorial(n):
+    print("EXECUTED")
+    return factorial(n)
+
+print("\nCalling cached_factorial(10)...")
+print(cached_factorial(10))
+
+print("\nCalling cached_factorial(10)...")
+print(cached_factorial(10))
+
+print("\nFingerprints do not depend on the order they were computed in")
+astrocache.refresh_fingerprints()
+even_first = astrocache._func_fingerprint(is_even), astrocache._func_fingerprint(is_odd)
+astrocache.refresh_fingerprints()
+odd_first = astrocache._func_fingerprint(is_even), astrocache._func_fingerprint(is_odd)
+print(even_first == odd_first)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import asyncio
+import inspect
+import tempfile
+import time
+from pathlib import Path
+
+import astrocache
+
+class SlowStorage(astrocache.FilesystemStorage):
+    def read(self, key):
+        time.sleep(0.2)
+        return super().read(key)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+    calls = []
+
+    @astrocache.cache()
+    async def fetch(x):
+        print(f"EXECUTED fetch({x})")
+        calls.append(x)
+        await asyncio.sleep(0.1)
+        return {'x': x}
+
+    @astrocache.cache()
+    async def fail(x):
+        print("EXECUTED fail()")
+        await asyncio.sleep(0.1)
+        raise ValueError(x)
+
+    @astrocache.cache(storage=SlowStorage(Path(tmpdir) / 'slow'))
+    async def slow_read(x):
+        return x
+
+    print("""
+###############################################################################
+# coroutine functions
+###############################################################################
+""")
+    print(f"The wrapper is a coroutine function: {inspect.iscoroutinefunction(fetch)}")
+
+    print("\nAwaiting fetch(1) twice")
+    print(asyncio.run(fetch(1)))
+    print(asyncio.run(fetch(1)))
+
+    print("\nAwaiting fetch(1, no_cache=True)")
+    print(asyncio.run(fetch(1, no_cache=True)))
+
+    print("""
+###############################################################################
+# concurrent awaiters
+###############################################################################
+""")
+    async def gather(coroutines):
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    print("Awaiting fetch(2) five times concurrently")
+    print(asyncio.run(gather(fetch(2) for _ in range(5))))
+
+    print("\nAwaiting fail(3) three times concurrently")
+    print(asyncio.run(gather(fail(3) for _ in range(3))))
+    print("\nExceptions are not cached")
+    print(asyncio.run(gather([fail(3)])))
+
+    print("\nCancelling one awaiter does not cancel the others")
+    async def cancel_one():
+        first, second = asyncio.ensure_future(fetch(4)), asyncio.ensure_future(fetch(4))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await asyncio.gather(first, second, return_exceptions=True)
+    print([type(r).__name__ for r in asyncio.run(cancel_one())])
+    print(asyncio.run(fetch(4)))
+
+    print("""
+###############################################################################
+# the event loop is not blocked
+###############################################################################
+""")
+    async def ticking(coroutine):
+        ticks = 0
+        task = asyncio.ensure_future(coroutine)
+        while not task.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return task.result(), ticks
+
+    asyncio.run(slow_read(5))
+    result, ticks = asyncio.run(ticking(slow_read(5)))
+    print(f"Result: {result}, loop kept running during a slow read: {ticks > 5}")
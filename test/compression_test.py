@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+from pathlib import Path
+
+import astrocache
+from astrocache import compression
+
+text = ' '.join(f'word{i % 50}' for i in range(20000)).encode()
+noise = os.urandom(20000)
+
+print("""
+###############################################################################
+# codecs
+###############################################################################
+""")
+for codec in ('zlib', 'bz2', 'lzma'):
+    compressed = compression.compress(text, codec)
+    print(f"{codec}: header {compressed[:6]}, smaller: {len(compressed) < len(text) / 5}, "
+          f"round trip: {compression.decompress(compressed) == text}")
+print(f"zlib level 1 and 9 differ: "
+      f"{compression.compress(text, 'zlib', 1) != compression.compress(text, 'zlib', 9)}")
+
+print("\nUncompressed data is stored as is")
+print(compression.compress(b'data') == b'data', compression.decompress(b'data'))
+print("\nUncompressed data that looks like a header is marked as uncompressed")
+tricky = compression.MAGIC + b'\x01\x01data'
+print(compression.compress(tricky)[:6], compression.decompress(compression.compress(tricky)) == tricky)
+
+print("\n'auto' compresses compressible data")
+print(compression.compress(text, 'auto')[:6])
+print("\n'auto' skips small and incompressible data")
+print(compression.compress(b'small' * 10, 'auto') == b'small' * 10,
+      compression.compress(noise, 'auto') == noise)
+
+try:
+    compression.validate('zstd')
+except ValueError as e:
+    print(f"\nException: {e}")
+
+print("""
+###############################################################################
+# cache(compress=...)
+###############################################################################
+""")
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+    storage = astrocache._default_storage()
+
+    def make_text(n):
+        print("EXECUTED")
+        return text.decode() * n
+
+    compressed = astrocache.cache(compress='lzma', level=1)(make_text)
+    print(len(compressed(1)))
+    print(len(compressed(1)))
+    data = storage.read(next(storage.keys()))
+    print(f"Stored compressed: {data[:6]}, {len(data) < len(text) / 5}")
+
+    print("\nEntries decode themselves, whatever the reader's settings")
+    astrocache.clear_cache()
+    astrocache.cache(compress='bz2')(make_text)(2)
+    print(len(astrocache.cache()(make_text)(2)))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+from pathlib import Path
+
+import astrocache
+from astrocache import FilesystemStorage, Key, SQLiteStorage
+
+payload = b'shared' * 10000
+other = b'other' * 10000
+keys = [Key('mod.fn', 'f1', f'aa0{i}') for i in range(3)] + [Key('mod.g', 'f2', 'bb01')]
+
+def blobs(storage):
+    if isinstance(storage, SQLiteStorage):
+        storage.flush()
+        return storage._fetchall('SELECT refs, length(data) FROM blobs ORDER BY refs, length(data)')
+    blob_dir = storage.path / '.blobs'
+    return sorted((os.stat(path).st_nlink - 1, os.path.getsize(path))
+                  for path in blob_dir.glob('*/*')
+                  if not path.is_symlink()) if blob_dir.exists() else []
+
+def exercise(storage):
+    print("Writing identical data for 4 entries, and other data as a buffer of one")
+    for key in keys[:3]:
+        storage.write(key, payload)
+    storage.write(keys[3], payload, [other])
+    print("blobs (references, size):", blobs(storage))
+    print("reads:", all(storage.read(key) == payload for key in keys),
+          bytes(storage.read_buffers(keys[3])[0]) == other)
+    print("usage counts every entry:", storage.usage())
+
+    print("\nRewriting an entry with the same data and buffer")
+    storage.write(keys[3], payload, [other])
+    print("blobs:", blobs(storage))
+    print("buffer read:", [bytes(b) == other for b in storage.read_buffers(keys[3])])
+
+    print("\nDeleting one entry")
+    storage.delete(keys[0])
+    print("blobs:", blobs(storage))
+
+    print("\nOverwriting an entry with the data of the buffer")
+    storage.write(keys[1], other)
+    print("blobs:", blobs(storage))
+
+    print("\nInvalidating mod.g")
+    print("removed:", storage.invalidate('mod.g'))
+    print("blobs:", blobs(storage))
+
+    print("\nDeleting the remaining entries")
+    storage.delete(keys[1])
+    storage.delete(keys[2])
+    print("blobs:", blobs(storage))
+    storage.clear()
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    print("""
+###############################################################################
+# deduplication with FilesystemStorage
+###############################################################################
+""")
+    storage = FilesystemStorage(Path(tmpdir) / 'fs')
+    exercise(storage)
+
+    print("\nData smaller than dedup_min_size is not deduplicated")
+    storage.write(keys[0], b'small')
+    storage.write(keys[1], b'small')
+    print("blobs:", blobs(storage))
+
+    print("\nsweep() removes blobs left without entries")
+    storage.write(keys[0], payload)
+    os.remove(storage._entry_path(keys[0]))
+    print("blobs:", blobs(storage))
+    print("freed:", storage.sweep())
+    print("blobs:", blobs(storage))
+
+    print("""
+###############################################################################
+# deduplication with SQLiteStorage
+###############################################################################
+""")
+    exercise(SQLiteStorage(Path(tmpdir) / 'cache.sqlite'))
+
+    print("""
+###############################################################################
+# cached functions returning identical results
+###############################################################################
+""")
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+
+    @astrocache.cache()
+    def reference_data(name):
+        return list(range(10000))
+
+    for name in ('a', 'b', 'c'):
+        reference_data(name)
+    print("blobs:", [refs for refs, _ in blobs(astrocache._default_storage())])
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import astrocache
+
+sys.dont_write_bytecode = True
+
+def write_package(src, scale="x * 2", extra=""):
+    pkg = src / 'dpkg'
+    pkg.mkdir(exist_ok=True)
+    (pkg / '__init__.py').write_text('')
+    write(pkg / 'helpers.py', f"def scale(x):\n    return {scale}\n\n"
+                              f"def offset(x):\n    return x + 1\n{extra}")
+    write(pkg / 'jobs.py',
+          "import astrocache\nfrom dpkg.helpers import scale, offset\n\n"
+          "@astrocache.cache()\ndef job(x):\n    return offset(scale(x))\n\n"
+          "@astrocache.cache()\ndef other(x):\n    return offset(x)\n\n"
+          "@astrocache.cache()\ndef local(x):\n    return -x\n")
+
+def write(path, text):
+    if path.exists() and path.read_text() == text:
+        return
+    path.write_text(text)
+    # Make sure the change is seen even within the mtime resolution
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+def astrocache_cli(*args):
+    result = subprocess.run([sys.executable, '-m', 'astrocache', *args], capture_output=True,
+                            text=True, env=ENV)
+    return (result.stdout + result.stderr).strip()
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    src = Path(tmpdir) / 'src'
+    src.mkdir()
+    ENV = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(src), os.getcwd()]),
+           'ASTROCACHE_DIR': str(Path(tmpdir) / 'cache')}
+    write_package(src)
+    manifest_path = Path(tmpdir) / 'manifest.json'
+    astrocache_cli('build-manifest', 'dpkg', '-o', str(manifest_path))
+    subprocess.run([sys.executable, '-c', "from dpkg.jobs import *\n"
+                    "[job(i) for i in range(10)]; [other(i) for i in range(3)]; local(1)"],
+                   env=ENV, check=True)
+
+    print("""
+###############################################################################
+# the call graph in the manifest
+###############################################################################
+""")
+    graph = json.loads(manifest_path.read_text())['graph']
+    for name, node in graph.items():
+        print(name, node['file'], node['calls'])
+
+    print("""
+###############################################################################
+# python -m astrocache diff
+###############################################################################
+""")
+    print("Unchanged source:")
+    print(astrocache_cli('diff', str(manifest_path)))
+
+    print("\nA change to a function nothing cached calls:")
+    write_package(src, extra="\ndef unused(x):\n    return x\n")
+    print(astrocache_cli('diff', str(manifest_path)))
+
+    print("\nA change to a function called by one cached function:")
+    write_package(src, scale="x * 3")
+    print(astrocache_cli('diff', str(manifest_path)))
+
+    print("\nThe manifest's paths can be relative to another directory:")
+    moved = Path(tmpdir) / 'elsewhere' / 'manifest.json'
+    moved.parent.mkdir()
+    moved.write_text(manifest_path.read_text())
+    print(astrocache_cli('diff', str(moved), '--source-dir', tmpdir).splitlines()[-1])
+
+    print("""
+###############################################################################
+# astrocache.diff()
+###############################################################################
+""")
+    manifest = astrocache.Manifest.load(manifest_path)
+    print("changed files:", sorted(manifest.changed_files()))
+    print("affected:", sorted(manifest.affected(manifest.changed_files())))
+    print("reachable from dpkg.jobs.job:", sorted(manifest.reachable('dpkg.jobs.job')))
+    sys.path.insert(0, str(src))
+    astrocache.CACHE_DIR = ENV['ASTROCACHE_DIR']
+    for inv in astrocache.diff(manifest_path):
+        print(inv.function, inv.entries, inv.bytes > 0, inv.files, inv.changed,
+              inv.current != inv.fingerprint)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import astrocache
+from astrocache import FilesystemStorage, SQLiteStorage
+
+def stored_args(storage, cached):
+    return sorted(arg for arg in range(10) if storage.contains(
+        astrocache._get_cache_key(cached.__wrapped__, [arg], {})))
+
+def exercise(storage):
+    @astrocache.cache(storage=storage, max_entries=3)
+    def lru(x):
+        return x
+
+    @astrocache.cache(storage=storage, max_entries=3, eviction='lfu')
+    def lfu(x):
+        return x
+
+    @astrocache.cache(storage=storage, max_bytes=100)
+    def big(x):
+        return b'x' * 40
+
+    # Entries may also be evicted by the background thread while this runs
+    for fn in (lru, lfu):
+        fn(0)
+        fn(1)
+        for _ in range(3):
+            time.sleep(0.01)
+            fn(0)
+        for arg in (2, 3, 4):
+            time.sleep(0.01)
+            fn(arg)
+    for arg in range(5):
+        big(arg)
+    astrocache.evict()
+
+    print("lru entries:", stored_args(storage, lru))
+    print("lfu entries:", stored_args(storage, lfu))
+    print("big entries:", len(stored_args(storage, big)),
+          "of at most 100 bytes:", storage.usage(astrocache._function_name(big)).bytes <= 100)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    print("""
+###############################################################################
+# eviction with FilesystemStorage
+###############################################################################
+""")
+    exercise(FilesystemStorage(Path(tmpdir) / 'fs'))
+
+    print("\nusage() and victims() answer from memory")
+    class ListingStorage(FilesystemStorage):
+        listings = 0
+        during_listing = None
+        after_shard = None
+
+        def _shards(self, function=None):
+            ListingStorage.listings += 1
+            if self.during_listing is not None:
+                self.during_listing()
+            return super()._shards(function)
+
+        def _shard_entries(self, function, fingerprint, shard_dir):
+            entries = super()._shard_entries(function, fingerprint, shard_dir)
+            if self.after_shard is not None:
+                self.after_shard()
+            return entries
+
+    def key(i):
+        return astrocache.Key('mod.fn', 'f1', f'{i:032x}')
+
+    storage = ListingStorage(Path(tmpdir) / 'listed', listing_ttl=0.5)
+    for i in range(5):
+        storage.write(key(i), b'x' * 10)
+    print("usage:", storage.usage('mod.fn'))
+    storage.write(key(5), b'x' * 20, [b'y' * 5])
+    storage.touch(key(0), time.time() + 10)
+    storage.delete(key(1))
+    print("usage:", storage.usage('mod.fn'))
+    print("victims:", [int(entry.key.id, 16) for entry in storage.victims('mod.fn', count=3)])
+    print("listings:", ListingStorage.listings)
+    FilesystemStorage(storage.path).write(key(9), b'x' * 10)
+    print("writes by others show up once the listing expires:", storage.usage('mod.fn'))
+    time.sleep(0.6)
+    print(storage.usage('mod.fn'), "listings:", ListingStorage.listings)
+
+    def write_concurrently():
+        writer = threading.Thread(target=storage.write, args=(key(8), b'x' * 10))
+        writer.start()
+        writer.join(5)
+        print("writes are not blocked while listing:", not writer.is_alive())
+    storage.during_listing = write_concurrently
+    time.sleep(0.6)
+    storage.usage('mod.fn')
+    storage.during_listing = None
+    print("writes made while listing are counted once:", storage.usage('mod.fn'))
+    storage.after_shard = lambda: storage.write(key(7), b'x' * 10)
+    time.sleep(0.6)
+    storage.usage('mod.fn')
+    storage.after_shard = None
+    print("writes made after their shard was listed are counted:", storage.usage('mod.fn'))
+
+    print("""
+###############################################################################
+# eviction with SQLiteStorage
+###############################################################################
+""")
+    storage = SQLiteStorage(Path(tmpdir) / 'cache.sqlite')
+    exercise(storage)
+    storage.close()
+
+print("""
+###############################################################################
+# sizes
+###############################################################################
+""")
+for size in [1000, '1000', '500K', '2g', '10 MB']:
+    print(f"parse_size({size!r}) = {astrocache.parse_size(size)}")
+try:
+    astrocache.cache(eviction='fifo')
+except ValueError as e:
+    print(f"Exception: {e}")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import importlib
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import astrocache
+
+sys.dont_write_bytecode = True
+
+def write_module(path, body):
+    with open(path, 'w') as f:
+        f.write("import astrocache\n\n@astrocache.cache()\ndef compute(x):\n" + body)
+
+def fingerprints(storage):
+    return sorted(f for _, f in storage.fingerprints())
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+    storage = astrocache._default_storage()
+    src = Path(tmpdir) / 'src'
+    src.mkdir()
+    sys.path.insert(0, str(src))
+
+    print("""
+###############################################################################
+# astrocache.gc()
+###############################################################################
+""")
+    write_module(src / 'gcmod.py', "    return x + 1\n")
+    import gcmod
+    print("Calling compute(1), compute(2) with the first implementation")
+    gcmod.compute(1), gcmod.compute(2)
+    first = gcmod.compute.fingerprint()
+
+    print("Changing the implementation and calling compute(1)")
+    write_module(src / 'gcmod.py', "    return x + 22\n")
+    importlib.reload(gcmod)
+    gcmod.compute(1)
+    print("Distinct fingerprints:", len(fingerprints(storage)))
+
+    print("\nastrocache.gc()")
+    print("Removed:", astrocache.gc())
+    print("Remaining fingerprints are current:", fingerprints(storage) == [gcmod.compute.fingerprint()])
+    print("Remaining entries:", len(list(storage.keys())))
+
+    print("\nEntries of unknown functions are kept unless remove_unknown=True")
+    storage.write(astrocache.Key('missing.function', 'abc', 'abc123'), b'')
+    print("Removed:", astrocache.gc())
+    print("Removed with remove_unknown=True:", astrocache.gc(remove_unknown=True))
+
+    print("""
+###############################################################################
+# python -m astrocache gc
+###############################################################################
+""")
+    write_module(src / 'gcmod.py', "    return x + 333\n")
+    importlib.reload(gcmod)
+    gcmod.compute(1)
+    print("Distinct fingerprints:", len(fingerprints(storage)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(src), os.environ.get('PYTHONPATH', '')]))
+    result = subprocess.run([sys.executable, '-m', 'astrocache', '--dir', str(astrocache.CACHE_DIR), 'gc'],
+                            capture_output=True, encoding='utf-8', env=env)
+    print(result.stdout.strip(), result.stderr.strip())
+    print("Remaining fingerprints are current:", fingerprints(storage) == [gcmod.compute.fingerprint()])
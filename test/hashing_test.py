@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import array
+import dataclasses
+import enum
+import functools
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import astrocache
+from astrocache import value_hash
+
+def show(label, obj, **kwargs):
+    try:
+        print(f"{label}: {value_hash(obj, **kwargs)}")
+    except Exception as e:
+        print(f"{label}: Exception: {e}")
+
+def same(label, a, b):
+    print(f"{label}: {value_hash(a) == value_hash(b)}")
+
+def differ(label, a, b):
+    print(f"{label}: {value_hash(a) != value_hash(b)}")
+
+print("""
+###############################################################################
+# deterministic hashes
+###############################################################################
+""")
+
+values = [None, True, 1, 2**100, 1.5, 'text', b'bytes', (1, 'a'), [1, 'a'],
+          {'b': 2, 'a': 1}, {3, 1, 2}, frozenset({'x'}), Path('/tmp/x'), 1 + 2j]
+for value in values:
+    show(repr(value), value)
+
+print("\nHashes are the same across processes with different hash seeds")
+script = "import astrocache; print([astrocache.value_hash(v) for v in %r])" % (values[:-3],)
+outputs = set()
+for seed in ('1', '2'):
+    env = dict(os.environ, PYTHONHASHSEED=seed)
+    outputs.add(subprocess.run([sys.executable, '-c', script], env=env,
+                               capture_output=True, encoding='utf-8').stdout)
+print(len(outputs) == 1)
+
+print("""
+###############################################################################
+# structural hashing
+###############################################################################
+""")
+
+same("dict ordering does not matter", {'a': 1, 'b': 2}, {'b': 2, 'a': 1})
+same("set ordering does not matter", {1, 2, 3}, {3, 2, 1})
+differ("lists and tuples differ", [1, 2], (1, 2))
+differ("nested values differ", [[1]], [[0]])
+differ("1 and True differ", 1, True)
+differ("1 and '1' differ", 1, '1')
+differ("-1 and 255 differ", -1, 255)
+differ("ints with more than 4300 digits differ", 10**5000, 10**5000 + 1)
+differ("b'ab' + b'c' and b'a' + b'bc' in a tuple differ", (b'ab', b'c'), (b'a', b'bc'))
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+class Color(enum.Enum):
+    RED = 1
+
+show("dataclass", Point(1, 2))
+same("equal dataclasses", Point(1, 2), Point(1, 2))
+show("enum", Color.RED)
+show("partial", functools.partial(int, base=2))
+
+cycle = []
+cycle.append(cycle)
+show("recursive list", cycle)
+show("recursive list (strict)", cycle, strict=True)
+
+print("""
+###############################################################################
+# buffers
+###############################################################################
+""")
+
+differ("bytes and bytearray differ", b'abc', bytearray(b'abc'))
+same("bytearray and memoryview hash alike", bytearray(b'abc'), memoryview(b'abc'))
+show("array.array", array.array('i', [1, 2, 3]))
+differ("arrays of different types differ", array.array('i', [1]), array.array('l', [1]))
+with tempfile.TemporaryFile() as f:
+    f.write(b'abc' * 1000)
+    f.flush()
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        same("mmap hashes like its contents", m, memoryview(b'abc' * 1000))
+
+print("""
+###############################################################################
+# register_hasher
+###############################################################################
+""")
+
+class Config:
+    def __init__(self, version, seed, log):
+        self.version, self.seed, self.log = version, seed, log
+
+    def __repr__(self):
+        return f'Config({self.version}, {self.seed})'
+
+show("unregistered type", Config(1, 2, None))
+show("unregistered type (strict)", Config(1, 2, None), strict=True)
+
+class Named:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f'Named({self.name!r})'
+
+    def __hash__(self):
+        return hash(self.name)
+
+same("types with __hash__ hash with it", Named('a'), Named('a'))
+show("types with __hash__ (strict)", Named('a'), strict=True)
+
+@astrocache.register_hasher(Config)
+def hash_config(config):
+    return (config.version, config.seed)
+
+show("registered type", Config(1, 2, None))
+same("fields not returned by the hasher are ignored", Config(1, 2, 'a'), Config(1, 2, 'b'))
+differ("fields returned by the hasher are not", Config(1, 2, None), Config(1, 3, None))
+
+class SubConfig(Config):
+    pass
+
+same("subclasses use the hasher of their base class", SubConfig(1, 2, None), SubConfig(1, 2, 'b'))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+from pathlib import Path
+
+import astrocache
+
+sys.dont_write_bytecode = True
+
+class CountingStorage(astrocache.SQLiteStorage):
+    """Counts the entries looked at by entries(), to check that invalidation
+    does not scan the cache."""
+    scanned = 0
+
+    def entries(self, function=None):
+        for entry in super().entries(function):
+            CountingStorage.scanned += 1
+            yield entry
+
+def write_package(src):
+    pkg = src / 'ipkg'
+    (pkg / 'sub').mkdir(parents=True)
+    (pkg / '__init__.py').write_text('')
+    (pkg / 'sub' / '__init__.py').write_text('')
+    for module in ('ipkg.a', 'ipkg.sub.b', 'ipkg.sub.c', 'ipkg.subway'):
+        path = src / (module.replace('.', '/') + '.py')
+        path.write_text("import astrocache\n\n@astrocache.cache()\ndef f(x):\n"
+                        f"    print('EXECUTED {module}.f', x)\n    return x\n")
+
+def stored(storage):
+    return {function: storage.usage(function).entries for function in storage.functions()}
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    src = Path(tmpdir) / 'src'
+    write_package(src)
+    sys.path.insert(0, str(src))
+
+    for backend in ('filesystem', 'sqlite'):
+        print(f"""
+###############################################################################
+# invalidation with {backend} storage
+###############################################################################
+""")
+        astrocache.STORAGE = backend
+        astrocache.CACHE_DIR = Path(tmpdir) / backend
+        import ipkg.a, ipkg.sub.b, ipkg.sub.c, ipkg.subway
+        storage = astrocache._default_storage()
+        for module in (ipkg.a, ipkg.sub.b, ipkg.sub.c, ipkg.subway):
+            for x in range(3):
+                module.f(x)
+        print("stored:", stored(storage))
+        print("functions under 'ipkg.sub.':", storage.functions('ipkg.sub.'))
+
+        print("\nfunc.cache_clear()")
+        print("removed:", ipkg.a.f.cache_clear())
+        print("stored:", stored(storage))
+
+        print("\ninvalidate(func, args=...)")
+        print("removed:", astrocache.invalidate(ipkg.subway.f, args=(1,)))
+        print("removed again:", astrocache.invalidate(ipkg.subway.f, args=(1,)))
+        ipkg.subway.f(0), ipkg.subway.f(1)
+
+        print("\ninvalidate(module='ipkg.sub') leaves ipkg.subway alone")
+        print("removed:", astrocache.invalidate(module='ipkg.sub'))
+        print("stored:", stored(storage))
+
+        print("\ninvalidate() by name, for another fingerprint")
+        print("removed:", astrocache.invalidate('ipkg.subway.f', fingerprint='outdated'))
+        print("removed:", astrocache.invalidate('ipkg.subway.f'))
+        print("stored:", stored(storage))
+
+    print("""
+###############################################################################
+# values kept in memory and per-function storage
+###############################################################################
+""")
+    storage = CountingStorage(Path(tmpdir) / 'counting.sqlite')
+
+    @astrocache.cache(storage=storage, memory=True)
+    def g(x):
+        print("EXECUTED g", x)
+        return x
+
+    g(1), g(2)
+    print("removed:", astrocache.invalidate(g, kwargs={'x': 1}), "(called positionally)")
+    print("removed:", astrocache.invalidate(g, args=(1,)), "(already removed)")
+    g(1), g(2)
+    print("removed:", astrocache.invalidate(module='__main__'))
+    g(1)
+    print("entries scanned:", CountingStorage.scanned)
+
+    try:
+        astrocache.invalidate()
+    except ValueError as e:
+        print("ValueError:", e)
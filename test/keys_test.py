@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import tempfile
+import astrocache
+
+from astrocache import FilesystemStorage
+
+
+class Connection:
+    def __hash__(self):
+        raise AssertionError("connections should not be hashed")
+
+
+class Config:
+    def __init__(self, version, data):
+        self.version = version
+        self.data = data
+
+
+def main():
+    storage = FilesystemStorage(tempfile.mkdtemp())
+
+    print("== Positional and keyword forms share entries ==")
+
+    @astrocache.cache(storage=storage)
+    def add(x, y=2):
+        print("EXECUTED add", x, y)
+        return x + y
+
+    print(add(1, 2))
+    print(add(1, y=2))
+    print(add(x=1))
+    print(add(y=2, x=1))
+    print(add(1, 3))
+
+    print("\n== Ignored parameters are not hashed ==")
+
+    @astrocache.cache(storage=storage, ignore=['conn', 'log'])
+    def load(conn, table, log=print):
+        log("EXECUTED load", table)
+        return table.upper()
+
+    print(load(Connection(), 'users'))
+    print(load(Connection(), 'users', log=lambda *args: None))
+    print(load(Connection(), table='orders'))
+
+    print("\n== Key functions ==")
+
+    @astrocache.cache(storage=storage, key=lambda config, x: (config.version, x))
+    def simulate(config, x):
+        print("EXECUTED simulate", config.version, x)
+        return config.version * x
+
+    print(simulate(Config(1, object()), 2))
+    print(simulate(Config(1, object()), 2))
+    print(simulate(Config(2, object()), 2))
+    print(list(simulate.map([(Config(2, object()), 2), (Config(2, object()), 3)])))
+
+    print("\n== Invalid options ==")
+
+    for options in [{'ignore': ['missing']},
+                    {'ignore': ['x'], 'key': lambda x: x}]:
+        try:
+            astrocache.cache(storage=storage, **options)(lambda x: x)
+        except ValueError as e:
+            print("ValueError:", e)
+
+
+if __name__ == '__main__':
+    main()
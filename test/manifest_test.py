@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import compileall
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import astrocache
+
+sys.dont_write_bytecode = True
+
+def write_package(src, body):
+    pkg = src / 'mpkg'
+    pkg.mkdir(exist_ok=True)
+    (pkg / '__init__.py').write_text('')
+    (pkg / 'helpers.py').write_text("def scale(x):\n    return x * 2\n")
+    (pkg / 'jobs.py').write_text(
+        "import astrocache\nfrom mpkg.helpers import scale\n\n"
+        "@astrocache.cache(strict=True)\ndef job(x):\n" + body +
+        "\n@astrocache.cache()\ndef other(x):\n    return -x\n")
+
+def run(code, **env):
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            env={**os.environ, 'PYTHONPATH': PYTHONPATH, **env})
+    return (result.stdout + result.stderr).strip()
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    src = Path(tmpdir) / 'src'
+    src.mkdir()
+    PYTHONPATH = os.pathsep.join([str(src), os.getcwd()])
+    write_package(src, "    return scale(x) + 1\n")
+    manifest_path = Path(tmpdir) / 'manifest.json'
+    show = ("import mpkg.jobs\n"
+            "print(mpkg.jobs.job.fingerprint() == EXPECTED, mpkg.jobs.job(3))")
+
+    print("""
+###############################################################################
+# python -m astrocache build-manifest
+###############################################################################
+""")
+    result = subprocess.run([sys.executable, '-m', 'astrocache', 'build-manifest', 'mpkg',
+                             '-o', str(manifest_path)], capture_output=True, text=True,
+                            env={**os.environ, 'PYTHONPATH': PYTHONPATH})
+    print(result.stdout.replace(str(manifest_path), 'manifest.json').strip())
+    manifest = astrocache.Manifest.load(manifest_path)
+    print("functions:", sorted(manifest.entries))
+    entry = manifest.entries['mpkg.jobs.job']
+    print("strict:", entry.strict, "root:", entry.root)
+    print("files:", sorted(Path(f).name for f in entry.files))
+
+    sys.path.insert(0, str(src))
+    import mpkg.jobs
+    print("Matches the computed fingerprint:",
+          entry.fingerprint == mpkg.jobs.job.fingerprint())
+
+    print("""
+###############################################################################
+# using a manifest
+###############################################################################
+""")
+    expected = f"EXPECTED = {entry.fingerprint!r}\n"
+    print("Without source files, strict functions cannot be fingerprinted:")
+    compileall.compile_dir(src / 'mpkg', legacy=True, quiet=1)
+    for py in (src / 'mpkg').glob('*.py'):
+        py.rename(py.with_suffix('.py.bak'))
+    print(run(expected + show, ASTROCACHE_DIR=str(Path(tmpdir) / 'cache'))
+          .splitlines()[-1].split(':')[0])
+    print("With ASTROCACHE_MANIFEST, they are not inspected:")
+    print(run(expected + show, ASTROCACHE_DIR=str(Path(tmpdir) / 'cache'),
+              ASTROCACHE_MANIFEST=str(manifest_path)))
+    for bak in (src / 'mpkg').glob('*.py.bak'):
+        bak.rename(bak.with_suffix(''))
+    for pyc in (src / 'mpkg').glob('*.pyc'):
+        pyc.unlink()
+
+    print("\nA manifest is used as is, even if the source has changed since")
+    write_package(src, "    return scale(x) + 100\n")
+    print(run(expected + show, ASTROCACHE_DIR=str(Path(tmpdir) / 'cache2'),
+              ASTROCACHE_MANIFEST=str(manifest_path)))
+    print("unless loaded with check_files")
+    print(run(expected + "import astrocache\n"
+              f"astrocache.load_manifest({str(manifest_path)!r}, check_files=True)\n" + show,
+              ASTROCACHE_DIR=str(Path(tmpdir) / 'cache3')))
+
+    print("\nEntries are only used with the root and strict they were built with")
+    print(manifest.lookup(mpkg.jobs.job.__wrapped__, None, True) == entry.fingerprint,
+          manifest.lookup(mpkg.jobs.job.__wrapped__, None, False),
+          manifest.lookup(mpkg.jobs.job.__wrapped__, '/elsewhere', True))
+
+    print("\nA missing manifest is ignored with a warning")
+    output = run("import astrocache; print(astrocache._manifest)",
+                 ASTROCACHE_MANIFEST=str(Path(tmpdir) / 'missing.json'))
+    print("Warned:", 'Ignoring ASTROCACHE_MANIFEST' in output, "loaded:", output.splitlines()[0])
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import astrocache
+
+class CountingStorage(astrocache.SQLiteStorage):
+    bulk_reads = reads = 0
+
+    def read(self, key):
+        CountingStorage.reads += 1
+        return super().read(key)
+
+    def read_many(self, keys):
+        CountingStorage.bulk_reads += 1
+        return super().read_many(keys)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+    storage = CountingStorage(Path(tmpdir) / 'cache.sqlite')
+    executed = []
+
+    @astrocache.cache(storage=storage)
+    def power(x, exponent=2):
+        # Misses run in pool workers, so calls are recorded rather than
+        # printed to keep the output ordered
+        executed.append(f"power({x}, {exponent})")
+        return x ** exponent
+
+    def report(results):
+        for call in sorted(executed):
+            print(f"EXECUTED {call}")
+        executed.clear()
+        print(results)
+
+    @astrocache.cache()
+    def slow_square(x):
+        time.sleep(0.05 * (5 - x))
+        return x * x
+
+    @astrocache.cache()
+    def pid_square(x):
+        return x * x, os.getpid()
+
+    print("""
+###############################################################################
+# func.map()
+###############################################################################
+""")
+    print("power.map([1, 2, 3])")
+    report(list(power.map([1, 2, 3])))
+
+    print("\npower.map([1, 2, (3, 3), 4, 4])")
+    report(list(power.map([1, 2, (3, 3), 4, 4])))
+    print(f"Entries looked up in bulk: {CountingStorage.bulk_reads} lookups, "
+          f"{CountingStorage.reads} single reads")
+
+    print("\nmap() and calls share entries")
+    report(power(3, 3))
+    report(power(5))
+    report(list(power.map([5])))
+
+    print("\nChunks are looked up and stored together")
+    CountingStorage.bulk_reads = 0
+    report(list(power.map(range(6, 9), chunk_size=2)))
+    print(f"Bulk lookups: {CountingStorage.bulk_reads}")
+
+    print("""
+###############################################################################
+# workers
+###############################################################################
+""")
+    print("Results are yielded in order when misses finish out of order")
+    start = time.monotonic()
+    print(list(slow_square.map(range(5), workers=5)))
+    print(f"Misses ran in parallel: {time.monotonic() - start < 0.4}")
+
+    print("\nexecutor='process' computes misses in other processes")
+    results = list(pid_square.map(range(4), workers=2, executor='process'))
+    print([square for square, _ in results])
+    print(f"In other processes: {all(pid != os.getpid() for _, pid in results)}")
+    print(f"Stored: {list(pid_square.map(range(4))) == results}")
+
+    print("\nResults are streamed")
+    squares = pid_square.map(range(10, 10**9), chunk_size=100)
+    print(next(squares)[0], next(squares)[0])
+    squares.close()
+
+    try:
+        list(power.map([1], executor='fiber'))
+    except ValueError as e:
+        print(f"\nException: {e}")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import tempfile
+from pathlib import Path
+
+import astrocache
+
+class CountingStorage(astrocache.FilesystemStorage):
+    reads = 0
+
+    def read(self, key):
+        CountingStorage.reads += 1
+        return super().read(key)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    storage = CountingStorage(Path(tmpdir) / 'cache')
+
+    @astrocache.cache(storage=storage, memory=True, memory_max_bytes=300)
+    def make_list(n):
+        print("EXECUTED")
+        return list(range(n))
+
+    print("""
+###############################################################################
+# memory=True
+###############################################################################
+""")
+    print("Calling make_list(10) twice")
+    first = make_list(10)
+    second = make_list(10)
+    print(f"Same object: {first is second}, storage reads: {CountingStorage.reads}")
+
+    print("\nA new in-memory tier is filled from storage")
+    make_list.memory.clear()
+    third = make_list(10)
+    fourth = make_list(10)
+    print(f"Equal: {third == first}, same object: {third is fourth}, "
+          f"storage reads: {CountingStorage.reads}")
+
+    print("\nValues are evicted least recently used first once over memory_max_bytes")
+    for n in range(20, 60, 10):
+        make_list(n)
+    print(f"Usage: {make_list.memory.usage()}")
+    CountingStorage.reads = 0
+    make_list(50)
+    print(f"make_list(50) read from storage: {CountingStorage.reads}")
+    make_list(10)
+    make_list(10)
+    print(f"make_list(10) read from storage: {CountingStorage.reads}")
+    print(f"Usage: {make_list.memory.usage()}")
+
+    print("\nValues larger than memory_max_bytes are not kept in memory")
+    make_list(1000)
+    print(f"Usage: {make_list.memory.usage()}")
+
+    print("""
+###############################################################################
+# invalidation
+###############################################################################
+""")
+    print("clear_cache() clears values kept in memory")
+    astrocache.clear_cache(storage)
+    make_list(10)
+
+    print("\nEvicting an entry from storage removes it from memory")
+    astrocache._evictor.add_limit(storage, astrocache.Limit(max_entries=1))
+    make_list(20)
+    astrocache._evictor.run()
+    print(f"Stored: {len(list(storage.keys()))}, in memory: {make_list.memory.usage().entries}")
+    make_list(10)
+
+    print("\ngc() removes values of outdated implementations from memory")
+    key = astrocache._get_cache_key(make_list.__wrapped__, [10], {})
+    outdated = key._replace(fingerprint='outdated')
+    make_list.memory.put(storage, outdated, [], 10)
+    storage.write(outdated, b'')
+    astrocache.gc(storage)
+    try:
+        make_list.memory.get(storage, outdated)
+        print("Outdated value kept in memory")
+    except KeyError:
+        print("Outdated value removed from memory")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import pickle
+import tempfile
+import warnings
+from pathlib import Path
+
+import astrocache
+from astrocache import FilesystemStorage, HTTPStorage, TieredStorage
+from astrocache.remote import serve
+
+class Blob:
+    """Like a NumPy array, hands its contents to pickle as a PickleBuffer."""
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __reduce_ex__(self, protocol):
+        return type(self), (pickle.PickleBuffer(self.buffer),)
+
+def host(tmpdir, name, remote):
+    return TieredStorage(FilesystemStorage(Path(tmpdir) / name), remote)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    server = serve(Path(tmpdir) / 'server')
+    url = f'http://127.0.0.1:{server.server_port}'
+
+    for remote_name in ('http', 'filesystem'):
+        print(f"""
+###############################################################################
+# TieredStorage with a {remote_name} remote tier
+###############################################################################
+""")
+        if remote_name == 'http':
+            remote = HTTPStorage(url, pool_size=2)
+        else:
+            remote = FilesystemStorage(Path(tmpdir) / 'nfs')
+        a = host(tmpdir, f'{remote_name}-a', remote)
+        b = host(tmpdir, f'{remote_name}-b', remote)
+
+        def make(storage):
+            @astrocache.cache(storage=storage)
+            def square(x):
+                print("EXECUTED square", x)
+                return x * x
+            return square
+
+        square_a, square_b = make(a), make(b)
+        print("Host a computes square(2) and square(3)")
+        square_a(2), square_a(3)
+        a.flush()
+        print("Host b reads them from the remote tier:", square_b(2), square_b(3))
+        print("and keeps them locally:", len(list(b.local.keys())))
+
+        print("\nfunc.map() on host b fetches missing entries in parallel")
+        print(list(square_b.map([2, 3, 4])))
+
+        print("\nprefetch() copies entries to the local tier in the background")
+        square_a(5)
+        a.flush()
+        key = astrocache._get_cache_key(square_b.__wrapped__, [5], {})
+        b.prefetch([key])
+        b._pool.submit(lambda: None).result()
+        for future in list(b._fetches.values()):
+            future.result()
+        print("local:", b.local.contains(key), "square_b(5):", square_b(5))
+
+        print("\nEvicting from a host only removes its local copy")
+        print("evicted:", b.evict(key), "remote:", remote.contains(key))
+
+        print("\ninvalidate() removes entries from both tiers")
+        print("removed:", astrocache.invalidate(square_b, args=(5,)),
+              "remote:", remote.contains(key))
+        print("functions:", [f.split('.')[-1] for f in b.functions()])
+        print("removed:", square_a.cache_clear(), "remote functions:", remote.functions())
+
+    print("""
+###############################################################################
+# HTTPStorage
+###############################################################################
+""")
+    remote = HTTPStorage(url, pool_size=2)
+
+    def make_array(storage):
+        @astrocache.cache(storage=storage, serializer='pickle5')
+        def array(n):
+            print("EXECUTED array", n)
+            return Blob(bytes(range(256)) * n)
+        return array
+
+    storage = host(tmpdir, 'arrays', remote)
+    make_array(storage)(1000)
+    storage.flush()
+    array = make_array(host(tmpdir, 'arrays-other', remote))
+    result = array(1000)
+    print("Out-of-band buffers are fetched too:", bytes(result.buffer) == bytes(range(256)) * 1000,
+          type(result.buffer.obj).__name__)
+
+    print("\nCorrupt objects are treated as missing")
+    key = astrocache.Key('mod.fn', 'f1', 'ab' * 16)
+    remote.write(key, b'payload')
+    path = next((Path(tmpdir) / 'server' / 'mod.fn').glob('*/*'))
+    path.write_bytes(path.read_bytes()[:-1] + b'!')
+    try:
+        remote.read(key)
+    except KeyError:
+        print("KeyError")
+
+    print("\ncontains() does not download objects")
+    methods = []
+    request = remote._pool.request
+    remote._pool.request = lambda method, *args: (methods.append(method), request(method, *args))[1]
+    print(remote.contains(key), remote.contains(astrocache.Key('mod.fn', 'f1', 'cd' * 16)), methods)
+    del remote._pool.request
+
+    print("\nConnections are reused:", 0 < remote._pool._idle.qsize() <= 2)
+
+    print("\nFailed uploads do not fail calls")
+    unreachable = host(tmpdir, 'unreachable', HTTPStorage('http://127.0.0.1:1', timeout=1))
+
+    @astrocache.cache(storage=unreachable)
+    def negate(x):
+        return -x
+
+    print("negate(1):", negate(1))
+    unreachable.flush()
+    print("failed uploads:", unreachable.failed_uploads)
+    print("contains() counts the remote tier as missing:",
+          unreachable.contains(astrocache.Key('mod.fn', 'f1', 'ef' * 16)))
+    print("warmed:", astrocache.warm(negate, [1, 2], executor='thread', workers=1))
+
+    print("\nRepeated failures are reported once a minute")
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        for x in range(3, 6):
+            negate(x)
+        unreachable.flush()
+        print("warnings:", len(caught))
+        unreachable.FAILURE_WARNING_INTERVAL = 0
+        negate(6)
+        unreachable.flush()
+    print("warnings:", len(caught), str(caught[0].message).rsplit(' (', 1)[-1])
+    server.shutdown()
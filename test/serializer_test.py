@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import astrocache
+from astrocache import FilesystemStorage, Key, SQLiteStorage
+
+class Blob:
+    """Like a NumPy array, hands its contents to pickle as a PickleBuffer."""
+
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer)
+
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5:
+            return type(self), (pickle.PickleBuffer(self.buffer),)
+        return type(self), (self.buffer.tobytes(),)
+
+def mapped(view):
+    return isinstance(view.obj, mmap.mmap)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+
+    print("""
+###############################################################################
+# serializer='pickle5'
+###############################################################################
+""")
+    @astrocache.cache(serializer='pickle5')
+    def make_blobs(n):
+        print("EXECUTED")
+        return {'small': Blob(b'x' * 10), 'large': Blob(bytes(range(256)) * n), 'n': n}
+
+    print("Calling make_blobs(1000) twice")
+    computed = make_blobs(1000)
+    loaded = make_blobs(1000)
+    print(f"Equal: {loaded['large'].buffer == computed['large'].buffer}, n: {loaded['n']}")
+    print(f"Large buffer memory-mapped: {mapped(loaded['large'].buffer)}, "
+          f"read-only: {loaded['large'].buffer.readonly}")
+    print(f"Small buffer memory-mapped: {mapped(loaded['small'].buffer)}")
+
+    storage = astrocache._default_storage()
+    print("\nLayout:")
+    for dirpath, _, filenames in os.walk(storage.path):
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path):
+                # The index of blobs by inode
+                continue
+            kind = 'blob  ' if '.blobs' in dirpath else 'buffer' if filename.endswith('.buf') else 'entry '
+            print(f"{kind} {os.path.getsize(path)}")
+    entry, = storage.entries()
+    print(f"Entry size includes buffers: {entry.size > 256 * 1000}")
+
+    print("\nDeleting the entry removes its buffers")
+    storage.delete(entry.key)
+    print(sum(len(files) for _, _, files in os.walk(storage.path)))
+
+    print("""
+###############################################################################
+# out-of-band buffers in storage
+###############################################################################
+""")
+    key = Key('mod.fn', 'f1', 'aa01')
+    for storage in (FilesystemStorage(Path(tmpdir) / 'fs'),
+                    SQLiteStorage(Path(tmpdir) / 'cache.sqlite')):
+        print(type(storage).__name__)
+        storage.write(key, b'data', [b'first', bytearray(b'second'), b''])
+        print("read:", storage.read(key), [bytes(b) for b in storage.read_buffers(key)])
+        storage.write(key, b'data', [b'only'])
+        print("rewritten:", [bytes(b) for b in storage.read_buffers(key)])
+        print("size:", next(storage.entries()).size)
+        storage.delete(key)
+        print("deleted:", storage.read_buffers(key))
+        print()
+
+    print("""
+###############################################################################
+# custom serializers
+###############################################################################
+""")
+    class ReprSerializer(astrocache.Serializer):
+        def dumps(self, value):
+            return repr(value).encode(), []
+
+        def loads(self, data, buffers=()):
+            return eval(data)
+
+    @astrocache.cache(serializer=ReprSerializer())
+    def make_dict(n):
+        print("EXECUTED")
+        return {'n': n}
+
+    print(make_dict(1))
+    print(make_dict(1))
+    print(f"Stored as: {astrocache._default_storage().read(next(astrocache._default_storage().keys()))}")
+
+    try:
+        astrocache.cache(serializer='json')
+    except ValueError as e:
+        print(f"\nException: {e}")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import astrocache
+
+def executions(log):
+    return len(log.read_text().splitlines()) if log.exists() else 0
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+    log = Path(tmpdir) / 'executions'
+
+    @astrocache.cache(single_flight=True)
+    def slow_square(x):
+        with open(log, 'a') as f:
+            f.write(f'{os.getpid()}\n')
+        time.sleep(0.3)
+        return x * x
+
+    print("""
+###############################################################################
+# single_flight across threads
+###############################################################################
+""")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(slow_square(3)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print("Calling slow_square(3) from 8 threads at once")
+    print(f"Results: {sorted(set(results))}, executions: {executions(log)}")
+
+    print("""
+###############################################################################
+# single_flight across processes
+###############################################################################
+""")
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(8) as pool:
+        results = pool.map(slow_square, [4] * 8)
+    print("Calling slow_square(4) from 8 processes at once")
+    print(f"Results: {sorted(set(results))}, executions: {executions(log) - 1}")
+
+    for storage in ('filesystem', 'sqlite'):
+        astrocache.STORAGE = storage
+        log.unlink()
+        with ctx.Pool(8) as pool:
+            results = pool.map(slow_square, [5] * 8)
+        print(f"Calling slow_square(5) from 8 processes at once with {storage} storage")
+        print(f"Results: {sorted(set(results))}, executions: {executions(log)}")
+    astrocache.STORAGE = 'filesystem'
+
+    print("""
+###############################################################################
+# lock files
+###############################################################################
+""")
+    storage = astrocache._default_storage()
+    key = astrocache._get_cache_key(slow_square.__wrapped__, [6], {})
+    lock_path = storage.lock_path(key)
+    fd = os.open(lock_path.parent.mkdir(parents=True, exist_ok=True) or lock_path,
+                 os.O_RDWR | os.O_CREAT)
+    import fcntl
+    fcntl.flock(fd, fcntl.LOCK_EX)
+
+    print("Lock files are not mistaken for entries")
+    print([k for k in storage.keys() if k.id.endswith('.lock')])
+
+    print("\nA lock held by a process that has exited is broken")
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                            capture_output=True, encoding='utf-8')
+    os.write(fd, f'{exited.stdout.strip()} {astrocache.locking._HOST}\n'.encode())
+    # A child that inherited the descriptor keeps the lock held
+    sleeper = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'],
+                               pass_fds=(fd,))
+    os.close(fd)
+    log.unlink()
+    print(f"slow_square(6) = {slow_square(6)}, executions: {executions(log)}")
+    print(f"Lock file removed: {not lock_path.exists()}")
+    sleeper.kill()
+    sleeper.wait()
+
+    print("\nA lock held by a live process is waited for until lock_timeout")
+    @astrocache.cache(single_flight=True, lock_timeout=0.2)
+    def impatient_square(x):
+        print("EXECUTED")
+        return x * x
+    key = astrocache._get_cache_key(impatient_square.__wrapped__, [7], {})
+    fd = os.open(storage.lock_path(key).parent.mkdir(parents=True, exist_ok=True)
+                 or storage.lock_path(key), os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    os.write(fd, f'{os.getpid()} {astrocache.locking._HOST}\n'.encode())
+    start = time.monotonic()
+    print(f"impatient_square(7) = {impatient_square(7)}")
+    print(f"Waited for the timeout: {time.monotonic() - start >= 0.2}")
+    os.close(fd)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+import astrocache
+
+def show(stats, function):
+    s = stats[function]
+    phases = [phase for phase, histogram in s.timings.items() if histogram.count]
+    print(f"{function}: hits={s.hits} misses={s.misses} hit_rate={s.hit_rate:.2f} "
+          f"read={s.bytes_read > 0} written={s.bytes_written > 0}")
+    print(f"  phases: {phases}")
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+
+    @astrocache.cache()
+    def square(x):
+        return x * x
+
+    @astrocache.cache(memory=True)
+    def cube(x):
+        return x * x * x
+
+    @astrocache.cache()
+    async def negate(x):
+        return -x
+
+    print("""
+###############################################################################
+# scoped stats
+###############################################################################
+""")
+    with astrocache.stats() as stats:
+        square(2)
+        square(2)
+        square(3)
+    show(stats, '__main__.square')
+    compute = stats['__main__.square'].timings['compute']
+    print("compute histogram count:", compute.count,
+          "p50 <= max:", compute.quantile(0.5) <= compute.max)
+
+    print("\nCalls outside the block are not collected")
+    square(4)
+    print("misses:", stats['__main__.square'].misses)
+
+    print("\nHits on the in-memory tier read nothing from storage")
+    with astrocache.stats() as stats:
+        cube(2)
+        cube(2)
+    show(stats, '__main__.cube')
+
+    print("\nCoroutine functions")
+    async def main():
+        await negate(1)
+        await negate(1)
+    with astrocache.stats() as stats:
+        asyncio.run(main())
+    show(stats, '__main__.negate')
+
+    print("\nfunc.map() counts each item")
+    with astrocache.stats() as stats:
+        list(square.map([2, 3, 5, 6]))
+    show(stats, '__main__.square')
+
+    print("""
+###############################################################################
+# process-wide stats and hooks
+###############################################################################
+""")
+    totals = astrocache.stats()
+    print("square totals:", totals['__main__.square'].hits,
+          totals['__main__.square'].misses)
+    print("summary header:", totals.summary().splitlines()[0].split())
+    print("as_dict keys:", sorted(totals.as_dict()['__main__.square']))
+
+    calls = []
+    astrocache.set_stats_hook(calls.append)
+    square(7)
+    square(7)
+    astrocache.set_stats_hook(None)
+    square(7)
+    print("hook calls:", [(c.function, c.hits, c.misses) for c in calls])
+
+    print("\nA failing hook does not fail the call")
+    def fail(call):
+        raise RuntimeError("metrics pipeline is down")
+    astrocache.set_stats_hook(fail)
+    print("square(8):", square(8))
+    astrocache.set_stats_hook(None)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import astrocache
+from astrocache import FilesystemStorage, Key, SQLiteStorage
+
+keys = [
+    Key('mod.fn', 'f1', 'aa01'),
+    Key('mod.fn', 'f1', 'ab02'),
+    Key('mod.fn', 'f2', 'aa03'),
+    Key('mod.<locals>.other', 'f3', 'cd04'),
+]
+
+def exercise(storage):
+    for i, key in enumerate(keys):
+        storage.write(key, f'value {i}'.encode())
+    print("read:", storage.read(keys[0]))
+    print("contains:", storage.contains(keys[1]), storage.contains(Key('mod.fn', 'f1', 'ff99')))
+    try:
+        storage.read(Key('mod.fn', 'f1', 'ff99'))
+    except KeyError:
+        print("read missing: KeyError")
+    print("keys:", sorted(storage.keys()))
+    print("delete:", storage.delete(keys[1]), storage.delete(keys[1]))
+    print("invalidate fingerprint f1:", storage.invalidate(function='mod.fn', fingerprint='f1'))
+    print("invalidate function mod.fn:", storage.invalidate(function='mod.fn'))
+    print("keys:", sorted(storage.keys()))
+    storage.write(keys[0], b'overwritten')
+    storage.write(keys[0], b'overwritten again')
+    print("read:", storage.read(keys[0]))
+    print("\nEntries of different functions with the same id are distinct")
+    other = Key('mod.g', 'f1', keys[0].id)
+    storage.write(other, b'of g', [b'buffer of g'])
+    print("read:", storage.read(keys[0]), storage.read(other),
+          [bytes(b) for b in storage.read_buffers(keys[0])],
+          [bytes(b) for b in storage.read_buffers(other)])
+    print("read_many:", sorted(storage.read_many([keys[0], other]).values()))
+    print("delete:", storage.delete(other), storage.contains(keys[0]), storage.contains(other))
+    storage.clear()
+    print("keys after clear:", sorted(storage.keys()))
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    print("""
+###############################################################################
+# FilesystemStorage
+###############################################################################
+""")
+    storage = FilesystemStorage(Path(tmpdir) / 'fs')
+    for key in keys:
+        storage.write(key, b'')
+    print("Layout:")
+    for dirpath, dirnames, filenames in sorted(os.walk(storage.path)):
+        for filename in sorted(filenames):
+            print(os.path.relpath(os.path.join(dirpath, filename), storage.path))
+    storage.clear()
+    print()
+    exercise(storage)
+
+    print("""
+###############################################################################
+# SQLiteStorage
+###############################################################################
+""")
+    storage = SQLiteStorage(Path(tmpdir) / 'cache.sqlite', batch_size=2, commit_interval=60)
+    exercise(storage)
+
+    print("\nPending writes are committed on flush")
+    storage.write(keys[0], b'pending')
+    other = SQLiteStorage(storage.path)
+    print("visible to other connection before flush:", other.contains(keys[0]))
+    storage.flush()
+    print("visible to other connection after flush:", other.contains(keys[0]))
+    other.close()
+    storage.close()
+
+    print("\nProcesses writing to the same database do not wait for each other's batches")
+    script = """
+import sys, time
+from astrocache import Key, SQLiteStorage
+storage = SQLiteStorage(sys.argv[1])
+slowest = 0
+for i in range(10):
+    start = time.monotonic()
+    storage.write(Key('mod.fn', 'f1', f'{sys.argv[2]}{i:02}'), b'x' * 1000)
+    slowest = max(slowest, time.monotonic() - start)
+    time.sleep(0.05)
+print(slowest)
+"""
+    path = Path(tmpdir) / 'shared.sqlite'
+    processes = [subprocess.Popen([sys.executable, '-c', script, str(path), f'p{n}'],
+                                  stdout=subprocess.PIPE, text=True)
+                 for n in range(8)]
+    slowest = max(float(process.communicate()[0]) for process in processes)
+    print("slowest write under 0.5s:", slowest < 0.5)
+    storage = SQLiteStorage(path)
+    print("entries:", storage.usage().entries)
+    storage.close()
+
+    print("""
+###############################################################################
+# @astrocache.cache(storage=...)
+###############################################################################
+""")
+    storage = SQLiteStorage(Path(tmpdir) / 'decorated.sqlite')
+
+    @astrocache.cache(storage=storage)
+    def square(x):
+        print("EXECUTED")
+        return x * x
+
+    print("Calling square(3)...")
+    print(square(3))
+    print("\nCalling square(3)...")
+    print(square(3))
+    print("\nEntries:", [key.function for key in storage.keys()])
+    astrocache.clear_cache(storage)
+    print("\nCalling square(3) after clear_cache(storage)...")
+    print(square(3))
+    storage.close()
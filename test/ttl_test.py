@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import asyncio
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import astrocache
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+    version = {'value': 1}
+    computed = []
+
+    @astrocache.cache(ttl=0.3)
+    def snapshot(name):
+        computed.append(name)
+        return f"{name} v{version['value']}"
+
+    print("""
+###############################################################################
+# ttl
+###############################################################################
+""")
+    print("Within the ttl, results are returned from the cache")
+    print(snapshot('db'), snapshot('db'), "computed:", len(computed))
+    print("\nOnce expired, they are recomputed")
+    version['value'] = 2
+    time.sleep(0.5)
+    print(snapshot('db'), "computed:", len(computed))
+    print(snapshot('db'), "computed:", len(computed))
+
+    print("\nEntries record when they were written")
+    key = astrocache._get_cache_key(snapshot.__wrapped__, ['db'], {})
+    written, _ = astrocache.expiry.unstamp(astrocache._default_storage().read(key))
+    print("written within the last second:", 0 <= time.time() - written < 1)
+
+    print("""
+###############################################################################
+# stale_while_revalidate
+###############################################################################
+""")
+    release = threading.Event()
+    calls = []
+
+    @astrocache.cache(ttl=timedelta(seconds=0.3), stale_while_revalidate=60, memory=True)
+    def pull(source):
+        calls.append(threading.current_thread().name.split('_')[0])
+        if len(calls) > 1:
+            release.wait()
+        return f"{source} v{len(calls)}"
+
+    print(pull('api'))
+    time.sleep(0.5)
+    print("Stale results are returned while being recomputed:", pull('api'), pull('api'))
+    print("recomputing in:", calls[-1] if wait_for(lambda: len(calls) == 2) else None)
+    release.set()
+    print("replaced:", wait_for(lambda: pull('api') == 'api v2'), "calls:", len(calls))
+
+    print("\nfunc.map() returns stale results too")
+    time.sleep(0.5)
+    print(list(pull.map(['api'])))
+    print("replaced:", wait_for(lambda: pull('api') == 'api v3'))
+
+    print("\nBeyond the stale window, results are recomputed by the caller")
+
+    @astrocache.cache(ttl=0.2, stale_while_revalidate=0.2)
+    def short(x):
+        calls.append(threading.current_thread().name.split('_')[0])
+        return len(calls)
+
+    first = short(1)
+    time.sleep(0.6)
+    print("new result:", short(1) > first, "computed by:", calls[-1])
+
+    print("""
+###############################################################################
+# coroutine functions
+###############################################################################
+""")
+    async_calls = []
+
+    @astrocache.cache(ttl=0.3, stale_while_revalidate=60)
+    async def fetch(url):
+        async_calls.append(url)
+        await asyncio.sleep(0.01)
+        return f"{url} v{len(async_calls)}"
+
+    async def main():
+        print(await fetch('a'))
+        await asyncio.sleep(0.5)
+        print("stale:", await fetch('a'), await fetch('a'))
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if len(async_calls) == 2:
+                break
+        print("recomputed:", await fetch('a'), "calls:", len(async_calls))
+
+    asyncio.run(main())
+
+    print("\nRemoving the ttl keeps the stamped entries, which no longer expire")
+
+    def lookup(x):
+        print("EXECUTED lookup", x)
+        return x * 10
+
+    storage = astrocache.FilesystemStorage(Path(tmpdir) / 'untimed')
+    print(astrocache.cache(storage=storage, ttl=0.1)(lookup)(1))
+    time.sleep(0.2)
+    print(astrocache.cache(storage=storage)(lookup)(1))
+    print("An entry without a stamp has expired once a ttl is added:")
+    print(astrocache.cache(storage=storage)(lookup)(2))
+    print(astrocache.cache(storage=storage, ttl=60)(lookup)(2))
+
+    print("\nstale_while_revalidate requires a ttl")
+    try:
+        astrocache.cache(stale_while_revalidate=10)
+    except ValueError as e:
+        print("ValueError:", e)
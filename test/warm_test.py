@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+from pathlib import Path
+
+import astrocache
+
+sys.dont_write_bytecode = True
+
+tmpdir = tempfile.mkdtemp()
+storage = astrocache.SQLiteStorage(Path(tmpdir) / 'cache.sqlite')
+
+
+@astrocache.cache(storage=storage, record_args=True)
+def square(x, scale=1):
+    return x * x * scale
+
+
+print("""
+###############################################################################
+# recording arguments
+###############################################################################
+""")
+for x in range(5):
+    square(x)
+square(2, scale=10)
+storage.flush()
+old = square.fingerprint()
+entries = sorted(storage.entries('__main__.square'), key=lambda entry: entry.key.id)
+print("recorded:", sorted(map(repr, (astrocache.arguments.recorded(storage.read(entry.key))
+                                     for entry in entries))))
+print("results are read as usual:", square(3), square(2, scale=10))
+for _ in range(5):
+    square(3)
+for _ in range(3):
+    square(4)
+astrocache.evict()
+print("reads are counted:", sorted(
+    (entry.hits, repr(astrocache.arguments.recorded(storage.read(entry.key))))
+    for entry in storage.entries('__main__.square') if entry.hits))
+
+
+@astrocache.cache(storage=storage, record_args=True)
+def square(x, scale=1):
+    print("EXECUTED square", x, scale, flush=True)
+    return x * x * scale + 1000
+
+
+print("""
+###############################################################################
+# astrocache.warm()
+###############################################################################
+""")
+print("fingerprint changed:", old != square.fingerprint())
+print("The most read calls are replayed first:")
+print("warmed:", astrocache.warm(square, executor='thread', workers=1, limit=2))
+print("warmed:", astrocache.warm(square, executor='thread', workers=1))
+print("\nCalls are now hits:")
+with astrocache.stats() as stats:
+    print([square(x) for x in range(5)], square(2, scale=10))
+print("misses:", stats.functions['__main__.square'].misses)
+
+print("\nExplicit calls, as in map(); cached ones are skipped:")
+print("warmed:", astrocache.warm(square, [4, 5, (6, 2)], executor='thread', workers=1))
+
+print("\nFailed calls are reported and skipped:")
+with warnings.catch_warnings(record=True) as caught:
+    warnings.simplefilter('always')
+    print("warmed:", astrocache.warm(square, [7, ('x', 'y')], executor='thread', workers=1))
+for warning in caught:
+    print(f"{warning.category.__name__}: {warning.message}")
+
+print("\nUnknown functions:")
+for func in ['__main__.missing', print]:
+    try:
+        astrocache.warm(func)
+    except (LookupError, TypeError) as e:
+        print(type(e).__name__, e)
+
+print("\nEntries recorded before record_args was turned off are still read:")
+for recording in [True, False]:
+    @astrocache.cache(storage=storage, record_args=recording)
+    def halve(x):
+        print("EXECUTED halve", x, flush=True)
+        return x / 2
+
+    with astrocache.stats() as stats:
+        print("record_args:", recording, [halve(x) for x in range(3)],
+              "misses:", stats.functions['__main__.halve'].misses)
+
+print("""
+###############################################################################
+# python -m astrocache warm
+###############################################################################
+""")
+src = Path(tmpdir) / 'src'
+(src / 'wpkg').mkdir(parents=True)
+(src / 'wpkg' / '__init__.py').write_text('')
+jobs = src / 'wpkg' / 'jobs.py'
+env = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(src), os.getcwd()]),
+       'ASTROCACHE_DIR': str(Path(tmpdir) / 'cache')}
+jobs.write_text("import astrocache\n\n@astrocache.cache(record_args=True)\n"
+                "def cube(x):\n    return x ** 3\n")
+subprocess.run([sys.executable, '-c', "from wpkg.jobs import cube; [cube(i) for i in range(8)]"],
+               env=env, check=True)
+# Reads in other processes count too
+subprocess.run([sys.executable, '-c', "from wpkg.jobs import cube; [cube(5) for _ in range(3)]"],
+               env=env, check=True)
+jobs.write_text("import astrocache\n\n@astrocache.cache(record_args=True)\n"
+                "def cube(x):\n    return x * x * x\n")
+check = ("import astrocache\nfrom wpkg.jobs import cube\n"
+         "with astrocache.stats() as stats:\n"
+         "    print([cube(i) for i in {}])\n"
+         "print('misses:', stats.functions['wpkg.jobs.cube'].misses)")
+for args, calls in [(['--limit', '1'], [5]), (['-j', '2'], range(8))]:
+    result = subprocess.run([sys.executable, '-m', 'astrocache', 'warm', 'wpkg.jobs.cube', *args],
+                            capture_output=True, text=True, env=env)
+    print((result.stdout + result.stderr).strip())
+    result = subprocess.run([sys.executable, '-c', check.format(list(calls))],
+                            capture_output=True, text=True, env=env)
+    print((result.stdout + result.stderr).strip())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import importlib
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import astrocache
+
+sys.dont_write_bytecode = True
+
+def write_helper(path, body):
+    path.write_text(f"def helper(x):\n    return {body}\n")
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def memoized(func):
+    return bool(astrocache._fingerprints.get(func))
+
+def count_stats(fn):
+    calls = []
+    original = astrocache._file_state
+    astrocache._file_state = lambda filename: calls.append(filename) or original(filename)
+    try:
+        fn()
+    finally:
+        astrocache._file_state = original
+    return len(calls)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+    src = Path(tmpdir) / 'src'
+    src.mkdir()
+    sys.path.insert(0, str(src))
+    (src / 'watchmod.py').write_text(
+        "import astrocache\nfrom watchhelper import helper\n\n"
+        "@astrocache.cache()\ndef compute(x):\n    print('EXECUTED')\n    return helper(x)\n")
+    write_helper(src / 'watchhelper.py', "x + 1")
+    import watchmod
+
+    for backend in ('polling', 'auto'):
+        print(f"""
+###############################################################################
+# watch(backend={backend!r})
+###############################################################################
+""")
+        print("compute(1) =", watchmod.compute(1))
+        print("Source files checked per call before watching:",
+              count_stats(lambda: watchmod.compute(1)) > 0)
+        astrocache.watch(interval=0.05, backend=backend)
+        print("Source files checked per call while watching:",
+              count_stats(lambda: watchmod.compute(1)))
+
+        print("\nChanging the helper the cached function calls")
+        before = watchmod.compute.fingerprint()
+        write_helper(src / 'watchhelper.py', "x + 1" if backend == 'auto' else "x + 1000")
+        print("Fingerprint discarded:",
+              wait_for(lambda: not memoized(watchmod.compute.__wrapped__)))
+        print("New fingerprint:", watchmod.compute.fingerprint() != before)
+
+        print("\nReloading the helper module")
+        importlib.reload(sys.modules['watchhelper'])
+        importlib.reload(watchmod)
+        print("compute(1) =", watchmod.compute(1))
+        print("Watching again:", count_stats(lambda: watchmod.compute(1)))
+        astrocache.stop_watching()
+
+    print("""
+###############################################################################
+# unrelated changes
+###############################################################################
+""")
+    astrocache.watch(interval=0.05, backend='polling')
+    watchmod.compute(1)
+    (src / 'unrelated.py').write_text("x = 1\n")
+    write_helper(src / 'watchhelper.py', "x + 1    # same AST")
+    wait_for(lambda: not memoized(watchmod.compute.__wrapped__))
+    print("Reformatting keeps the fingerprint:", watchmod.compute(1))
+    astrocache.stop_watching()
+
+    print("""
+###############################################################################
+# directories inotify cannot watch
+###############################################################################
+""")
+    reported = set()
+    watcher = astrocache.watching.FileWatcher(reported.update, interval=0.05)
+    if watcher._inotify:
+        # As when max_user_watches is used up
+        watcher._inotify.add = lambda directory: False
+    path = src / 'unwatchable.py'
+    path.write_text("x = 1\n")
+    watcher.watch({path: astrocache.watching._state(path)})
+    path.write_text("x = 22\n")
+    print("Their files are polled:", wait_for(lambda: path in reported))
+    watcher.stop()
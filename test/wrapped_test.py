@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import functools
+import gc
+import importlib
+import os
+import sys
+import tempfile
+import weakref
+from pathlib import Path
+
+import astrocache
+
+sys.dont_write_bytecode = True
+
+
+def write(path, text):
+    path.write_text(text)
+    # Make sure the change is seen even within the mtime resolution
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def logged(func):
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        return func(*args, **kwargs)
+    return inner
+
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    astrocache.CACHE_DIR = Path(tmpdir) / 'cache'
+    storage = astrocache.SQLiteStorage(Path(tmpdir) / 'cache.sqlite')
+
+    @astrocache.cache(storage=storage)
+    @logged
+    def double(x):
+        return x * 2
+
+    @astrocache.cache(storage=storage)
+    @logged
+    def negate(x):
+        return -x
+
+    print("""
+###############################################################################
+# functions wrapped by the same decorator
+###############################################################################
+""")
+    print("double(5), negate(5):", double(5), negate(5))
+    print("Same fingerprint:", double.fingerprint() == negate.fingerprint())
+
+    print("""
+###############################################################################
+# editing a decorated function
+###############################################################################
+""")
+    src = Path(tmpdir) / 'src'
+    src.mkdir()
+    sys.path.insert(0, str(src))
+    (src / 'wrappedmod.py').write_text(
+        "import astrocache\nfrom wrapped_test_helpers import logged\n\n"
+        "@logged\ndef helper(x):\n    return x + 1\n\n"
+        "@astrocache.cache()\n@logged\ndef compute(x):\n    return helper(x)\n")
+    (src / 'wrapped_test_helpers.py').write_text(
+        "import functools\n\ndef logged(func):\n    @functools.wraps(func)\n"
+        "    def inner(*args, **kwargs):\n        return func(*args, **kwargs)\n"
+        "    return inner\n")
+    import wrappedmod
+    before = wrappedmod.compute.fingerprint()
+    print("compute(1) =", wrappedmod.compute(1))
+    source = (src / 'wrappedmod.py').read_text()
+    write(src / 'wrappedmod.py', source.replace("x + 1", "x + 2"))
+    importlib.reload(wrappedmod)
+    print("Changing the decorated helper changes the fingerprint:",
+          wrappedmod.compute.fingerprint() != before)
+    print("compute(1) =", wrappedmod.compute(1))
+    before = wrappedmod.compute.fingerprint()
+    write(src / 'wrappedmod.py', source.replace("return helper(x)", "return -helper(x)"))
+    importlib.reload(wrappedmod)
+    print("Changing the decorated cached function changes the fingerprint:",
+          wrappedmod.compute.fingerprint() != before)
+    print("compute(1) =", wrappedmod.compute(1))
+
+    print("""
+###############################################################################
+# reloading
+###############################################################################
+""")
+    functions = []
+    for _ in range(20):
+        importlib.reload(wrappedmod)
+        wrappedmod.compute(1)
+        functions.append(weakref.ref(astrocache._unwrap(wrappedmod.compute)))
+    gc.collect()
+    print("Functions replaced by reloading are not kept alive:",
+          sum(func() is not None for func in functions))
+    print("Memoized fingerprints:", len(astrocache._fingerprints))